@@ -0,0 +1,147 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+def isDatabaseLayer(layer):
+    """
+    Returns True if the layer is stored in a database the AsyncWriter can write to
+    """
+    provider = layer.providerType()
+    if provider in ("postgres", "spatialite"):
+        return True
+    if provider == "ogr":
+        source = layer.source().split("|")[0].lower()
+        return source.endswith(".gpkg") or source.endswith(".sqlite")
+    return False
+
+def providerConnection(layer):
+    """
+    Default connection factory: opens the datasource of the layer again. It is called
+    in the writer thread: QGIS only shares the PostgreSQL connections opened in the
+    main thread, and the OGR provider opens its own datasource. SpatiaLite handles are
+    shared per database file whatever the thread, so SpatiaLite layers are opened
+    through OGR instead.
+    @returns {tuple} (connection, QgsVectorDataProvider) the connection must be kept alive
+    """
+    source, providerType = layer.source(), layer.providerType()
+    if providerType == "spatialite":
+        uri = QgsDataSourceURI(source)
+        source, providerType = "%s|layername=%s" % (uri.database(), uri.table()), "ogr"
+    connection = QgsVectorLayer(source, layer.name(), providerType)
+    return connection, connection.dataProvider()
+
+class AsyncWriter(QObject):
+    """
+    Write-behind for database layers: the finished features are written to
+    the datasource by a background thread, in batches, through its own
+    provider connection. The features do not go through the edit buffer
+    of the layer.
+    A single thread and connection are used: the provider connections of
+    QGIS are not meant to be used by several threads at once.
+    Emits "written" with the list of written features (with their new ids)
+    and "writeFailed" with the list of features that could not be written
+    and an error message. Both are delivered in the GUI thread.
+    """
+    def __init__(self, layer, batchSize=20, connectionFactory=None):
+        """
+        @param {QgsVectorLayer} layer The layer whose datasource receives the features
+        @param {int} batchSize Maximal number of features written at once
+        @param {function} connectionFactory Returns (connection, provider) for the layer, it is called
+                          in the writer thread; the provider must have an addFeatures(features) method
+                          returning (ok, features). Defaults to providerConnection.
+        """
+        QObject.__init__(self)
+        self.layer = layer
+        self.batchSize = batchSize
+        self.queue = Queue.Queue()
+        if connectionFactory is None:
+            connectionFactory = providerConnection
+        self.connectionFactory = connectionFactory
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, feature):
+        """
+        Queues a feature to be written
+        @param {QgsFeature} feature
+        """
+        self.queue.put(feature)
+
+    def pendingCount(self):
+        return self.queue.qsize()
+
+    def close(self):
+        """
+        Writes the queued features, then stops the thread
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        # The connection belongs to this thread, it is only used and released here
+        connection, error = None, None
+        try:
+            connection = self.connectionFactory(self.layer)
+        except Exception as e:
+            error = str(e)
+
+        while True:
+            feature = self.queue.get()
+            if feature is None:
+                return
+            batch = [feature]
+            stopping = False
+            while len(batch) < self.batchSize:
+                try:
+                    feature = self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if feature is None:
+                    stopping = True
+                    break
+                batch.append(feature)
+
+            if connection is None:
+                self.emit(SIGNAL("writeFailed"), batch, error)
+            else:
+                try:
+                    ok, written = connection[1].addFeatures(batch)
+                    if ok:
+                        self.emit(SIGNAL("written"), list(written))
+                    else:
+                        self.emit(SIGNAL("writeFailed"), batch, "; ".join(connection[1].errors()))
+                except Exception as e:
+                    self.emit(SIGNAL("writeFailed"), batch, str(e))
+
+            if stopping:
+                return
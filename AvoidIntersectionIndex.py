@@ -0,0 +1,207 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from functools import partial
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+def unionOf(geometries):
+    """
+    Returns the union of geometries, combining them pairwise so that the
+    intermediate geometries stay small
+    @returns {QgsGeometry} None if the list is empty
+    """
+    while len(geometries) > 1:
+        merged = []
+        for i in range(0, len(geometries) - 1, 2):
+            merged.append(geometries[i].combine(geometries[i + 1]))
+        if len(geometries) % 2:
+            merged.append(geometries[-1])
+        geometries = merged
+    return geometries[0] if geometries else None
+
+class AvoidIntersectionIndex(object):
+    """
+    R-tree (QgsSpatialIndex) of the polygon layers of the project's avoid
+    intersections list. The new polygons are only clipped against the
+    neighbours whose bounding boxes overlap them, instead of against every
+    feature of the layers. The indexes are built on first use and patched
+    from the edit signals of the layers.
+    """
+    def __init__(self):
+        # layer id -> QgsSpatialIndex
+        self.indexes = {}
+        # layer id -> {feature id: QgsRectangle} of the indexed features (needed to remove them)
+        self.boxes = {}
+        # layer id -> (layer, [(signal, slot), ...]) of the edit signals patching the index
+        self.layerConnections = {}
+        QObject.connect(QgsMapLayerRegistry.instance(), SIGNAL("layerWillBeRemoved(QString)"), self.invalidateLayer)
+
+    def avoidLayers(self):
+        """
+        Returns the polygon layers of the project's avoid intersections list
+        """
+        layers = []
+        for layerId in QgsProject.instance().readListEntry("Digitizing", "/AvoidIntersectionsList")[0]:
+            layer = QgsMapLayerRegistry.instance().mapLayer(layerId)
+            if layer is not None and layer.type() == QgsMapLayer.VectorLayer and layer.geometryType() == QGis.Polygon:
+                layers.append(layer)
+        return layers
+
+    def prepare(self):
+        """
+        Builds the missing indexes (called when the tool is activated, so that the first clip is fast)
+        """
+        for layer in self.avoidLayers():
+            self.indexFor(layer)
+
+    def invalidateLayer(self, layerId):
+        """
+        Drops the index of a layer and stops listening to its edits
+        """
+        self.indexes.pop(layerId, None)
+        self.boxes.pop(layerId, None)
+        layer, connections = self.layerConnections.pop(layerId, (None, []))
+        for signal, slot in connections:
+            QObject.disconnect(layer, SIGNAL(signal), slot)
+
+    def watchLayer(self, layer):
+        layerId = layer.id()
+        if layerId in self.layerConnections:
+            return
+        connections = [
+            ("featureAdded(QgsFeatureId)", partial(self.featureAdded, layer)),
+            ("featureDeleted(QgsFeatureId)", partial(self.featureDeleted, layerId)),
+            ("geometryChanged(QgsFeatureId,QgsGeometry&)", partial(self.geometryChanged, layerId)),
+            ("committedFeaturesAdded(QString,QgsFeatureList)", self.committedFeaturesAdded),
+            ("editingStopped()", partial(self.editingStopped, layerId)),
+        ]
+        for signal, slot in connections:
+            QObject.connect(layer, SIGNAL(signal), slot)
+        self.layerConnections[layerId] = (layer, connections)
+
+    def indexFor(self, layer):
+        """
+        Returns the index of a layer, building it if needed
+        @returns {QgsSpatialIndex}
+        """
+        index = self.indexes.get(layer.id())
+        if index is not None:
+            return index
+        self.watchLayer(layer)
+        index = QgsSpatialIndex()
+        boxes = {}
+        for feature in layer.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([])):
+            self.insert(index, boxes, feature.id(), feature.geometry())
+        self.indexes[layer.id()] = index
+        self.boxes[layer.id()] = boxes
+        return index
+
+    def insert(self, index, boxes, fid, geometry):
+        if geometry is None:
+            return
+        entry = QgsFeature(fid)
+        entry.setGeometry(geometry)
+        index.insertFeature(entry)
+        boxes[fid] = geometry.boundingBox()
+
+    def remove(self, index, boxes, fid):
+        box = boxes.pop(fid, None)
+        if box is None:
+            return
+        # The index only needs the id and the bounding box of the entry
+        entry = QgsFeature(fid)
+        entry.setGeometry(QgsGeometry.fromRect(box))
+        index.deleteFeature(entry)
+
+    def featureAdded(self, layer, fid):
+        index = self.indexes.get(layer.id())
+        if index is None:
+            return
+        for feature in layer.getFeatures(QgsFeatureRequest(fid).setSubsetOfAttributes([])):
+            self.insert(index, self.boxes[layer.id()], fid, feature.geometry())
+
+    def featureDeleted(self, layerId, fid):
+        index = self.indexes.get(layerId)
+        if index is None:
+            return
+        self.remove(index, self.boxes[layerId], fid)
+
+    def geometryChanged(self, layerId, fid, geometry):
+        index = self.indexes.get(layerId)
+        if index is None:
+            return
+        self.remove(index, self.boxes[layerId], fid)
+        self.insert(index, self.boxes[layerId], fid, geometry)
+
+    def committedFeaturesAdded(self, layerId, features):
+        """
+        The added features got their final ids while saving the layer
+        """
+        index = self.indexes.get(layerId)
+        if index is None:
+            return
+        for feature in features:
+            self.insert(index, self.boxes[layerId], feature.id(), feature.geometry())
+
+    def editingStopped(self, layerId):
+        """
+        Removes the temporary ids of the added features. After a commit the features are
+        already back with their final ids, a rollback undoes the edits one by one (so the
+        index was patched by the other signals).
+        """
+        index = self.indexes.get(layerId)
+        if index is None:
+            return
+        boxes = self.boxes[layerId]
+        for fid in [fid for fid in boxes if fid < 0]:
+            self.remove(index, boxes, fid)
+
+    def neighbours(self, geometry):
+        """
+        Returns the geometries of the avoid intersections layers intersecting a geometry
+        @returns {list} of QgsGeometry
+        """
+        box = geometry.boundingBox()
+        result = []
+        for layer in self.avoidLayers():
+            ids = self.indexFor(layer).intersects(box)
+            if not ids:
+                continue
+            # All the candidates in one request
+            for feature in layer.getFeatures(QgsFeatureRequest().setFilterFids(ids).setSubsetOfAttributes([])):
+                candidate = feature.geometry()
+                if candidate is not None and candidate.intersects(geometry):
+                    result.append(QgsGeometry(candidate))
+        return result
+
+    def clip(self, geometry):
+        """
+        Removes the parts of a polygon overlapping the features of the avoid intersections layers
+        @param {QgsGeometry} geometry New polygon in layer coordinates
+        @returns {QgsGeometry} The clipped geometry (the same one if nothing overlaps), None if the difference failed
+        """
+        union = unionOf(self.neighbours(geometry))
+        if union is None:
+            return geometry
+        return geometry.difference(union)
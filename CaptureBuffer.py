@@ -0,0 +1,112 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from array import array
+
+class CaptureBuffer(object):
+    """
+    Vertices of the feature being captured, in map coordinates, kept in a
+    flat array of doubles which is reused from one feature to the next (like
+    the markers of VertexMarkersItem). The last vertices are read and removed
+    in constant time, and the coordinates are handed to the WKB writer
+    without creating a QgsPoint per vertex.
+    """
+    # Size of the array kept after clear() (in doubles)
+    keptCapacity = 2 * 4096
+
+    def __init__(self):
+        # x0, y0, x1, y1, ... only the first 2*count values are used
+        self.coordinates = array('d')
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x, y):
+        """
+        Adds a vertex
+        """
+        index = 2 * self.count
+        if index < len(self.coordinates):
+            self.coordinates[index] = x
+            self.coordinates[index + 1] = y
+        else:
+            self.coordinates.append(x)
+            self.coordinates.append(y)
+        self.count += 1
+
+    def point(self, index):
+        """
+        Returns a vertex, the negative indexes counting from the last one
+        @returns {tuple} (x, y)
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("vertex index out of range")
+        return self.coordinates[2 * index], self.coordinates[2 * index + 1]
+
+    def removeLast(self):
+        """
+        Removes the last vertex
+        @returns {tuple} (x, y) of the removed vertex, None if there was none
+        """
+        if self.count == 0:
+            return None
+        self.count -= 1
+        return self.coordinates[2 * self.count], self.coordinates[2 * self.count + 1]
+
+    def clear(self):
+        """
+        Removes all vertices. The array is kept for the next feature, unless it grew very large.
+        """
+        self.count = 0
+        if len(self.coordinates) > self.keptCapacity:
+            del self.coordinates[self.keptCapacity:]
+
+    def points(self):
+        """
+        @returns {list} of (x, y)
+        """
+        coordinates = self.coordinates
+        return [(coordinates[i], coordinates[i + 1]) for i in range(0, 2 * self.count, 2)]
+
+    def setPoints(self, points):
+        """
+        Replaces the vertices
+        @param {list} points (x, y) of the new vertices
+        """
+        self.clear()
+        for x, y in points:
+            self.append(x, y)
+
+    def ringCoordinates(self, closed):
+        """
+        Returns the coordinates of the vertices as a new flat array
+        @param {bool} closed True to repeat the first vertex at the end, if the last one is not on it
+        @returns {array} of doubles
+        """
+        coordinates = self.coordinates[:2 * self.count]
+        if closed and self.count > 0 and (coordinates[0], coordinates[1]) != (coordinates[-2], coordinates[-1]):
+            coordinates.append(coordinates[0])
+            coordinates.append(coordinates[1])
+        return coordinates
@@ -0,0 +1,152 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import time
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+class CaptureSession(QObject):
+    """
+    Queues the finished features of a layer and adds them in batches: each
+    flush adds the features with a single addFeatures call and then inserts
+    the topological points of their geometries, inside one edit command (so
+    that one undo entry covers the whole batch). Since the batch is already
+    in the layer, the features of a batch also get each other's vertices.
+    After each flush, the "flushed" signal is emitted with the list of the
+    added feature ids and the duration of the flush in seconds. If the layer
+    refuses the features, they stay queued and the "flushFailed" signal is
+    emitted with the number of queued features.
+    The queue is discarded when the layer stops editing without saving, or
+    when it is removed from the project (the session can't be used anymore
+    then); "discarded" is emitted with the number of dropped features.
+    """
+    def __init__(self, layer, flushEvery=20, addTopologicalPoints=None):
+        """
+        @param {QgsVectorLayer} layer The layer receiving the features
+        @param {int} flushEvery Number of queued features triggering a flush (0 to only flush on demand)
+        @param {function} addTopologicalPoints Inserts the topological points of a geometry
+                          (defaults to QgsVectorLayer.addTopologicalPoints)
+        """
+        QObject.__init__(self)
+        # None once the layer was removed from the project
+        self.layer = layer
+        self.layerId = layer.id()
+        self.flushEvery = flushEvery
+        self.addTopologicalPoints = addTopologicalPoints if addTopologicalPoints is not None else layer.addTopologicalPoints
+        # Features waiting to be added
+        self.pending = []
+        # Number of features added by the flushes so far
+        self.committedCount = 0
+        # Duration of each flush in seconds
+        self.flushDurations = []
+        # Ids collected from featureAdded during a flush
+        self.addedIds = None
+        QObject.connect(self.layer, SIGNAL("featureAdded(QgsFeatureId)"), self.featureAdded)
+        # Make sure nothing is left behind when the edits are saved
+        QObject.connect(self.layer, SIGNAL("beforeCommitChanges()"), self.flush)
+        QObject.connect(self.layer, SIGNAL("editingStopped()"), self.editingStopped)
+        QObject.connect(QgsMapLayerRegistry.instance(), SIGNAL("layerWillBeRemoved(QString)"), self.layerWillBeRemoved)
+
+    def close(self):
+        """
+        Flushes the remaining features and disconnects from the layer
+        """
+        self.flush()
+        self.disconnectLayer()
+        QObject.disconnect(QgsMapLayerRegistry.instance(), SIGNAL("layerWillBeRemoved(QString)"), self.layerWillBeRemoved)
+
+    def disconnectLayer(self):
+        if self.layer is None:
+            return
+        QObject.disconnect(self.layer, SIGNAL("featureAdded(QgsFeatureId)"), self.featureAdded)
+        QObject.disconnect(self.layer, SIGNAL("beforeCommitChanges()"), self.flush)
+        QObject.disconnect(self.layer, SIGNAL("editingStopped()"), self.editingStopped)
+        self.layer = None
+
+    def discard(self):
+        """
+        Drops the queued features
+        """
+        count = len(self.pending)
+        self.pending = []
+        self.emit(SIGNAL("discarded"), count)
+
+    def editingStopped(self):
+        # After a commit the queue was flushed, after a rollback it can't be added anymore
+        if self.pending:
+            self.discard()
+
+    def layerWillBeRemoved(self, layerId):
+        if layerId == self.layerId:
+            self.disconnectLayer()
+            self.discard()
+
+    def add(self, feature):
+        """
+        Queues a finished feature, and flushes the queue if it is full
+        @param {QgsFeature} feature
+        """
+        self.pending.append(feature)
+        if self.flushEvery > 0 and len(self.pending) >= self.flushEvery:
+            self.flush()
+
+    def featureAdded(self, fid):
+        if self.addedIds is not None:
+            self.addedIds.append(fid)
+
+    def flush(self):
+        """
+        Adds the queued features to the layer
+        @returns {list} Ids of the added features
+        """
+        if not self.pending or self.layer is None:
+            return []
+        features = self.pending
+        start = time.time()
+
+        self.addedIds = []
+        self.layer.beginEditCommand(QCoreApplication.translate("ImprovedPolygonCapturing", "Add captured features"))
+        try:
+            if not self.layer.addFeatures(features, False):
+                self.layer.destroyEditCommand()
+                self.addedIds = None
+                # Keep the features queued, they are tried again on the next flush
+                self.emit(SIGNAL("flushFailed"), len(self.pending))
+                return []
+            # Add the geometries to the layers topological points to ensure topological editing
+            for feature in features:
+                self.addTopologicalPoints(feature.geometry())
+            self.layer.endEditCommand()
+        except:
+            self.layer.destroyEditCommand()
+            self.addedIds = None
+            raise
+        self.pending = []
+        addedIds = self.addedIds
+        self.addedIds = None
+
+        duration = time.time() - start
+        self.committedCount += len(addedIds)
+        self.flushDurations.append(duration)
+        self.emit(SIGNAL("flushed"), addedIds, duration)
+        return addedIds
@@ -0,0 +1,73 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+class ConstraintState(object):
+    """
+    Distance and angle constraints of the next segment. The map tool reads
+    and writes this plain object instead of the dock widgets, which are
+    synchronized with it at a lower rate by ImprovedPolygonCapturing.
+    """
+    def __init__(self, distance=10.0, angle=0.0, distanceLock=False, angleLock=False, relative=True):
+        self.distance = distance
+        self.angle = angle
+        self.distanceLock = distanceLock
+        self.angleLock = angleLock
+        # True if the angle is relative to the last segment
+        self.relative = relative
+        # True if the tool changed the values since the widgets were last updated
+        self.dirty = False
+
+    def setDistance(self, distance):
+        """
+        Sets the distance from the user input (the widgets already show it)
+        """
+        self.distance = distance
+
+    def setAngle(self, angle):
+        """
+        Sets the angle in degrees from the user input (the widgets already show it)
+        """
+        self.angle = angle
+
+    def setDistanceLock(self, locked):
+        self.distanceLock = locked
+
+    def setAngleLock(self, locked):
+        self.angleLock = locked
+
+    def setRelative(self, relative):
+        self.relative = relative
+
+    def setComputedDistance(self, distance):
+        """
+        Sets the distance computed from the mouse position
+        """
+        self.distance = distance
+        self.dirty = True
+
+    def setComputedAngle(self, angle):
+        """
+        Sets the angle in degrees computed from the mouse position
+        """
+        self.angle = angle
+        self.dirty = True
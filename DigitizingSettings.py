@@ -0,0 +1,66 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+
+class DigitizingSettings(object):
+    """
+    Cache of the QGIS digitizing options used by the map tool (rubberband
+    appearance and default snapping). The values are read by read(), when
+    the tool is activated, so that the mouse events do no settings I/O.
+    """
+    def __init__(self):
+        self.lineColor = QColor(255, 0, 0, 150)
+        self.lineWidth = 1
+        self.defaultSnapMode = "off"
+        self.defaultSnapTolerance = 0.0
+        self.defaultSnapToleranceUnit = 0
+        self.read()
+
+    def values(self):
+        return (self.lineColor.rgba(), self.lineWidth, self.defaultSnapMode, self.defaultSnapTolerance, self.defaultSnapToleranceUnit)
+
+    def read(self):
+        """
+        Reads the options again
+        @returns {bool} True if a value changed
+        """
+        previous = self.values()
+        settings = QSettings()
+        red = settings.value("/qgis/digitizing/line_color_red", 255, type=int)
+        green = settings.value("/qgis/digitizing/line_color_green", 0, type=int)
+        blue = settings.value("/qgis/digitizing/line_color_blue", 0, type=int)
+        alpha = settings.value("/qgis/digitizing/line_color_alpha", 150, type=int)
+        self.lineColor = QColor(red, green, blue, alpha)
+        self.lineWidth = settings.value("/qgis/digitizing/line_width", 1, type=int)
+        self.defaultSnapMode = settings.value("/Qgis/digitizing/default_snap_mode", "off")
+        self.defaultSnapTolerance = settings.value("/Qgis/digitizing/default_snapping_tolerance", 0, type=float)
+        self.defaultSnapToleranceUnit = settings.value("/Qgis/digitizing/default_snapping_tolerance_unit", 0, type=int)
+        return self.values() != previous
+
+    def applyTo(self, rubberBand):
+        """
+        Sets the digitizing color and line width to a rubberband
+        """
+        rubberBand.setColor(self.lineColor)
+        rubberBand.setWidth(self.lineWidth)
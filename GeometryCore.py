@@ -0,0 +1,109 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Point construction rules of the capture tool, without any Qt or QGIS
+dependency. Points are (x, y) tuples, angles are given in degrees like in
+the dock widget. The distance calculation is done with plain trigonometry!
+"""
+import math
+
+def segmentAngle(lastPt, secondLastPt):
+    """
+    Returns the angle of the last entered segment in radians (0 if there is none)
+    @param {tuple} lastPt Last vertex
+    @param {tuple} secondLastPt Vertex before the last one, or None
+    """
+    if secondLastPt is None:
+        return 0.0
+    return math.atan2(lastPt[1] - secondLastPt[1], lastPt[0] - secondLastPt[0])
+
+def projectedDistance(lastPt, mousePt, angle):
+    """
+    Returns the length of the projection of lastPt->mousePt on the direction given by angle (radians)
+    """
+    return (mousePt[0] - lastPt[0]) * math.cos(angle) + (mousePt[1] - lastPt[1]) * math.sin(angle)
+
+def constructPoint(pt, lastPt, secondLastPt, relative, inputDistance, inputAngle, distanceLock, angleLock):
+    """
+    Constructs the next vertex from the (snapped) mouse position and the constraints.
+    Snapping has priority over actual mouse position but NOT over locked numerical values.
+    @param {tuple} pt Mouse position
+    @param {tuple} lastPt Last vertex
+    @param {tuple} secondLastPt Vertex before the last one, or None
+    @param {bool} relative True if the angle is relative to the last segment
+    @param {float} inputDistance Distance used if distanceLock
+    @param {float} inputAngle Angle in degrees used if angleLock
+    @returns {tuple} (x, y, distance, angle) where distance and angle are the values
+                     computed from the mouse position (None for the locked ones)
+    """
+    lastAngle = segmentAngle(lastPt, secondLastPt) if relative else 0.0
+    return _construct(pt[0], pt[1], lastPt[0], lastPt[1], lastAngle, relative, inputDistance, inputAngle / 180.0 * math.pi, distanceLock, angleLock)
+
+def constructPoints(xs, ys, lastPt, secondLastPt, relative, inputDistance, inputAngle, distanceLock, angleLock):
+    """
+    Batch version of constructPoint for many mouse positions with the same previous vertices
+    (e.g. replayed mouse moves)
+    @param {sequence} xs X coordinates of the mouse positions
+    @param {sequence} ys Y coordinates of the mouse positions
+    @returns {tuple} (xs, ys, distances, angles) lists
+    """
+    lastAngle = segmentAngle(lastPt, secondLastPt) if relative else 0.0
+    inputRadians = inputAngle / 180.0 * math.pi
+    lastX, lastY = lastPt
+    resultX = []
+    resultY = []
+    distances = []
+    angles = []
+    for x, y in zip(xs, ys):
+        newX, newY, distance, angle = _construct(x, y, lastX, lastY, lastAngle, relative, inputDistance, inputRadians, distanceLock, angleLock)
+        resultX.append(newX)
+        resultY.append(newY)
+        distances.append(distance)
+        angles.append(angle)
+    return resultX, resultY, distances, angles
+
+def _construct(x, y, lastX, lastY, lastAngle, relative, inputDistance, inputRadians, distanceLock, angleLock):
+    computedAngle = None
+    computedDistance = None
+
+    if angleLock:
+        # We compute the new angle based on the input angle (RELATIVE or ABSOLUTE)
+        newAngle = lastAngle + inputRadians if relative else inputRadians
+    else:
+        # We simply set the new angle to the current angle
+        newAngle = math.atan2(y - lastY, x - lastX)
+        computedAngle = (newAngle - lastAngle if relative else newAngle) / math.pi * 180.0
+
+    if distanceLock:
+        newDist = inputDistance
+    else:
+        if angleLock:
+            # The distance is the projection of the mouse position on the locked angle
+            newDist = (x - lastX) * math.cos(newAngle) + (y - lastY) * math.sin(newAngle)
+        else:
+            newDist = math.sqrt((x - lastX) * (x - lastX) + (y - lastY) * (y - lastY))
+        computedDistance = newDist
+
+    if distanceLock or angleLock:
+        # We only need to do some calulation if either the distance or the angle is locked
+        return lastX + math.cos(newAngle) * newDist, lastY + math.sin(newAngle) * newDist, computedDistance, computedAngle
+    return x, y, computedDistance, computedAngle
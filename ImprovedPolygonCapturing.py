@@ -21,19 +21,52 @@ git repo             : https://github.com/olivierdalang/improvedpolygoncapturing
  ***************************************************************************/
 """
 
-# Import the PyQt and QGIS libraries
-from PyQt4.QtCore import *
-from PyQt4.QtGui import *
-from QgsMapToolCapturePolygon import QgsMapToolCapturePolygon
-from qgis.core import *
-from qgis.gui import *
-from AboutDialog import AboutDialog
-import resources
+# Import the PyQt and QGIS libraries. The modules of the map tool, the dock widget
+# and the translator are only loaded when the tool is used for the first time.
+import os
+import time
+
+from PyQt4.QtCore import QCoreApplication, QFileInfo, QObject, QSettings, QTimer, QTranslator, Qt, SIGNAL, qVersion
+from PyQt4.QtGui import QAction, QCheckBox, QDockWidget, QDoubleSpinBox, QFileDialog, QGridLayout, QIcon, QKeySequence, QLabel, QMessageBox, QPushButton, QShortcut, QWidget
+from qgis.core import QGis, QgsFeature, QgsMapLayer, QgsMessageLog
 
 class ImprovedPolygonCapturing: 
     def __init__(self, iface):
 
-        # Initialise the translation environment
+        # Save reference to the QGIS interface
+        self.iface = iface
+        # Reference to the QGIS map canvas
+        self.canvas = iface.mapCanvas()
+        self.pluginPath = os.path.dirname(os.path.abspath(__file__))
+        self.tool = None
+        self.isPolygon = True
+        # The dock widget and the objects below are created by load() on first use
+        self.dockWidget = None
+        self.translator = None
+        # Records the duration of the capture stages while profiling is enabled in the dock widget
+        self.profiler = None
+        # Features captured in rapid-capture mode, waiting for their attributes
+        self.capturedFeatures = None
+        # Time spent in classFactory and initGui, in seconds
+        self.loadTime = 0.0
+
+    def icon(self, name):
+        """
+        Returns an icon of the ressources directory (read from the file, so that the
+        compiled resources module is not needed at startup)
+        """
+        return QIcon(os.path.join(self.pluginPath, "ressources", name))
+
+    def checkedStyleSheet(self, name):
+        """
+        Returns the style sheet showing an icon of the ressources directory on checked check boxes
+        """
+        return "QCheckBox::indicator:checked{ image: url(%s); }" % os.path.join(self.pluginPath, "ressources", name).replace("\\", "/")
+
+    def installTranslator(self):
+        """
+        Initialise the translation environment
+        """
         pluginPath = QFileInfo(__file__).absolutePath()
         # Extract the locale
         localeName = QSettings().value("locale/userLocale")
@@ -53,35 +86,61 @@ class ImprovedPolygonCapturing:
                 if qVersion() > '4.3.3':
                     QCoreApplication.installTranslator(self.translator)
 
-        # Save reference to the QGIS interface
-        self.iface = iface
-        # Reference to the QGIS map canvas
-        self.canvas = iface.mapCanvas()
-        self.tool = None
-        self.isPolygon = True
-
     def initGui(self):
         """
         Creates the necessary actions
         """
+        self.startTime = time.time()
         # Create an action to start capturing polygons and add it to the digitize toolbar
-        self.capturePolygonAction = QAction(QIcon(":/plugins/improvedpolygoncapturing/ressources/icon.png"), QCoreApplication.translate("ImprovedPolygonCapturing", "CAD-like improved line/polygon capture"), self.iface.mainWindow())
+        self.capturePolygonAction = QAction(self.icon("icon.png"), QCoreApplication.translate("ImprovedPolygonCapturing", "CAD-like improved line/polygon capture"), self.iface.mainWindow())
         self.capturePolygonAction.setCheckable(True)
         self.capturePolygonAction.setEnabled(False)
         self.iface.digitizeToolBar().addAction(self.capturePolygonAction)
 
         # Create the online help action
-        self.helpAction = QAction( QIcon(":/plugins/improvedpolygoncapturing/ressources/about.png"), u"Help", self.iface.mainWindow())
+        self.helpAction = QAction( self.icon("about.png"), u"Help", self.iface.mainWindow())
         QObject.connect(self.helpAction, SIGNAL("triggered()"), self.showHelp)
         self.iface.addPluginToMenu(u"&Improved Polygon Capturing", self.helpAction)
 
+        # Connect to signals for button behaviour
+        QObject.connect(self.capturePolygonAction, SIGNAL("triggered()"), self.start)
+        QObject.connect(self.iface, SIGNAL("currentLayerChanged(QgsMapLayer*)"), self.toggle)
+
+        self.loadTime += time.time() - self.startTime
+        QgsMessageLog.logMessage("Plugin loaded in %.1f ms" % (self.loadTime * 1000.0), "Improved Polygon Capturing")
+
+    def load(self):
+        """
+        Loads the translator, the dock widget and the modules of the map tool.
+        Called on first use, so that starting QGIS only creates the actions.
+        """
+        if self.dockWidget is not None:
+            return
+        start = time.time()
+        self.installTranslator()
+        self.capturePolygonAction.setText(QCoreApplication.translate("ImprovedPolygonCapturing", "CAD-like improved line/polygon capture"))
+        from Profiler import Profiler
+        from RapidCapture import CapturedFeatures
+        self.profiler = Profiler()
+        self.capturedFeatures = CapturedFeatures()
+        self.createDockWidget()
+        # Import the map tool now too, rather than in the middle of the first activation
+        import QgsMapToolCapturePolygon
+        QgsMessageLog.logMessage("Tool loaded on first use in %.1f ms" % ((time.time() - start) * 1000.0), "Improved Polygon Capturing")
+
+    def createDockWidget(self):
+        """
+        Creates the dock widget with the input fields and its shortcuts
+        """
+        from ConstraintState import ConstraintState
+
         # Create a dock widget for the input fields (note that the dockwidget is only added to the mainWindow when the tool is activated)
         self.dockWidget = QDockWidget("Improved Polygon Capturing")
 
         self.dockWidget.setFeatures(QDockWidget.DockWidgetMovable|QDockWidget.DockWidgetFloatable)
         self.dockLayout = QGridLayout()
         self.dockLayout.setColumnStretch( 1, 10 )
-        self.dockLayout.setRowStretch( 3, 10 )
+        self.dockLayout.setRowStretch( 5, 10 )
         dockWidgetMainWidget = QWidget()
         self.dockWidget.setWidget( dockWidgetMainWidget )
         dockWidgetMainWidget.setLayout(self.dockLayout)
@@ -96,7 +155,7 @@ class ImprovedPolygonCapturing:
         self.spinBoxDist.setMaximum(9999999.999)
         self.lockBoxDist = QCheckBox()
         #self.lockBoxDist.setIcon( QIcon(":/plugins/improvedpolygoncapturing/ressources/lock.png") )
-        self.lockBoxDist.setStyleSheet( "QCheckBox::indicator:checked{ image: url(:/plugins/improvedpolygoncapturing/ressources/lock.png); }" )
+        self.lockBoxDist.setStyleSheet( self.checkedStyleSheet("lock.png") )
 
         
 
@@ -107,9 +166,9 @@ class ImprovedPolygonCapturing:
         self.spinBoxAngle.setMaximum(360.0)
         self.spinBoxAngle.setSuffix(unichr(176))
         self.lockBoxAngle = QCheckBox()
-        self.lockBoxAngle.setStyleSheet( "QCheckBox::indicator:checked{ image: url(:/plugins/improvedpolygoncapturing/ressources/lock.png); }" )
+        self.lockBoxAngle.setStyleSheet( self.checkedStyleSheet("lock.png") )
         self.relBox = QCheckBox()
-        self.relBox.setStyleSheet( "QCheckBox::indicator:checked{ image: url(:/plugins/improvedpolygoncapturing/ressources/delta.png); }" )
+        self.relBox.setStyleSheet( self.checkedStyleSheet("delta.png") )
         self.relBox.setChecked(True)
 
         # Layout the input elements
@@ -121,6 +180,47 @@ class ImprovedPolygonCapturing:
         self.dockLayout.addWidget(self.lockBoxAngle,1,2)
         self.dockLayout.addWidget(self.relBox,1,3)
 
+        # Area, length and closing distance of the feature being captured (including the preview vertex)
+        self.figuresLabel = QLabel()
+        self.dockLayout.addWidget(self.figuresLabel,2,0,1,4)
+
+        # Capture session elements (only enabled in capture session mode)
+        self.flushButton = QPushButton('Flush')
+        self.flushButton.setToolTip('Add the queued features to the layer')
+        self.sessionLabel = QLabel()
+        self.dockLayout.addWidget(self.flushButton,3,0)
+        self.dockLayout.addWidget(self.sessionLabel,3,1,1,3)
+        QObject.connect(self.flushButton, SIGNAL("clicked()"), self.flushSession)
+
+        # Rapid-capture elements
+        self.rapidBox = QCheckBox('Rapid')
+        self.rapidBox.setToolTip('Rapid capture: skip the attribute form and use the attribute template')
+        self.rapidBox.setChecked(QSettings().value("/improvedpolygoncapturing/rapidCapture", False, type=bool))
+        self.fillButton = QPushButton('Attributes...')
+        self.fillButton.setToolTip('Fill the attributes of all features captured in rapid-capture mode')
+        self.capturedLabel = QLabel()
+        self.dockLayout.addWidget(self.rapidBox,4,0)
+        self.dockLayout.addWidget(self.capturedLabel,4,1)
+        self.dockLayout.addWidget(self.fillButton,4,2,1,2)
+        QObject.connect(self.rapidBox, SIGNAL("toggled(bool)"), self.toggleRapidCapture)
+        QObject.connect(self.fillButton, SIGNAL("clicked()"), self.fillAttributes)
+        QObject.connect(self.capturedFeatures, SIGNAL("changed"), self.showCaptured)
+
+        # Profiling elements (below the stretched row)
+        self.profileBox = QCheckBox('Profiling')
+        self.exportButton = QPushButton('Export...')
+        self.exportButton.setEnabled(False)
+        self.profileLabel = QLabel()
+        self.dockLayout.addWidget(self.profileBox,6,0,1,2)
+        self.dockLayout.addWidget(self.exportButton,6,2,1,2)
+        self.dockLayout.addWidget(self.profileLabel,7,0,1,4)
+        QObject.connect(self.profileBox, SIGNAL("toggled(bool)"), self.toggleProfiling)
+        QObject.connect(self.exportButton, SIGNAL("clicked()"), self.exportProfile)
+        # The statistics are refreshed every second while profiling
+        self.profileTimer = QTimer()
+        self.profileTimer.setInterval(1000)
+        QObject.connect(self.profileTimer, SIGNAL("timeout()"), self.showProfile)
+
         # Create tooltips
         self.spinBoxDist.setToolTip('Distance (alt+1)')
         self.spinBoxAngle.setToolTip('Angle (alt+2)')
@@ -128,6 +228,19 @@ class ImprovedPolygonCapturing:
         self.lockBoxAngle.setToolTip('Lock angle (shift+alt+2)')
         self.relBox.setToolTip('Absolute angle (shift+alt+3')
 
+        # The tool reads and writes the constraints, the widgets are synchronized with them
+        self.constraints = ConstraintState(self.spinBoxDist.value(), self.spinBoxAngle.value(), self.lockBoxDist.isChecked(), self.lockBoxAngle.isChecked(), self.relBox.isChecked())
+        QObject.connect(self.spinBoxDist, SIGNAL("valueChanged(double)"), self.constraints.setDistance)
+        QObject.connect(self.spinBoxAngle, SIGNAL("valueChanged(double)"), self.constraints.setAngle)
+        QObject.connect(self.lockBoxDist, SIGNAL("toggled(bool)"), self.constraints.setDistanceLock)
+        QObject.connect(self.lockBoxAngle, SIGNAL("toggled(bool)"), self.constraints.setAngleLock)
+        QObject.connect(self.relBox, SIGNAL("toggled(bool)"), self.constraints.setRelative)
+        # The values computed by the tool are shown at most 10 times per second
+        self.syncTimer = QTimer()
+        self.syncTimer.setInterval(100)
+        QObject.connect(self.syncTimer, SIGNAL("timeout()"), self.syncWidgets)
+        QObject.connect(self.syncTimer, SIGNAL("timeout()"), self.showFigures)
+
         # Create shortcuts
         QObject.connect( QShortcut(QKeySequence("alt+1"), self.iface.mapCanvas()), SIGNAL("activated()"), self.focusDist)
         QObject.connect( QShortcut(QKeySequence("alt+2"), self.iface.mapCanvas()), SIGNAL("activated()"), self.focusAngle)
@@ -135,12 +248,144 @@ class ImprovedPolygonCapturing:
         QObject.connect( QShortcut(QKeySequence("shift+alt+2"), self.iface.mapCanvas()), SIGNAL("activated()"), self.toggleLockAngle)
         QObject.connect( QShortcut(QKeySequence("shift+alt+3"), self.iface.mapCanvas()), SIGNAL("activated()"), self.toggleAbsAngle)
 
-        # Connect to signals for button behaviour
-        QObject.connect(self.capturePolygonAction, SIGNAL("triggered()"), self.start)
-        QObject.connect(self.iface, SIGNAL("currentLayerChanged(QgsMapLayer*)"), self.toggle)
-    
-        # This is the coordinates capture tool
-        self.tool = QgsMapToolCapturePolygon(self.iface, self.relBox, self.spinBoxDist, self.spinBoxAngle, self.lockBoxDist, self.lockBoxAngle, self.isPolygon)
+    def toggleProfiling(self, enabled):
+        """
+        Enables or disables the recording of the stage durations
+        """
+        self.profiler.enabled = enabled
+        self.exportButton.setEnabled(enabled)
+        if enabled:
+            self.profiler.clear()
+            self.profileTimer.start()
+        else:
+            self.profileTimer.stop()
+            self.profileLabel.clear()
+
+    def showProfile(self):
+        """
+        Shows the rolling percentiles of the stage durations in the dock widget
+        """
+        lines = ["%-12s %6s %8s %8s %8s" % ("stage (ms)", "n", "p50", "p95", "p99")]
+        for name, count, p50, p95, p99 in self.profiler.statistics():
+            lines.append("%-12s %6d %8.2f %8.2f %8.2f" % (name, count, p50, p95, p99))
+        if self.tool is not None:
+            lines.append("merged moves %d" % self.tool.coalescedMoves)
+        self.profileLabel.setText("<pre>%s</pre>" % "\n".join(lines))
+
+    def exportProfile(self):
+        """
+        Exports the recorded stage durations to a JSON or CSV file
+        """
+        path = QFileDialog.getSaveFileName(self.iface.mainWindow(), "Export profile", "", "JSON (*.json);;CSV (*.csv)")
+        if path:
+            self.profiler.export(path)
+
+    def flushSession(self):
+        """
+        Adds the features queued by the capture session to the layer
+        """
+        if self.tool is not None and self.tool.session is not None:
+            self.tool.session.flush()
+
+    def showSession(self):
+        """
+        Shows the state of the capture session in the dock widget
+        """
+        session = self.tool.session if self.tool is not None else None
+        self.flushButton.setEnabled(session is not None)
+        if session is None:
+            self.sessionLabel.clear()
+            return
+        text = "%d committed, %d queued" % (session.committedCount, len(session.pending))
+        if session.flushDurations:
+            text += ", last flush %.0f ms" % (session.flushDurations[-1] * 1000.0)
+        self.sessionLabel.setText(text)
+
+    def toggleRapidCapture(self, enabled):
+        """
+        Enables or disables the rapid-capture mode (the attribute form is skipped)
+        """
+        from RapidCapture import readTemplate
+        QSettings().setValue("/improvedpolygoncapturing/rapidCapture", enabled)
+        if self.tool is not None:
+            self.tool.rapidCapture = enabled
+            self.tool.attributeTemplate = readTemplate()
+
+    def showCaptured(self):
+        """
+        Shows the number of features waiting for their attributes in the dock widget
+        """
+        layer = self.tool.layer if self.tool is not None else None
+        count = self.capturedFeatures.count(layer) if layer is not None else 0
+        self.fillButton.setEnabled(count > 0)
+        self.capturedLabel.setText("%d without attributes" % count if count else "")
+
+    def fillAttributes(self):
+        """
+        Opens the attribute form once and applies the entered values to all
+        the features captured in rapid-capture mode
+        """
+        layer = self.tool.layer if self.tool is not None else None
+        if layer is None or not self.capturedFeatures.count(layer):
+            return
+        if not layer.isEditable():
+            QMessageBox.critical(self.iface.mainWindow(),
+                                 QCoreApplication.translate("ImprovedPolygonCapturing", "Layer not editable"),
+                                 QCoreApplication.translate("ImprovedPolygonCapturing", "Toggle the editing mode of the layer to fill the attributes."))
+            return
+        # The form edits a prototype feature, the fields left empty are not changed
+        from RapidCapture import readTemplate, templateAttributes
+        feature = QgsFeature()
+        feature.setAttributes(templateAttributes(layer, readTemplate()))
+        try:
+            accepted = self.iface.openFeatureForm(layer, feature, True)
+        except AttributeError:
+            return
+        if accepted:
+            self.capturedFeatures.fillAttributes(layer, feature.attributes())
+
+    def syncWidgets(self):
+        """
+        Shows the values computed by the tool in the spin boxes (without
+        emitting their signals, the constraints already hold the values)
+        """
+        if not self.constraints.dirty:
+            return
+        self.constraints.dirty = False
+        with self.profiler.stage("widgets"):
+            for spinBox, value in ((self.spinBoxDist, self.constraints.distance), (self.spinBoxAngle, self.constraints.angle)):
+                spinBox.blockSignals(True)
+                spinBox.setValue(value)
+                spinBox.blockSignals(False)
+
+    def showFigures(self):
+        """
+        Shows the area, the length and the closing distance of the feature being
+        captured, with the misclosure and the precision ratio of the polygons
+        """
+        figures = self.tool.figures.current() if self.tool is not None else None
+        if figures is None:
+            self.figuresLabel.clear()
+            return
+        area, length, closing = figures
+        if self.tool.isPolygon:
+            text = "Area %.2f, perimeter %.2f, closing %.3f" % (area, length + closing, closing)
+        else:
+            text = "Length %.2f, to the start %.3f" % (length, closing)
+        closure = self.tool.closure()
+        if closure is not None and closure[1] is not None:
+            text += " (1:%d)" % closure[1]
+            if self.tool.closureAdjustment and closure[0] <= self.tool.closureTolerance:
+                text += ", adjusted on finish"
+        self.figuresLabel.setText(text)
+
+    def vertexAdded(self):
+        """
+        Shows the values of the added vertex and gives the focus back to the
+        distance spin box to allow a convenient distance re-entry
+        """
+        self.syncWidgets()
+        self.focusDist()
 
     def focusAngle(self):
         """
@@ -175,6 +420,10 @@ class ImprovedPolygonCapturing:
         Remove the plugin menu item and icon from the toolbar
         """
         self.stop()
+        if self.tool is not None:
+            self.tool.release()
+        if self.dockWidget is not None:
+            self.iface.mainWindow().removeDockWidget(self.dockWidget)
         self.dockWidget = None
         self.iface.removePluginMenu(u"&Improved Polygon Capturing", self.helpAction)
         self.iface.digitizeToolBar().removeAction(self.capturePolygonAction)
@@ -193,11 +442,11 @@ class ImprovedPolygonCapturing:
                     QObject.disconnect(layer, SIGNAL("editingStarted()"), self.toggle)
 
                     if layer.geometryType() == QGis.Polygon:
-                        self.capturePolygonAction.setIcon(QIcon(":/plugins/improvedpolygoncapturing/ressources/mActionCapturePolygon.png"))
+                        self.capturePolygonAction.setIcon(self.icon("mActionCapturePolygon.png"))
                         self.capturePolygonAction.setToolTip(QCoreApplication.translate("ImprovedPolygonCapturing", "CAD-like improved polygon capture"))
                         self.isPolygon = True
                     elif layer.geometryType() == QGis.Line:
-                        self.capturePolygonAction.setIcon(QIcon(":/plugins/improvedpolygoncapturing/ressources/mActionCaptureLine.png"))
+                        self.capturePolygonAction.setIcon(self.icon("mActionCaptureLine.png"))
                         self.capturePolygonAction.setToolTip(QCoreApplication.translate("ImprovedPolygonCapturing", "CAD-like improved line capture"))
                         self.isPolygon = False
 
@@ -213,12 +462,22 @@ class ImprovedPolygonCapturing:
         QgsMapToolCapturePolygon, the dockwidget is shown focus is given to the spin box and the
         capture polygon action is checked. Connect to the deactivate signal.
         """
-        # This is the coordinates capture tool
-        self.tool = QgsMapToolCapturePolygon(self.iface, self.relBox, self.spinBoxDist, self.spinBoxAngle, self.lockBoxDist, self.lockBoxAngle, self.isPolygon)
-
-        # Save the previous selected tool and set the new capture coordinate tool
-        self.previous = self.canvas.mapTool()
-        self.canvas.setMapTool(self.tool)
+        self.load()
+        with self.profiler.stage("activation"):
+            # This is the coordinates capture tool, created once and bound to the current layer
+            if self.tool is None:
+                from QgsMapToolCapturePolygon import QgsMapToolCapturePolygon
+                self.tool = QgsMapToolCapturePolygon(self.iface, self.constraints, self.isPolygon, self.profiler, self.capturedFeatures)
+            else:
+                self.tool.setLayer(self.canvas.currentLayer(), self.isPolygon)
+
+            # Save the previous selected tool and set the new capture coordinate tool
+            self.previous = self.canvas.mapTool()
+            self.canvas.setMapTool(self.tool)
+            # Load the snapping grids (from the cache if the layers did not change)
+            self.tool.snapIndex.prepare()
+            if self.tool.isAvoidingIntersection:
+                self.tool.avoidIndex.prepare()
 
         # Show the dockWidget, give it the focus, and display the tool as checked
         self.dockWidget.show()
@@ -227,22 +486,38 @@ class ImprovedPolygonCapturing:
 
         # Stop the tool as soon as the QgsMapToolCapturePolygon is deactivated
         QObject.connect(self.tool, SIGNAL("deactivated()"), self.stop)
+        QObject.connect(self.tool, SIGNAL("vertexAdded()"), self.vertexAdded)
+        QObject.connect(self.tool, SIGNAL("sessionChanged"), self.showSession)
+        self.showSession()
+        self.showCaptured()
+        self.syncTimer.start()
 
     def stop(self):
         """
         Stops the tool, i.e. the action in the toolbar is unchecked, the dockwidget is hidden and the
         map canvas is cleared from the temporary markers and rubberband.
         """
+        self.capturePolygonAction.setChecked(False)
+        # Nothing else to do if the tool was never used
+        if self.dockWidget is None:
+            return
 
         self.dockWidget.hide()
 
-        self.capturePolygonAction.setChecked(False)
+        self.syncTimer.stop()
+        self.syncWidgets()
+        self.figuresLabel.clear()
 
+        if self.tool is None:
+            return
         self.tool.clearMapCanvas()
         QObject.disconnect(self.tool, SIGNAL("deactivated()"), self.stop)
+        QObject.disconnect(self.tool, SIGNAL("vertexAdded()"), self.vertexAdded)
+        QObject.disconnect(self.tool, SIGNAL("sessionChanged"), self.showSession)
 
 
 
     def showHelp(self):
         # Simply show the help window
+        from AboutDialog import AboutDialog
         self.aboutWindow = AboutDialog()
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import csv
+import json
+import math
+import time
+from collections import deque
+
+class _NoTiming(object):
+    """
+    Context manager doing nothing (used while the profiler is disabled)
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+_noTiming = _NoTiming()
+
+class _StageTiming(object):
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.buffer.append(time.time() - self.start)
+        return False
+
+class Profiler(object):
+    """
+    Records the duration of the capture stages (snapping, constraints, rubberband,
+    feature form, topological points, addFeature...) into ring buffers. While it is
+    disabled, stage() returns a shared context manager doing nothing.
+
+    Usage:
+        with profiler.stage("snapping"):
+            ...
+    """
+    def __init__(self, size=1000):
+        """
+        @param {int} size Number of samples kept per stage
+        """
+        self.size = size
+        self.enabled = False
+        # stage name -> deque of durations in seconds
+        self.buffers = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _noTiming
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = deque(maxlen=self.size)
+        return _StageTiming(buffer)
+
+    def clear(self):
+        self.buffers = {}
+
+    def statistics(self):
+        """
+        Returns the rolling statistics of the recorded stages
+        @returns {list} List of (stage, count, p50, p95, p99) with durations in milliseconds
+        """
+        result = []
+        for name in sorted(self.buffers.keys()):
+            samples = sorted(self.buffers[name])
+            if not samples:
+                continue
+            result.append((name, len(samples), percentile(samples, 50) * 1000.0, percentile(samples, 95) * 1000.0, percentile(samples, 99) * 1000.0))
+        return result
+
+    def export(self, path):
+        """
+        Writes the statistics and the raw samples to a JSON file, or the statistics
+        to a CSV file if the path ends with .csv
+        """
+        statistics = self.statistics()
+        if path.lower().endswith(".csv"):
+            with open(path, "wb") as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerow(["stage", "count", "p50_ms", "p95_ms", "p99_ms"])
+                for row in statistics:
+                    writer.writerow(row)
+        else:
+            data = {
+                "statistics": [dict(zip(("stage", "count", "p50_ms", "p95_ms", "p99_ms"), row)) for row in statistics],
+                "samples_ms": dict((name, [s * 1000.0 for s in buffer]) for name, buffer in self.buffers.items()),
+            }
+            with open(path, "w") as jsonFile:
+                json.dump(data, jsonFile, indent=2)
+
+def percentile(sortedValues, q):
+    """
+    Returns the q-th percentile (nearest rank) of already sorted values
+    """
+    index = int(math.ceil(q / 100.0 * len(sortedValues))) - 1
+    return sortedValues[min(max(index, 0), len(sortedValues) - 1)]
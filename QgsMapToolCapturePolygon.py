@@ -20,39 +20,82 @@ git repo             : https://github.com/olivierdalang/improvedpolygoncapturing
  *                                                                         *
  ***************************************************************************/
 """
-import math
-
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
 from qgis.gui import *
 
+import GeometryCore
+import TraverseAdjustment
+import WkbWriter
+from AsyncWriter import AsyncWriter, isDatabaseLayer
+from AvoidIntersectionIndex import AvoidIntersectionIndex
+from CaptureBuffer import CaptureBuffer
+from CaptureSession import CaptureSession
+from DigitizingSettings import DigitizingSettings
+from Profiler import Profiler
+from RapidCapture import CapturedFeatures, readTemplate, templateAttributes
+from RunningFigures import RunningFigures
+from SnapIndex import SnapIndex
+from SnapWorker import SnapWorker
+from TransformCache import TransformCache
+from VertexMarkersItem import VertexMarkersItem
+
 class QgsMapToolCapturePolygon(QgsMapTool):
     """
     QgsMapTool subclass to capture polygon with preset edge length and add
     it as new features to the current layer.
     """
-    def __init__(self, iface, relBox, spinBoxDist, spinBoxAngle, lockBoxDist, lockBoxAngle, isPolygon):
+    def __init__(self, iface, constraints, isPolygon, profiler=None, captured=None):
         QgsMapTool.__init__(self, iface.mapCanvas())
         self.iface = iface
         self.canvas = iface.mapCanvas()
-        self.relBox = relBox
-        self.spinBoxDist = spinBoxDist
-        self.spinBoxAngle = spinBoxAngle
-        self.lockBoxDist = lockBoxDist
-        self.lockBoxAngle = lockBoxAngle
+        # ConstraintState shared with the dock widget
+        self.constraints = constraints
+        # Profiler recording the duration of the capture stages (disabled by default)
+        self.profiler = profiler if profiler is not None else Profiler()
+        # In rapid-capture mode, the attribute form is not opened: the features get the attributes
+        # of the template, and their ids are recorded to fill their attributes later on (see readSettings)
+        self.rapidCapture = False
+        self.attributeTemplate = {}
+        self.captured = captured if captured is not None else CapturedFeatures()
+        # Closure adjustment of the polygons whose last vertex was measured back onto the first one
+        # (TraverseAdjustment.COMPASS or LEAST_SQUARES, empty to disable it), and largest adjusted misclosure
+        self.closureAdjustment = ""
+        self.closureTolerance = 0.5
         self.isPolygon = isPolygon
         # Create an empty rubber band
         if self.isPolygon:
             self.rubberBand = QgsRubberBand(self.canvas, QGis.Polygon) # BMF for reference: Polygon > rubberband interior is filled in
         else:
             self.rubberBand = QgsRubberBand(self.canvas, QGis.Line) #BMF Line > interior not filled (what we want for EntryLines)
-        # Create an empty list for vertex marker
-        self.vertexMarkers = []
-        # Create an empty list to store the new vertices
-        self.captureList = []
-        # Get the current layer
-        self.layer = self.canvas.currentLayer()
+        # Create the canvas item drawing the vertex markers
+        self.vertexMarkers = VertexMarkersItem(self.canvas)
+        # Create an empty buffer to store the new vertices (in map coordinates, they are
+        # reprojected to the layer CRS at once when the feature is finished)
+        self.captureBuffer = CaptureBuffer()
+        # Area, length and closing distance of the captured vertices, updated with the capture buffer
+        self.figures = RunningFigures()
+        # QGIS digitizing options, read again when the tool is activated
+        self.digitizingSettings = DigitizingSettings()
+        self.digitizingSettings.applyTo(self.rubberBand)
+        # Create the snapping engine (vertex/segment index of the snappable layers)
+        self.transforms = TransformCache(self.canvas)
+        self.snapIndex = SnapIndex(self.canvas, self.digitizingSettings, self.transforms)
+        # In asynchronous mode, the snapping of the mouse moves runs in a thread
+        self.asyncSnapping = False
+        self.snapWorker = SnapWorker(self.snapIndex)
+        # Number of the latest cursor position sent to the snapping thread
+        self.snapGeneration = 0
+        QObject.connect(self.snapWorker, SIGNAL("snapped"), self.snapped)
+        # Mouse moves are coalesced: at most one preview update per frame at the target rate
+        self.moveTimer = QTimer()
+        self.moveTimer.setSingleShot(True)
+        QObject.connect(self.moveTimer, SIGNAL("timeout()"), self.processPendingMove)
+        # Position of the latest mouse move not processed yet
+        self.pendingMovePos = None
+        # Number of mouse moves that were replaced by a newer one before being processed
+        self.coalescedMoves = 0
         # Create the mouse cursor
         self.cursor = QCursor(QPixmap(["16 16 3 1",
                               "      c None",
@@ -75,6 +118,32 @@ class QgsMapToolCapturePolygon(QgsMapTool):
                               "      ++.++     ",
                               "       +.+      "]))
 
+        # R-tree of the avoid intersections layers
+        self.avoidIndex = AvoidIntersectionIndex()
+
+        # Objects bound to the layer receiving the new features (see setLayer)
+        self.layer = None
+        self.isAvoidingIntersection = False
+        self.session = None
+        self.pendingBand = None
+        self.writer = None
+        self.setLayer(self.canvas.currentLayer(), isPolygon)
+
+    def setLayer(self, layer, isPolygon):
+        """
+        Binds the tool to the layer receiving the new features. The tool is
+        created once and bound again on each activation, the snapping grids
+        and the canvas items are kept, the settings are read again.
+        @param {QgsVectorLayer} layer
+        @param {bool} isPolygon True to capture polygons, False to capture lines
+        """
+        if layer is not self.layer:
+            self.releaseLayer()
+        self.readSettings()
+        self.layer = layer
+        self.isPolygon = isPolygon
+        self.clearMapCanvas()
+
         # Get the project property and check if new added geometries has to avoid intersections
         self.isAvoidingIntersection = False
         # Get the list with layer entries
@@ -86,6 +155,92 @@ class QgsMapToolCapturePolygon(QgsMapTool):
                 if str(avoidIntersectionList[0][i]) == self.layer.id():
                     self.isAvoidingIntersection = True
 
+        if self.layer is None:
+            return
+
+        # In capture session mode, the finished features are queued and added in batches
+        settings = QSettings()
+        flushEvery = settings.value("/improvedpolygoncapturing/sessionFlushEvery", 20, type=int)
+        if not settings.value("/improvedpolygoncapturing/captureSession", False, type=bool):
+            self.releaseSession()
+        elif self.session is not None:
+            self.session.flushEvery = flushEvery
+        else:
+            self.session = CaptureSession(self.layer, flushEvery, self.addTopologicalPoints)
+            QObject.connect(self.session, SIGNAL("flushed"), self.sessionFlushed)
+            QObject.connect(self.session, SIGNAL("flushFailed"), self.sessionFlushFailed)
+            QObject.connect(self.session, SIGNAL("discarded"), self.sessionDiscarded)
+            # The queued features are shown by a second rubberband until they are added
+            self.pendingBand = QgsRubberBand(self.canvas, self.layer.geometryType())
+            self.pendingBand.setColor(QColor(0, 0, 255, 100))
+
+        # In write-behind mode, the finished features are written to the database by a background thread
+        batchSize = settings.value("/improvedpolygoncapturing/writerBatchSize", 20, type=int)
+        writeBehind = settings.value("/improvedpolygoncapturing/writeBehind", False, type=bool) and isDatabaseLayer(self.layer) \
+            and not self.writeBehindRefused()
+        if self.writer is not None and not writeBehind:
+            self.releaseWriter()
+        if self.writer is not None:
+            self.writer.batchSize = batchSize
+        elif writeBehind:
+            self.writer = AsyncWriter(self.layer, batchSize)
+            QObject.connect(self.writer, SIGNAL("written"), self.featuresWritten)
+            QObject.connect(self.writer, SIGNAL("writeFailed"), self.writeFailed)
+
+    def readSettings(self):
+        """
+        Reads the advanced settings of the tool (see README). The capture session and the
+        write-behind mode are set up by setLayer.
+        """
+        settings = QSettings()
+        self.rapidCapture = settings.value("/improvedpolygoncapturing/rapidCapture", False, type=bool)
+        self.attributeTemplate = readTemplate()
+        self.closureAdjustment = settings.value("/improvedpolygoncapturing/closureAdjustment", "", type=str)
+        self.closureTolerance = settings.value("/improvedpolygoncapturing/closureTolerance", 0.5, type=float)
+        # The snapping thread is started by activate
+        self.asyncSnapping = settings.value("/improvedpolygoncapturing/asyncSnapping", False, type=bool)
+        if not self.asyncSnapping and self.snapWorker.isRunning():
+            self.snapWorker.stop()
+        previewRate = settings.value("/improvedpolygoncapturing/previewRate", 60, type=int)
+        self.moveTimer.setInterval(1000 / previewRate if previewRate > 0 else 0)
+
+    def releaseLayer(self):
+        """
+        Adds the queued features and stops the writers of the current layer
+        """
+        self.releaseSession()
+        self.releaseWriter()
+
+    def releaseSession(self):
+        if self.session is not None:
+            self.session.close()
+            QObject.disconnect(self.session, SIGNAL("flushed"), self.sessionFlushed)
+            QObject.disconnect(self.session, SIGNAL("flushFailed"), self.sessionFlushFailed)
+            QObject.disconnect(self.session, SIGNAL("discarded"), self.sessionDiscarded)
+            self.snapIndex.clearPendingGeometries(self.session.layerId)
+            self.canvas.scene().removeItem(self.pendingBand)
+            self.session = None
+            self.pendingBand = None
+
+    def releaseWriter(self):
+        if self.writer is not None:
+            self.writer.close()
+            QObject.disconnect(self.writer, SIGNAL("written"), self.featuresWritten)
+            QObject.disconnect(self.writer, SIGNAL("writeFailed"), self.writeFailed)
+            self.writer = None
+
+    def release(self):
+        """
+        Releases the canvas items and the background threads when the plugin is unloaded
+        """
+        self.moveTimer.stop()
+        self.pendingMovePos = None
+        if self.snapWorker.isRunning():
+            self.snapWorker.stop()
+        self.releaseLayer()
+        self.canvas.scene().removeItem(self.rubberBand)
+        self.canvas.scene().removeItem(self.vertexMarkers)
+
     def canvasPressEvent(self, event):
         """
         Handle mouse clicks. With normal clicks new vertices are added
@@ -93,19 +248,8 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         finish the new geometry.
         """
 
-        # Get the settings for the digitizing rubberband
-        settings = QSettings()
-        red = settings.value("/qgis/digitizing/line_color_red", 255)
-        green = settings.value("/qgis/digitizing/line_color_green", 0)
-        blue = settings.value("/qgis/digitizing/line_color_blue", 0)
-        alpha = settings.value("/qgis/digitizing/line_color_alpha", 150)
-        rubberBandColor = QColor(red, green, blue, alpha)
-        self.rubberBand.setColor(rubberBandColor)
-        # Get also the line width from the settings
-        lineWidth = settings.value("/qgis/digitizing/line_width", 1)
-        self.rubberBand.setWidth(lineWidth)
-        #self.rubberBand.show()
-        
+        # The rubberband color and width are set when the tool is activated (see DigitizingSettings)
+
         # Captures the clicked coordinate and transform
         mapCoordinates = self.toMapCoordinates(event.pos())
 
@@ -118,18 +262,49 @@ class QgsMapToolCapturePolygon(QgsMapTool):
     def canvasMoveEvent(self, event):
         """
         Listen to the mouse movement to provide the interactive polygon
-        preview.
+        preview. Moves arriving within the same frame are merged, only the
+        latest position is processed.
         """
-        self.moveVertex(self.toMapCoordinates(event.pos()))
-        pass
+        if self.pendingMovePos is not None:
+            self.coalescedMoves += 1
+        self.pendingMovePos = QPoint(event.pos())
+        if not self.moveTimer.isActive():
+            self.processPendingMove()
+
+    def processPendingMove(self):
+        """
+        Updates the preview for the latest mouse position and waits for the next frame
+        """
+        if self.pendingMovePos is None:
+            return
+        pos = self.pendingMovePos
+        self.pendingMovePos = None
+        self.moveVertex(self.toMapCoordinates(pos))
+        self.moveTimer.start()
 
     def canvasReleaseEvent(self, event):
         pass
+
+    def keyPressEvent(self, event):
+        """
+        Backspace removes the last vertex
+        """
+        if event.key() == Qt.Key_Backspace and len(self.captureBuffer) > 0:
+            self.removeLastVertex()
+            event.accept()
+        else:
+            event.ignore()
             
     def activate(self):
         QgsMapTool.activate(self)
         # Change the mouse cursor to the capture cursor symbol
         self.canvas.setCursor(self.cursor)
+        # The QGIS options may have changed while the tool was inactive
+        if self.digitizingSettings.read():
+            self.digitizingSettings.applyTo(self.rubberBand)
+            self.snapIndex.invalidateSettings()
+        if self.asyncSnapping:
+            self.snapWorker.start()
   
     def deactivate(self):
         """
@@ -137,6 +312,14 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         is used by the ImprovedPolygonCapturing class to disconnect
         all signal and disable the button in the toolbar
         """
+        if self.snapWorker.isRunning():
+            self.snapWorker.stop()
+        self.moveTimer.stop()
+        self.pendingMovePos = None
+        if self.session is not None:
+            self.session.flush()
+        if self.coalescedMoves:
+            QgsMessageLog.logMessage("%d mouse moves merged into newer ones" % self.coalescedMoves, "Improved Polygon Capturing")
         # BMF added try block > getting error on QGIS close
         try:
             self.emit(SIGNAL("deactivated()"))
@@ -162,38 +345,55 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         @param {QgsPoint} pt Position of the mouse click in map coordinates
         """
     
-        # Get the values from the UI
-        relBox = self.relBox.isChecked()
-        distance = self.spinBoxDist.value()
-        angle = self.spinBoxAngle.value()
-        distanceLock = self.lockBoxDist.isChecked()
-        angleLock = self.lockBoxAngle.isChecked()
+        # Get the values from the constraints
+        relBox = self.constraints.relative
+        distance = self.constraints.distance
+        angle = self.constraints.angle
+        distanceLock = self.constraints.distanceLock
+        angleLock = self.constraints.angleLock
 
         # Coordinates of mouse click
         newPt = None
 
+        # The click always waits for the exact snapping result, and the
+        # results of the pending mouse moves are not needed anymore
+        self.snapGeneration += 1
+
         # If the capture list contains already vertices, then calculate the new position based on the distance (and considering snapping)
-        if len(self.captureList) > 0:
-            newPt = self.calculatePointPos(pt, relBox, distance, angle, distanceLock, angleLock)
+        if len(self.captureBuffer) > 0:
+            newPt = self.calculatePointPos(self.snapToBackgroundLayers(pt), relBox, distance, angle, distanceLock, angleLock)
         # If this is the first point add a new point to the capture list at the current mouse position considering the default snapping behaviour.
         else:
             snappedPt = self.snapToBackgroundLayers(pt)
             newPt = QgsPoint(snappedPt.x(), snappedPt.y())
 
-        # Project the new point to the layer projection and add it to the capture list
-        self.captureList.append(self.toLayerCoordinates(self.layer, newPt))
+        # Add the new point to the capture buffer
+        self.captureBuffer.append(newPt.x(), newPt.y())
+        self.figures.add(newPt.x(), newPt.y())
 
-        # Add the new point also to the rubberband
-        self.rubberBand.addPoint(newPt)
-        # And add also a small marker to highlight the vertices
-        m = QgsVertexMarker(self.canvas)
-        m.setCenter(newPt)
-        self.vertexMarkers.append(m)
+        with self.profiler.stage("rubberband"):
+            # Add the new point also to the rubberband
+            self.rubberBand.addPoint(newPt)
+            # And add also a small marker to highlight the vertices
+            self.vertexMarkers.append(newPt)
 
-        # Give the focus back to the spin box to allow a convenient distance
-        # re-entry
-        self.spinBoxDist.setFocus()
-        self.spinBoxDist.selectAll()
+        # Let the dock widget give the focus back to the spin box to allow a
+        # convenient distance re-entry
+        self.emit(SIGNAL("vertexAdded()"))
+
+    def removeLastVertex(self):
+        """
+        Removes the last vertex of the current polygon (the preview vertex stays where the mouse is)
+        """
+        if len(self.captureBuffer) <= 1:
+            self.clearMapCanvas()
+            return
+        self.captureBuffer.removeLast()
+        self.figures.removeLast(self.captureBuffer.point(-1))
+        with self.profiler.stage("rubberband"):
+            # The last point of the rubberband is the one following the mouse
+            self.rubberBand.removePoint(-2)
+            self.vertexMarkers.removeLast()
 
     def moveVertex(self, pt):
         """
@@ -202,12 +402,12 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         polygon preview.
         @param {QgsPoint} pt Mouse pointer position in map coordinates
         """
-        # Get the values from the UI
-        relBox = self.relBox.isChecked()
-        distance = self.spinBoxDist.value()
-        angle = self.spinBoxAngle.value()
-        distanceLock = self.lockBoxDist.isChecked()
-        angleLock = self.lockBoxAngle.isChecked()
+        # Get the values from the constraints
+        relBox = self.constraints.relative
+        distance = self.constraints.distance
+        angle = self.constraints.angle
+        distanceLock = self.constraints.distanceLock
+        angleLock = self.constraints.angleLock
 
         # Coordinates of mouse move
         cursorPt = QgsPoint(pt.x(), pt.y())
@@ -217,9 +417,38 @@ class QgsMapToolCapturePolygon(QgsMapTool):
 
         nbrVertices = self.rubberBand.numberOfVertices()
         if nbrVertices > 1:
+            if self.asyncSnapping:
+                # Show the unsnapped point now, the snapped one replaces it when it is ready. The
+                # missing grids are filled by the snapping thread too, so that reading the layers
+                # never blocks the mouse moves
+                self.snapGeneration += 1
+                tasks = []
+                query = self.snapIndex.prepareQuery(cursorPt, tasks)
+                self.snapWorker.request(self.snapGeneration, query, tasks)
+            else:
+                cursorPt = self.snapToBackgroundLayers(cursorPt)
             newPt = self.calculatePointPos(cursorPt, relBox, distance, angle, distanceLock, angleLock)
+            self.figures.setPreview(newPt.x(), newPt.y())
             # Move the last point to create an interactive movement
-            self.rubberBand.movePoint(newPt)
+            with self.profiler.stage("rubberband"):
+                self.rubberBand.movePoint(newPt)
+
+    def snapped(self, generation, result):
+        """
+        Receives the snapping results of the snapping thread and updates the
+        preview if the cursor did not move in the meantime.
+        @param {int} generation Number of the cursor position the result belongs to
+        @param {tuple} result Result of SnapIndex.runQuery
+        """
+        if generation != self.snapGeneration or self.rubberBand.numberOfVertices() < 2:
+            return
+        snappedPt = self.snapIndex.finishQuery(result)
+        if snappedPt is None:
+            return
+        constraints = self.constraints
+        newPt = self.calculatePointPos(snappedPt, constraints.relative, constraints.distance, constraints.angle, constraints.distanceLock, constraints.angleLock)
+        self.figures.setPreview(newPt.x(), newPt.y())
+        self.rubberBand.movePoint(newPt)
 
     def finishFeature(self, pt):
         """
@@ -227,12 +456,21 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         it the current layer
         @param {QgsPoint} pt The last point to add to the polygon in map coordinates
         """
+
+        # Distribute the misclosure of a traverse measured back onto its first vertex
+        if self.isPolygon and self.closureAdjustment and len(self.captureBuffer) >= 4:
+            with self.profiler.stage("adjustment"):
+                self.adjustClosure()
+
+        # Project the captured points to the layer projection, all at once (the rings are closed here)
+        with self.profiler.stage("reprojection"):
+            layerCoordinates = self.transforms.toLayerCoordinates(self.layer, self.captureBuffer.ringCoordinates(self.isPolygon))
  
         # Handle polygons
         if self.isPolygon:
             # A valid polygons requires at least three points. Throw
             # an error message if this is not the case.
-            if not len(self.captureList) >= 3:
+            if not len(self.captureBuffer) >= 3:
                 QMessageBox.critical(self.canvas,
                                      QCoreApplication.translate("ImprovedPolygonCapturing", "Not enough vertices"),
                                      QCoreApplication.translate("ImprovedPolygonCapturing", "Cannot close a polygon feature until it has at least three vertices."))
@@ -243,13 +481,21 @@ class QgsMapToolCapturePolygon(QgsMapTool):
             # Create a geometry from the point list considering the
             # layer geometry type.
             if self.layer.wkbType() == QGis.WKBMultiPolygon:
-                geometry = QgsGeometry().fromMultiPolygon([[self.captureList]])
+                geometry = self.createGeometry(layerCoordinates, True, True)
             elif self.layer.wkbType() == QGis.WKBPolygon:
-                geometry = QgsGeometry().fromPolygon([self.captureList])
+                geometry = self.createGeometry(layerCoordinates, True, False)
 
             # Handle avoiding intersections
             if self.isAvoidingIntersection:
-                self.layer.removePolygonIntersections(geometry)
+                with self.profiler.stage("avoidIntersections"):
+                    clipped = self.avoidIndex.clip(geometry)
+                if clipped is None:
+                    QMessageBox.critical(self.canvas,
+                                         QCoreApplication.translate("ImprovedPolygonCapturing", "Error"),
+                                         QCoreApplication.translate("ImprovedPolygonCapturing", "An error was reported during intersection removal"))
+                    self.clearMapCanvas()
+                    return
+                geometry = clipped
 
                 # We need to check if the removePolygonIntersections method has changed the new
                 # geometry to a multipolygon. If yes, we cannot add the new geometry to the
@@ -266,7 +512,7 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         # Handle linestrings
         elif not self.isPolygon:
             # Check if there are enough vertices to create a line string
-            if not len(self.captureList) >= 2:
+            if not len(self.captureBuffer) >= 2:
                 QMessageBox.critical(self.canvas,
                                      QCoreApplication.translate("ImprovedPolygonCapturing", "Not enough vertices"),
                                      QCoreApplication.translate("ImprovedPolygonCapturing", "Cannot close a line feature until it has at least two vertices."))
@@ -276,9 +522,9 @@ class QgsMapToolCapturePolygon(QgsMapTool):
             # Create a geometry from the point list considering the
             # layer geometry type.
             if self.layer.wkbType() == QGis.WKBMultiLineString:
-                geometry = QgsGeometry().fromMultiPolyline([self.captureList])
+                geometry = self.createGeometry(layerCoordinates, False, True)
             elif self.layer.wkbType() == QGis.WKBLineString:
-                geometry = QgsGeometry().fromPolyline(self.captureList)
+                geometry = self.createGeometry(layerCoordinates, False, False)
 
         # Cancel the operation and clear the map canvas if the new geometry is not valid
         else:
@@ -287,10 +533,6 @@ class QgsMapToolCapturePolygon(QgsMapTool):
 
         # print "New geometry is " + str(geometry.exportToWkt())
 
-        # Add the new geometry to the layers topological point to ensure topological editing
-        # see also the announcing for version 1.0 http://blog.qgis.org/node/123
-        self.layer.addTopologicalPoints(geometry)
-
         # Create a new feature and set the geometry to it
         feature = QgsFeature()
         feature.setGeometry(geometry)
@@ -301,115 +543,214 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         for at in pr.fields():
             attrib_tmp.append(at)
 
-        # Open the feature form to edit the attributes. If the user cancels the
-        # feature form, openFeatureForm returns false and the feature is not added
-        # to the layer.
-        # Since I'm not sure when QgisInterface.openFeatureForm has been added
-        # to the QGIS API proper exception handling is needed.
-        feature.setAttributes(attrib_tmp)
         saveFeature = True
-        try:
-            saveFeature = self.iface.openFeatureForm(self.layer, feature, True)
-        except AttributeError:
-            pass
+        if self.rapidCapture:
+            # The attributes are filled later on for all captured features at once
+            feature.setAttributes(templateAttributes(self.layer, self.attributeTemplate))
+        else:
+            # Open the feature form to edit the attributes. If the user cancels the
+            # feature form, openFeatureForm returns false and the feature is not added
+            # to the layer.
+            # Since I'm not sure when QgisInterface.openFeatureForm has been added
+            # to the QGIS API proper exception handling is needed.
+            feature.setAttributes(attrib_tmp)
+            try:
+                with self.profiler.stage("featureForm"):
+                    saveFeature = self.iface.openFeatureForm(self.layer, feature, True)
+            except AttributeError:
+                pass
+
+        # Hand the new feature to the background writers in write-behind mode (the layer
+        # is repainted once it is written, see featuresWritten)
+        if self.writer is not None and not self.writeBehindRefused():
+            if saveFeature:
+                self.writer.write(feature)
+            self.clearMapCanvas()
+            return
+
+        # Queue the new feature in capture session mode
+        if self.session is not None:
+            if saveFeature:
+                self.pendingBand.addGeometry(geometry, self.layer)
+                # The next features snap to the queued ones, the topological points are added by the flush
+                self.snapIndex.addPendingGeometry(self.layer, geometry)
+                self.session.add(feature)
+                self.emit(SIGNAL("sessionChanged"))
+            self.clearMapCanvas()
+            return
 
-        # Add the new feature to the layer
+        # Add the new feature to the layer, with its topological points (one undo entry)
         if saveFeature:
-            self.layer.addFeature(feature)
-    
-        # Clear and refresh the canvas in any case
+            self.layer.beginEditCommand(QCoreApplication.translate("ImprovedPolygonCapturing", "Feature added"))
+            with self.profiler.stage("topology"):
+                self.addTopologicalPoints(geometry)
+            with self.profiler.stage("addFeature"):
+                added = self.layer.addFeature(feature)
+            if added:
+                self.layer.endEditCommand()
+            else:
+                self.layer.destroyEditCommand()
+            if added and self.rapidCapture:
+                self.captured.add(self.layer, feature.id(), geometry)
+
+        # Only the edited layer changed (new feature and/or topological points):
+        # redraw it instead of the whole canvas
+        self.layer.triggerRepaint()
+
+        # Clear the rubberband and the markers in any case
         self.clearMapCanvas()
 
+    def createGeometry(self, coordinates, polygon, multi):
+        """
+        Creates a geometry from the WKB written from the coordinates
+        @param {array} coordinates Flat array of doubles in layer coordinates (closed ring for polygons)
+        @returns {QgsGeometry}
+        """
+        geometry = QgsGeometry()
+        geometry.fromWkb(WkbWriter.geometryWkb(coordinates, polygon, multi))
+        return geometry
+
+    def adjustClosure(self):
+        """
+        Moves the captured vertices so that the last one falls on the first one, if
+        it is within the closure tolerance, and reports the misclosure
+        """
+        adjusted, error, ratio = TraverseAdjustment.adjustTraverse(self.captureBuffer.points(), self.closureAdjustment, self.closureTolerance)
+        if adjusted is None:
+            return
+        self.captureBuffer.setPoints(adjusted)
+        if ratio is not None:
+            text = QCoreApplication.translate("ImprovedPolygonCapturing", "Misclosure %.3f (1:%d) adjusted") % (error, ratio)
+            self.iface.messageBar().pushMessage("Improved Polygon Capturing", text, QgsMessageBar.INFO, 5)
+
+    def closure(self):
+        """
+        Returns the misclosure of the traverse if it ended at the preview vertex
+        @returns {tuple} (misclosure, N of the precision ratio 1:N or None), None for lines and for
+                         polygons with less than 3 vertices
+        """
+        if not self.isPolygon or self.figures.count < 3 or self.figures.preview is None:
+            return None
+        area, length, error = self.figures.current()
+        return error, TraverseAdjustment.precisionRatio(length, error)
+
+    def addTopologicalPoints(self, geometry):
+        """
+        Add the new geometry to the layers topological point to ensure topological editing
+        see also the announcing for version 1.0 http://blog.qgis.org/node/123
+        The features touched by the new vertices are found with the segment grid of the
+        snapping engine, the whole layer is only searched if the grid does not cover the geometry.
+        @param {QgsGeometry} geometry New geometry in layer coordinates
+        """
+        if not self.snapIndex.addTopologicalPoints(self.layer, geometry):
+            self.layer.addTopologicalPoints(geometry)
+
+    def writeBehindRefused(self):
+        """
+        The write-behind mode can't be used with topological editing: the vertices inserted into
+        the neighbours would be in the edit buffer while the new feature is already in the
+        database. The features go through the edit buffer instead.
+        @returns {bool} True if topological editing is on (a warning is shown)
+        """
+        if not QgsProject.instance().readNumEntry("Digitizing", "/TopologicalEditing", 0)[0]:
+            return False
+        text = QCoreApplication.translate("ImprovedPolygonCapturing", "Write-behind is not used while topological editing is on")
+        self.iface.messageBar().pushMessage("Improved Polygon Capturing", text, QgsMessageBar.WARNING, 5)
+        return True
+
+    def sessionFlushed(self, addedIds, duration):
+        """
+        The queued features of the capture session were added to the layer
+        (sessionChanged is emitted on each change of the queue)
+        @param {list} addedIds Ids of the added features
+        @param {float} duration Duration of the flush in seconds
+        """
+        self.pendingBand.reset(self.layer.geometryType())
+        self.snapIndex.clearPendingGeometries(self.layer.id())
+        if self.rapidCapture:
+            for fid in addedIds:
+                for feature in self.layer.getFeatures(QgsFeatureRequest(fid)):
+                    self.captured.add(self.layer, fid, feature.geometry())
+        self.layer.triggerRepaint()
+        self.emit(SIGNAL("sessionChanged"))
+
+    def sessionFlushFailed(self, count):
+        """
+        The layer refused the queued features of the capture session, they stay queued
+        @param {int} count Number of queued features
+        """
+        text = QCoreApplication.translate("ImprovedPolygonCapturing", "%d queued feature(s) could not be added to the layer, they are kept in the queue") % count
+        QgsMessageLog.logMessage(text, "Improved Polygon Capturing")
+        self.iface.messageBar().pushMessage("Improved Polygon Capturing", text, QgsMessageBar.CRITICAL)
+
+    def sessionDiscarded(self, count):
+        """
+        The queued features of the capture session were dropped because the layer stopped
+        editing without saving or was removed. In the latter case the session is released.
+        @param {int} count Number of dropped features
+        """
+        self.pendingBand.reset(QGis.Polygon if self.isPolygon else QGis.Line)
+        self.snapIndex.clearPendingGeometries(self.session.layerId)
+        if count:
+            text = QCoreApplication.translate("ImprovedPolygonCapturing", "%d queued feature(s) were discarded") % count
+            self.iface.messageBar().pushMessage("Improved Polygon Capturing", text, QgsMessageBar.WARNING, 5)
+        if self.session.layer is None:
+            self.releaseSession()
+        self.emit(SIGNAL("sessionChanged"))
+
+    def featuresWritten(self, features):
+        """
+        Features were written to the database by the write-behind threads
+        @param {list} features The written features, with their new ids
+        """
+        # They did not go through the edit buffer, so no edit signal was emitted
+        self.snapIndex.committedFeaturesAdded(self.layer.id(), features)
+        if self.rapidCapture:
+            for feature in features:
+                self.captured.add(self.layer, feature.id(), feature.geometry())
+        self.layer.updateExtents()
+        self.layer.triggerRepaint()
+
+    def writeFailed(self, features, message):
+        """
+        Features could not be written to the database by the write-behind threads
+        """
+        text = QCoreApplication.translate("ImprovedPolygonCapturing", "%d feature(s) could not be written: %s") % (len(features), message)
+        QgsMessageLog.logMessage(text, "Improved Polygon Capturing")
+        self.iface.messageBar().pushMessage("Improved Polygon Capturing", text, QgsMessageBar.CRITICAL)
+
     def calculatePointPos(self, pt, relBox, inputDistance, inputAngle, distanceLock, angleLock):
         """
         Calculate a new point based on the distance from the spin box and the snapping
         properties. Snapping has priority over actual mouse position but NOT over locked numerical values.
         The distance calculation is done with plain trigonometry! Thus it is not recommended
         to use it with unprojected systems like EPSG:4326!
-        @param {QgsPoint} pt Mouse pointer in map coordinates
+        The construction rules themselves are in GeometryCore.constructPoint.
+        @param {QgsPoint} pt Mouse pointer in map coordinates (already snapped by the caller)
         @param {double} distance Preset length of the new edge in map units
         """
 
-        # Actual input point
-        pt = self.snapToBackgroundLayers(pt)    #Sthe actual input point is the snapped point
-        # Last input point
-        lastPt = self.rubberBand.getPoint(0, self.rubberBand.numberOfVertices()-2) # Take the second last point, since the last one is just for the interactive movement
-        
-        newAngle = 0 # This will store the computed angle
-        newDist = 10 # This will store the computed distance
-
-       
-        if relBox:
-            # If the angle is not absolute, we have to compute the angle of the last entered line segment
-            if self.rubberBand.numberOfVertices() > 2:
-                secondLastPt = self.rubberBand.getPoint(0, self.rubberBand.numberOfVertices()-3)
-                lastAngle = math.atan2(lastPt.y() - secondLastPt.y(), lastPt.x() - secondLastPt.x())
-            else:
-                #If there is no last entered line segment, we start we a 0 angle
-                lastAngle = 0
-
-        
-        if angleLock:
-            # If the angle is locked
-            if not relBox:
-                newAngle = inputAngle/180.0*math.pi # We compute the new angle based on the input angle (ABSOLUTE)
-            else:
-                newAngle = lastAngle + inputAngle/180.0*math.pi # We compute the new angle based on the input angle (RELATIVE)
-        else:
-            # If the angle is not locked
-            newAngle = math.atan2((pt.y()-lastPt.y()), pt.x()-lastPt.x()) # We simply set the new angle to the current angle
-            if not relBox:
-                self.spinBoxAngle.setValue(newAngle/math.pi*180.0) # Update the spinBox to reflect the current distance
-            else:
-                self.spinBoxAngle.setValue( (newAngle-lastAngle)/math.pi*180.0  ) # Update the spinBox to reflect the current distance
+        # Last input point (read from the capture buffer, the last point of the rubberband is just for the interactive movement)
+        lastPt = self.captureBuffer.point(-1)
+        # The point before, to compute the angle of the last entered line segment
+        secondLastPt = None
+        if relBox and len(self.captureBuffer) > 1:
+            secondLastPt = self.captureBuffer.point(-2)
 
+        with self.profiler.stage("constraints"):
+            x, y, newDist, newAngle = GeometryCore.constructPoint((pt.x(), pt.y()), lastPt, secondLastPt, relBox, inputDistance, inputAngle, distanceLock, angleLock)
 
-        if distanceLock:
-            # If the distance is locked
-            newDist = inputDistance # We simply set the new distance to the input distance
-        else:
-             # If the distance is not locked
-            if angleLock:
-                newDist = self.projectedDistance( lastPt, pt, newAngle ) # We simply set the new distance to the current distance
-            else:
-                newDist = math.sqrt( (pt.x()-lastPt.x())*(pt.x()-lastPt.x()) + (pt.y()-lastPt.y())*(pt.y()-lastPt.y()) ) # Or to its projection if the angle is locked
-            
-            self.spinBoxDist.setValue(newDist) # Update the spinBox to reflect the current distance
-
+            # Update the constraints to reflect the current angle and distance
+            if newAngle is not None:
+                self.constraints.setComputedAngle(newAngle)
+            if newDist is not None:
+                self.constraints.setComputedDistance(newDist)
 
         if distanceLock or angleLock:
-            # We only need to do some calulation if either the distance or the angle is locked
-            a = math.cos(newAngle) * newDist
-            b = math.sin(newAngle) * newDist
-            return QgsPoint(lastPt.x() + a, lastPt.y() + b)
+            return QgsPoint(x, y)
         else:
             return pt
 
-    def projectedDistance(self, lastPt, mousePt, angle):
-
-
-        ang = angle#/180.0*math.pi
-
-        projVect = QVector2D(math.cos(ang), math.sin(ang))
-        #projVect.normalize()
-        mouseVect = QVector2D(mousePt.x()-lastPt.x(),mousePt.y()-lastPt.y())
-
-        return QVector2D.dotProduct(mouseVect,projVect)
-
-
-        #pa = lastPt
-        #pb = QPoint( lastPt.x()+math.cos(ang), lastPt.y()+math.sin(ang))
-
-        #m = (pb.y() - pa.y()) / (pb.x() - pa.x())
-        #b = pa.y() - (m * pa.x())
-    
-        #x = (m * mousePt.y() + mousePt.x() - m * b) / (m * m + 1)
-        #y = (m * m * mousePt.y() + m * mousePt.x() + b) / (m * m + 1)
-
-        #return math.sqrt( (x-pa.x())*(x-pa.x()) + (y-pa.y())*(y-pa.y()) )
-
-
-
     def snapToBackgroundLayers(self, qgspoint):
         """
         Provides the snapping to the background layers considering the
@@ -417,15 +758,12 @@ class QgsMapToolCapturePolygon(QgsMapTool):
         @param {QgsPoint} qgspoint The point to snap in map coordinates
         @returns {QgsPoint} Snapped point in map coordinates
         """
-        # Transform it to pixel coordinates
-        pixels = self.toCanvasCoordinates(qgspoint)
         # Snap to the background layers according to the project properties
-        snapper = QgsMapCanvasSnapper(self.canvas)
-        snapped = snapper.snapToBackgroundLayers(QPoint(pixels.x(), pixels.y()))
+        with self.profiler.stage("snapping"):
+            snapped = self.snapIndex.snap(qgspoint)
         # If the point snaps, return this point
-        if len(snapped[1]) > 0:
-            # It seems to be necessary to create a new QgsPoint from the snapping result
-            return QgsPoint(snapped[1][0].snappedVertex.x(), snapped[1][0].snappedVertex.y())
+        if snapped is not None:
+            return snapped
 
         # If the point does not snap, return the input point
         return qgspoint
@@ -433,10 +771,11 @@ class QgsMapToolCapturePolygon(QgsMapTool):
     def clearMapCanvas(self):
         """
         Clears the map canvas and in particular the rubberband.
-        A warning is thrown when the markers are removed.
+        Only the rubberband and the markers item are redrawn, the layers are not.
         """
-        # Reset the capture list
-        self.captureList = []
+        # Reset the capture buffer
+        self.captureBuffer.clear()
+        self.figures.clear()
 
         # Reset the rubber band
 
@@ -447,8 +786,4 @@ class QgsMapToolCapturePolygon(QgsMapTool):
             self.rubberBand.reset(QGis.Line)
 
         # Delete also all vertex markers
-        for marker in self.vertexMarkers:
-            self.canvas.scene().removeItem(marker)
-            del marker
-  
-        self.canvas.refresh()
+        self.vertexMarkers.clear()
@@ -0,0 +1,166 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import json
+from functools import partial
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+def readTemplate():
+    """
+    Reads the default attribute template of the rapid-capture mode
+    @returns {dict} Field name -> default value
+    """
+    text = QSettings().value("/improvedpolygoncapturing/attributeTemplate", "{}")
+    try:
+        template = json.loads(text or "{}")
+    except ValueError:
+        QgsMessageLog.logMessage("Invalid attribute template: %s" % text, "Improved Polygon Capturing")
+        return {}
+    return template if isinstance(template, dict) else {}
+
+def templateAttributes(layer, template):
+    """
+    Returns the attributes of a new feature of the layer according to the template
+    (the fields missing from the template are NULL)
+    @returns {list} One value per field of the layer
+    """
+    return [template.get(field.name()) for field in layer.dataProvider().fields()]
+
+class CapturedFeatures(QObject):
+    """
+    Records the ids of the features added in rapid-capture mode, so that their
+    attributes can be filled in a single batch later on. Temporary ids are
+    replaced by the provider ids when the edits are saved (the features are
+    matched by geometry, which is followed through the edits of the recorded
+    features). Emits "changed" when the recorded ids change.
+    """
+    def __init__(self):
+        QObject.__init__(self)
+        # layer id -> {feature id: geometry as WKB}
+        self.layers = {}
+        # layer id -> list of (signal, slot) connected on the layer
+        self.layerConnections = {}
+        QObject.connect(QgsMapLayerRegistry.instance(), SIGNAL("layerWillBeRemoved(QString)"), self.removeLayer)
+
+    def add(self, layer, fid, geometry):
+        """
+        Records a captured feature
+        @param {QgsGeometry} geometry Geometry of the feature, used to follow its id through the commit
+        """
+        self.watchLayer(layer)
+        self.layers.setdefault(layer.id(), {})[fid] = geometry.asWkb()
+        self.emit(SIGNAL("changed"))
+
+    def ids(self, layer):
+        return sorted(self.layers.get(layer.id(), {}).keys())
+
+    def count(self, layer):
+        return len(self.layers.get(layer.id(), {}))
+
+    def clear(self, layer):
+        self.layers.pop(layer.id(), None)
+        self.emit(SIGNAL("changed"))
+
+    def watchLayer(self, layer):
+        layerId = layer.id()
+        if layerId in self.layerConnections:
+            return
+        connections = [
+            (SIGNAL("featureDeleted(QgsFeatureId)"), partial(self.featureDeleted, layerId)),
+            (SIGNAL("geometryChanged(QgsFeatureId,QgsGeometry&)"), partial(self.geometryChanged, layerId)),
+            (SIGNAL("committedFeaturesAdded(QString,QgsFeatureList)"), self.committedFeaturesAdded),
+        ]
+        for signal, slot in connections:
+            QObject.connect(layer, signal, slot)
+        self.layerConnections[layerId] = connections
+
+    def featureDeleted(self, layerId, fid):
+        features = self.layers.get(layerId)
+        if features is not None and features.pop(fid, None) is not None:
+            self.emit(SIGNAL("changed"))
+
+    def geometryChanged(self, layerId, fid, geometry):
+        """
+        Keeps the geometry of a recorded feature up to date (topological points inserted
+        by the next features, manual edits), so that it is still matched on commit
+        """
+        features = self.layers.get(layerId)
+        if features is not None and fid in features:
+            features[fid] = geometry.asWkb()
+
+    def committedFeaturesAdded(self, layerId, addedFeatures):
+        """
+        The edits were saved: the temporary ids of the recorded features are replaced by the provider ids
+        """
+        features = self.layers.get(layerId)
+        if not features:
+            return
+        temporaryIds = {}
+        for fid, wkb in features.items():
+            if fid < 0:
+                temporaryIds.setdefault(wkb, []).append(fid)
+        for feature in addedFeatures:
+            candidates = temporaryIds.get(feature.geometry().asWkb())
+            if candidates:
+                del features[candidates.pop()]
+                features[feature.id()] = feature.geometry().asWkb()
+        # Temporary ids which were not matched do not exist anymore
+        unmatched = sorted(fid for fids in temporaryIds.values() for fid in fids)
+        for fid in unmatched:
+            del features[fid]
+        if unmatched:
+            QgsMessageLog.logMessage("%d captured feature(s) could not be found after saving the layer, their attributes have to be filled by hand (temporary ids %s)"
+                                     % (len(unmatched), ", ".join(str(fid) for fid in unmatched)), "Improved Polygon Capturing", QgsMessageLog.WARNING)
+        self.emit(SIGNAL("changed"))
+
+    def removeLayer(self, layerId):
+        self.layers.pop(layerId, None)
+        self.layerConnections.pop(layerId, None)
+        self.emit(SIGNAL("changed"))
+
+    def fillAttributes(self, layer, attributes):
+        """
+        Sets the attributes of all recorded features of the layer in one edit command,
+        then forgets them
+        @param {list} attributes One value per field, None or NULL (the fields left empty
+                                 in the attribute form) leaves the field unchanged
+        @returns {int} Number of updated features
+        """
+        ids = self.ids(layer)
+        values = [(index, value) for index, value in enumerate(attributes)
+                  if value is not None and not isinstance(value, QPyNullVariant)]
+        if not ids or not values:
+            return 0
+        layer.beginEditCommand(QCoreApplication.translate("ImprovedPolygonCapturing", "Fill attributes of captured features"))
+        try:
+            for fid in ids:
+                for index, value in values:
+                    layer.changeAttributeValue(fid, index, value)
+        except:
+            layer.destroyEditCommand()
+            raise
+        layer.endEditCommand()
+        layer.triggerRepaint()
+        self.clear(layer)
+        return len(ids)
@@ -0,0 +1,100 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import math
+
+class RunningFigures(object):
+    """
+    Area, length and closing distance of the vertices being captured, updated
+    in constant time per added or removed vertex (shoelace running sum and
+    cumulated length) instead of being computed from a geometry. The coordinates are kept
+    relative to the first vertex: the sums stay precise with large map
+    coordinates, and the closing edge adds nothing to the shoelace sum.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # First vertex, None if there is none
+        self.origin = None
+        # Last vertex relative to the first one
+        self.last = (0.0, 0.0)
+        self.count = 0
+        # Twice the signed area of the captured vertices (shoelace sum without the closing edge)
+        self.doubleArea = 0.0
+        # Length of the captured edges
+        self.length = 0.0
+        # Preview vertex relative to the first one, None if the mouse did not move since the last vertex
+        self.preview = None
+
+    def add(self, x, y):
+        """
+        Adds a captured vertex
+        """
+        self.preview = None
+        self.count += 1
+        if self.origin is None:
+            self.origin = (x, y)
+            self.last = (0.0, 0.0)
+            return
+        x -= self.origin[0]
+        y -= self.origin[1]
+        lastX, lastY = self.last
+        self.doubleArea += lastX * y - x * lastY
+        self.length += math.hypot(x - lastX, y - lastY)
+        self.last = (x, y)
+
+    def removeLast(self, previous):
+        """
+        Removes the last vertex
+        @param {tuple} previous (x, y) of the vertex which becomes the last one, None if no vertex is left
+        """
+        if previous is None:
+            self.clear()
+            return
+        x, y = self.last
+        previousX = previous[0] - self.origin[0]
+        previousY = previous[1] - self.origin[1]
+        self.doubleArea -= previousX * y - x * previousY
+        self.length -= math.hypot(x - previousX, y - previousY)
+        self.last = (previousX, previousY)
+        self.count -= 1
+
+    def setPreview(self, x, y):
+        """
+        Sets the position of the vertex following the mouse
+        """
+        if self.origin is not None:
+            self.preview = (x - self.origin[0], y - self.origin[1])
+
+    def current(self):
+        """
+        Returns the figures of the captured vertices followed by the preview vertex
+        @returns {tuple} (area of the closed ring, length of the edges, distance from the
+                         last vertex back to the first one), None if there is no vertex
+        """
+        if self.origin is None:
+            return None
+        lastX, lastY = self.last
+        x, y = self.preview if self.preview is not None else self.last
+        area = abs(self.doubleArea + lastX * y - x * lastY) / 2.0
+        return area, self.length + math.hypot(x - lastX, y - lastY), math.hypot(x, y)
@@ -0,0 +1,324 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import math
+import marshal
+
+class SnapGrid(object):
+    """
+    Uniform grid holding the vertices and segments of one layer. It does not
+    depend on QGIS, so that it can be filled from any coordinate source.
+    Vertices are numbered like QgsGeometry numbers them (closing vertices of
+    rings included), so that the results can be used to edit the geometries.
+    """
+    # In a grid without coverage, a segment crossing more cells than this is only kept
+    # in its end cells (the segments of the other grids are clipped to their coverage)
+    maxCellsPerSegment = 4096
+
+    def __init__(self, cellSize, coverage=None):
+        """
+        @param {float} cellSize Size of a grid cell in layer units
+        @param {tuple} coverage (xmin, ymin, xmax, ymax) area for which the grid holds all features
+        """
+        self.cellSize = float(cellSize)
+        self.coverage = coverage
+        self.clear()
+
+    def clear(self):
+        """
+        Removes all features from the grid
+        """
+        # (i,j) -> {fid: [(x, y, vertexIndex), ...]}
+        self.vertexCells = {}
+        # (i,j) -> {fid: [(x1, y1, x2, y2, afterVertexIndex), ...]}
+        self.segmentCells = {}
+        # fid -> (vertex cell keys, segment cell keys)
+        self.featureCells = {}
+
+    def covers(self, xmin, ymin, xmax, ymax):
+        """
+        Returns True if the given rectangle is within the area the grid was filled for
+        """
+        if self.coverage is None:
+            return False
+        return self.coverage[0] <= xmin and self.coverage[1] <= ymin and self.coverage[2] >= xmax and self.coverage[3] >= ymax
+
+    def overlaps(self, xmin, ymin, xmax, ymax):
+        """
+        Returns True if the given rectangle touches the area the grid was filled for
+        """
+        if self.coverage is None:
+            return False
+        return self.coverage[0] <= xmax and self.coverage[1] <= ymax and self.coverage[2] >= xmin and self.coverage[3] >= ymin
+
+    def dump(self, fileObject):
+        """
+        Writes the grid to an opened binary file (marshal format, so that it is read back at C speed)
+        """
+        marshal.dump((self.cellSize, self.coverage, self.vertexCells, self.segmentCells, self.featureCells), fileObject)
+
+    @classmethod
+    def load(cls, fileObject):
+        """
+        Reads a grid written by dump
+        @returns {SnapGrid}
+        """
+        cellSize, coverage, vertexCells, segmentCells, featureCells = marshal.load(fileObject)
+        grid = cls(cellSize, coverage)
+        grid.vertexCells = vertexCells
+        grid.segmentCells = segmentCells
+        grid.featureCells = featureCells
+        return grid
+
+    def cellKey(self, x, y):
+        return (int(math.floor(x / self.cellSize)), int(math.floor(y / self.cellSize)))
+
+    def addFeature(self, fid, parts, withSegments=True):
+        """
+        Adds the vertices (and segments) of a feature to the grid
+        @param {int} fid Feature id
+        @param {list} parts List of vertex sequences [(x,y), ...] in geometry order (one per ring or line)
+        @param {bool} withSegments False for point geometries
+        """
+        if fid in self.featureCells:
+            self.removeFeature(fid)
+
+        vertexKeys = set()
+        segmentKeys = set()
+        vertexIndex = 0
+        for part in parts:
+            lastX = lastY = None
+            for x, y in part:
+                key = self.cellKey(x, y)
+                self.vertexCells.setdefault(key, {}).setdefault(fid, []).append((x, y, vertexIndex))
+                vertexKeys.add(key)
+                if withSegments and lastX is not None:
+                    segment = (lastX, lastY, x, y, vertexIndex)
+                    for key in self.segmentCellKeys(lastX, lastY, x, y):
+                        self.segmentCells.setdefault(key, {}).setdefault(fid, []).append(segment)
+                        segmentKeys.add(key)
+                lastX, lastY = x, y
+                vertexIndex += 1
+
+        self.featureCells[fid] = (vertexKeys, segmentKeys)
+
+    def removeFeature(self, fid):
+        """
+        Removes a feature from the grid. The cost only depends on the feature size.
+        @param {int} fid Feature id
+        """
+        keys = self.featureCells.pop(fid, None)
+        if keys is None:
+            return
+        for cells, cellKeys in ((self.vertexCells, keys[0]), (self.segmentCells, keys[1])):
+            for key in cellKeys:
+                cell = cells.get(key)
+                if cell is None:
+                    continue
+                cell.pop(fid, None)
+                if not cell:
+                    del cells[key]
+
+    def clipSegment(self, x1, y1, x2, y2):
+        """
+        Clips a segment to the coverage enlarged by one cell (Liang-Barsky)
+        @returns {tuple} (x1, y1, x2, y2) of the clipped segment, None if it is outside the coverage
+        """
+        xmin = self.coverage[0] - self.cellSize
+        ymin = self.coverage[1] - self.cellSize
+        xmax = self.coverage[2] + self.cellSize
+        ymax = self.coverage[3] + self.cellSize
+        dx = x2 - x1
+        dy = y2 - y1
+        t0 = 0.0
+        t1 = 1.0
+        for p, q in ((-dx, x1 - xmin), (dx, xmax - x1), (-dy, y1 - ymin), (dy, ymax - y1)):
+            if p == 0:
+                if q < 0:
+                    return None
+                continue
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+        return x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy
+
+    def segmentCellKeys(self, x1, y1, x2, y2):
+        """
+        Returns the keys of the cells crossed by a segment (grid traversal), only
+        within the coverage of the grid
+        """
+        if self.coverage is not None:
+            clipped = self.clipSegment(x1, y1, x2, y2)
+            if clipped is None:
+                return []
+            x1, y1, x2, y2 = clipped
+        i, j = self.cellKey(x1, y1)
+        iEnd, jEnd = self.cellKey(x2, y2)
+        keys = [(i, j)]
+        steps = abs(iEnd - i) + abs(jEnd - j)
+        if steps == 0:
+            return keys
+        if steps > self.maxCellsPerSegment:
+            keys.append((iEnd, jEnd))
+            return keys
+
+        dx = x2 - x1
+        dy = y2 - y1
+        stepI = 1 if dx > 0 else -1
+        stepJ = 1 if dy > 0 else -1
+        if dx != 0:
+            tDeltaX = abs(self.cellSize / dx)
+            tMaxX = ((i + (1 if dx > 0 else 0)) * self.cellSize - x1) / dx
+        else:
+            tDeltaX = tMaxX = float("inf")
+        if dy != 0:
+            tDeltaY = abs(self.cellSize / dy)
+            tMaxY = ((j + (1 if dy > 0 else 0)) * self.cellSize - y1) / dy
+        else:
+            tDeltaY = tMaxY = float("inf")
+
+        for step in range(steps):
+            if (tMaxX < tMaxY and i != iEnd) or j == jEnd:
+                tMaxX += tDeltaX
+                i += stepI
+            else:
+                tMaxY += tDeltaY
+                j += stepJ
+            keys.append((i, j))
+        return keys
+
+    def cellsAround(self, cells, x, y, tolerance):
+        """
+        Yields the content of the cells overlapping the square of size 2*tolerance around x,y
+        """
+        iMin, jMin = self.cellKey(x - tolerance, y - tolerance)
+        iMax, jMax = self.cellKey(x + tolerance, y + tolerance)
+        if (iMax - iMin + 1) * (jMax - jMin + 1) > len(cells):
+            # The search square is larger than the filled part of the grid
+            for key, cell in cells.items():
+                if iMin <= key[0] <= iMax and jMin <= key[1] <= jMax:
+                    yield cell
+            return
+        for i in range(iMin, iMax + 1):
+            for j in range(jMin, jMax + 1):
+                cell = cells.get((i, j))
+                if cell is not None:
+                    yield cell
+
+    def nearestVertex(self, x, y, tolerance):
+        """
+        Returns the nearest vertex within tolerance
+        @returns {tuple} (distance, x, y, fid, vertexIndex) or None
+        """
+        best = None
+        bestSqr = tolerance * tolerance
+        for cell in self.cellsAround(self.vertexCells, x, y, tolerance):
+            for fid, vertices in cell.items():
+                for vx, vy, vertexIndex in vertices:
+                    sqr = (vx - x) * (vx - x) + (vy - y) * (vy - y)
+                    if sqr <= bestSqr:
+                        bestSqr = sqr
+                        best = (vx, vy, fid, vertexIndex)
+        if best is None:
+            return None
+        return (math.sqrt(bestSqr),) + best
+
+    def nearestSegment(self, x, y, tolerance):
+        """
+        Returns the nearest point on a segment within tolerance
+        @returns {tuple} (distance, x, y, fid, afterVertexIndex) or None
+        """
+        best = None
+        bestSqr = tolerance * tolerance
+        for cell in self.cellsAround(self.segmentCells, x, y, tolerance):
+            for fid, segments in cell.items():
+                for x1, y1, x2, y2, afterVertex in segments:
+                    dx = x2 - x1
+                    dy = y2 - y1
+                    lengthSqr = dx * dx + dy * dy
+                    if lengthSqr == 0:
+                        continue
+                    t = ((x - x1) * dx + (y - y1) * dy) / lengthSqr
+                    if t < 0.0:
+                        t = 0.0
+                    elif t > 1.0:
+                        t = 1.0
+                    px = x1 + t * dx
+                    py = y1 + t * dy
+                    sqr = (px - x) * (px - x) + (py - y) * (py - y)
+                    if sqr <= bestSqr:
+                        bestSqr = sqr
+                        best = (px, py, fid, afterVertex)
+        if best is None:
+            return None
+        return (math.sqrt(bestSqr),) + best
+
+    def featuresWithVertexNear(self, x, y, tolerance):
+        """
+        Returns the ids of the features having a vertex within tolerance
+        @returns {set}
+        """
+        result = set()
+        toleranceSqr = tolerance * tolerance
+        for cell in self.cellsAround(self.vertexCells, x, y, tolerance):
+            for fid, vertices in cell.items():
+                if fid in result:
+                    continue
+                for vx, vy, vertexIndex in vertices:
+                    if (vx - x) * (vx - x) + (vy - y) * (vy - y) <= toleranceSqr:
+                        result.add(fid)
+                        break
+        return result
+
+    def segmentsNear(self, x, y, tolerance):
+        """
+        Returns, for each feature, the nearest segment passing within tolerance
+        of a point which lies strictly between its end vertices
+        @returns {dict} fid -> (afterVertexIndex, position of the point along the segment between 0 and 1)
+        """
+        result = {}
+        bestSqr = {}
+        toleranceSqr = tolerance * tolerance
+        for cell in self.cellsAround(self.segmentCells, x, y, tolerance):
+            for fid, segments in cell.items():
+                for x1, y1, x2, y2, afterVertex in segments:
+                    dx = x2 - x1
+                    dy = y2 - y1
+                    lengthSqr = dx * dx + dy * dy
+                    if lengthSqr == 0:
+                        continue
+                    t = ((x - x1) * dx + (y - y1) * dy) / lengthSqr
+                    if t <= 0.0 or t >= 1.0:
+                        continue
+                    px = x1 + t * dx
+                    py = y1 + t * dy
+                    sqr = (px - x) * (px - x) + (py - y) * (py - y)
+                    if sqr <= toleranceSqr and sqr < bestSqr.get(fid, float("inf")):
+                        bestSqr[fid] = sqr
+                        result[fid] = (afterVertex, t)
+        return result
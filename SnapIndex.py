@@ -0,0 +1,637 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import hashlib
+import itertools
+import marshal
+import os
+import sys
+import threading
+from functools import partial
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+from DigitizingSettings import DigitizingSettings
+from SnapGrid import SnapGrid
+from TransformCache import TransformCache
+
+def geometryParts(geometry):
+    """
+    Returns the vertex sequences of a geometry in QgsGeometry vertex order
+    @param {QgsGeometry} geometry
+    @returns {tuple} (list of [(x,y), ...], bool True if the geometry has segments)
+    """
+    if geometry is None:
+        return [], False
+    geometryType = geometry.type()
+    if geometryType == QGis.Polygon:
+        if geometry.isMultipart():
+            rings = [ring for polygon in geometry.asMultiPolygon() for ring in polygon]
+        else:
+            rings = geometry.asPolygon()
+        return [[(p.x(), p.y()) for p in ring] for ring in rings], True
+    if geometryType == QGis.Line:
+        if geometry.isMultipart():
+            lines = geometry.asMultiPolyline()
+        else:
+            lines = [geometry.asPolyline()]
+        return [[(p.x(), p.y()) for p in line] for line in lines], True
+    if geometryType == QGis.Point:
+        if geometry.isMultipart():
+            points = geometry.asMultiPoint()
+        else:
+            points = [geometry.asPoint()]
+        return [[(p.x(), p.y()) for p in points]], False
+    return [], False
+
+class SnapIndex(object):
+    """
+    Snapping engine of the plugin. It keeps a SnapGrid of the vertices and
+    segments of each snappable layer around the visible extent, and answers
+    the snapping queries of the map tool without asking the data providers.
+    The project snapping settings (mode, layers, type, tolerance) are followed.
+    Queries are split in three steps (prepareQuery, runQuery, finishQuery) so
+    that the grid work can run in a SnapWorker thread; the grids are guarded
+    by a lock since the edit signals patch them from the GUI thread.
+    """
+    # The grid covers the visible extent enlarged by this factor on each side
+    coverageMargin = 0.5
+    # Maximal number of cells along the coverage diagonal (the cells are larger in wide views)
+    maxCellsAcross = 1024
+    # Version of the cache files, to be increased when the SnapGrid content changes
+    cacheVersion = 3
+
+    def __init__(self, canvas, digitizingSettings=None, transforms=None):
+        self.canvas = canvas
+        # Cached transforms between the layers and the canvas
+        self.transforms = transforms if transforms is not None else TransformCache(canvas)
+        # layer id -> (canvas extent, transform, extent in layer coordinates) of the last layerExtent call
+        self.layerExtents = {}
+        # QGIS digitizing options (default snapping when the project does not set it)
+        self.digitizingSettings = digitizingSettings if digitizingSettings is not None else DigitizingSettings()
+        # layer id -> SnapGrid
+        self.grids = {}
+        # Guards the grids (queries may run in the snapping thread)
+        self.lock = threading.RLock()
+        # Cached list of (layer, toVertex, toSegment, tolerance, unit), None if not read yet
+        self.layerSettings = None
+        # Current layer when the settings were read (used by the "current_layer" mode)
+        self.settingsLayer = None
+        # layer id -> (layer, [(signal, slot), ...]) of the edit signals patching the grid
+        self.layerConnections = {}
+        # layer id -> set of the temporary (not yet committed) feature ids in the grid
+        self.temporaryIds = {}
+        # layer id -> number of edit signals received, a grid filled during an edit is not used
+        self.editCounts = {}
+        # layer ids whose grid is being filled by the snapping thread (see gridTask)
+        self.building = set()
+        # layer id -> {key: geometry} of the features queued by a capture session, not in the layer yet
+        self.pendingGeometries = {}
+        self.pendingKeys = itertools.count(1)
+        QObject.connect(QgsProject.instance(), SIGNAL("snapSettingsChanged()"), self.invalidateSettings)
+        QObject.connect(self.canvas, SIGNAL("layersChanged()"), self.invalidateSettings)
+        QObject.connect(QgsMapLayerRegistry.instance(), SIGNAL("layerWillBeRemoved(QString)"), self.removeLayer)
+
+    def invalidateSettings(self):
+        self.layerSettings = None
+
+    def removeLayer(self, layerId):
+        self.invalidateLayer(layerId)
+        self.pendingGeometries.pop(layerId, None)
+        self.layerExtents.pop(layerId, None)
+        self.layerSettings = None
+
+    def invalidateLayer(self, layerId):
+        """
+        Drops the grid of a layer and stops listening to its edits
+        """
+        with self.lock:
+            self.editCounts[layerId] = self.editCounts.get(layerId, 0) + 1
+            self.grids.pop(layerId, None)
+            self.temporaryIds.pop(layerId, None)
+        layer, connections = self.layerConnections.pop(layerId, (None, []))
+        for signal, slot in connections:
+            QObject.disconnect(layer, SIGNAL(signal), slot)
+
+    def clear(self):
+        """
+        Drops all the grids (they are rebuilt on the next query)
+        """
+        for layerId in list(self.grids.keys()):
+            self.invalidateLayer(layerId)
+
+    def watchLayer(self, layer):
+        """
+        Connects the edit signals of a layer, so that its grid is patched
+        feature by feature instead of being rebuilt
+        """
+        layerId = layer.id()
+        if layerId in self.layerConnections:
+            return
+        connections = [
+            ("featureAdded(QgsFeatureId)", partial(self.featureAdded, layer)),
+            ("featureDeleted(QgsFeatureId)", partial(self.featureDeleted, layerId)),
+            ("geometryChanged(QgsFeatureId,QgsGeometry&)", partial(self.geometryChanged, layerId)),
+            ("committedFeaturesAdded(QString,QgsFeatureList)", self.committedFeaturesAdded),
+            ("editingStopped()", partial(self.editingStopped, layerId)),
+        ]
+        for signal, slot in connections:
+            QObject.connect(layer, SIGNAL(signal), slot)
+        self.layerConnections[layerId] = (layer, connections)
+
+    def addToGrid(self, grid, fid, geometry):
+        """
+        Adds a feature to a grid if it touches the area covered by the grid
+        """
+        if geometry is None:
+            return
+        box = geometry.boundingBox()
+        if not grid.overlaps(box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum()):
+            # Make sure an older version of the feature does not stay in the grid
+            grid.removeFeature(fid)
+            return
+        parts, withSegments = geometryParts(geometry)
+        grid.addFeature(fid, parts, withSegments)
+
+    def addPendingGeometry(self, layer, geometry):
+        """
+        Adds the geometry of a feature queued by a capture session, so that the next
+        features snap to it before it is added to the layer (see clearPendingGeometries)
+        @param {QgsGeometry} geometry Geometry in layer coordinates
+        """
+        with self.lock:
+            # Tuple keys never collide with the feature ids
+            key = ("pending", next(self.pendingKeys))
+            self.pendingGeometries.setdefault(layer.id(), {})[key] = geometry
+            grid = self.grids.get(layer.id())
+            if grid is not None:
+                self.addToGrid(grid, key, geometry)
+
+    def clearPendingGeometries(self, layerId):
+        """
+        Removes the queued geometries of a layer (they were added to the layer, or dropped)
+        """
+        with self.lock:
+            grid = self.grids.get(layerId)
+            for key in self.pendingGeometries.pop(layerId, {}):
+                if grid is not None:
+                    grid.removeFeature(key)
+
+    def edited(self, layerId):
+        self.editCounts[layerId] = self.editCounts.get(layerId, 0) + 1
+
+    def featureAdded(self, layer, fid):
+        with self.lock:
+            self.edited(layer.id())
+            grid = self.grids.get(layer.id())
+            if grid is None:
+                return
+            request = QgsFeatureRequest(fid).setSubsetOfAttributes([])
+            for feature in layer.getFeatures(request):
+                self.addToGrid(grid, fid, feature.geometry())
+            if fid < 0:
+                self.temporaryIds.setdefault(layer.id(), set()).add(fid)
+
+    def featureDeleted(self, layerId, fid):
+        with self.lock:
+            self.edited(layerId)
+            grid = self.grids.get(layerId)
+            if grid is None:
+                return
+            grid.removeFeature(fid)
+            self.temporaryIds.get(layerId, set()).discard(fid)
+
+    def geometryChanged(self, layerId, fid, geometry):
+        with self.lock:
+            self.edited(layerId)
+            grid = self.grids.get(layerId)
+            if grid is None:
+                return
+            self.addToGrid(grid, fid, geometry)
+
+    def committedFeaturesAdded(self, layerId, features):
+        """
+        The added features got their final ids while saving the layer
+        """
+        with self.lock:
+            self.edited(layerId)
+            grid = self.grids.get(layerId)
+            if grid is None:
+                return
+            for feature in features:
+                self.addToGrid(grid, feature.id(), feature.geometry())
+
+    def editingStopped(self, layerId):
+        """
+        Removes the temporary ids of the added features. After a commit the features are
+        already back with their final ids, after a rollback they do not exist anymore.
+        """
+        with self.lock:
+            self.edited(layerId)
+            grid = self.grids.get(layerId)
+            for fid in self.temporaryIds.pop(layerId, set()):
+                if grid is not None:
+                    grid.removeFeature(fid)
+
+    def readSettings(self):
+        """
+        Reads the project snapping settings
+        @returns {list} List of (layer, toVertex, toSegment, tolerance, unit)
+        """
+        project = QgsProject.instance()
+        options = self.digitizingSettings
+        registry = QgsMapLayerRegistry.instance()
+        snappingMode = project.readEntry("Digitizing", "/SnappingMode", "current_layer")[0]
+        result = []
+
+        if snappingMode == "advanced":
+            layerIds = project.readListEntry("Digitizing", "/LayerSnappingList")[0]
+            enabledList = project.readListEntry("Digitizing", "/LayerSnappingEnabledList")[0]
+            snapToList = project.readListEntry("Digitizing", "/LayerSnapToList")[0]
+            toleranceList = project.readListEntry("Digitizing", "/LayerSnappingToleranceList")[0]
+            unitList = project.readListEntry("Digitizing", "/LayerSnappingToleranceUnitList")[0]
+            for i in range(len(layerIds)):
+                layer = registry.mapLayer(layerIds[i])
+                if layer is None or layer.type() != QgsMapLayer.VectorLayer:
+                    continue
+                if i >= len(enabledList) or enabledList[i] != "enabled":
+                    continue
+                snapTo = snapToList[i] if i < len(snapToList) else "to_vertex"
+                tolerance = float(toleranceList[i]) if i < len(toleranceList) else 0.0
+                unit = int(unitList[i]) if i < len(unitList) else 0
+                result.append((layer, "vertex" in snapTo, "segment" in snapTo, tolerance, unit))
+            return result
+
+        snapType = project.readEntry("Digitizing", "/DefaultSnapType", options.defaultSnapMode)[0]
+        tolerance = project.readDoubleEntry("Digitizing", "/DefaultSnapTolerance", options.defaultSnapTolerance)[0]
+        unit = project.readNumEntry("Digitizing", "/DefaultSnapToleranceUnit", options.defaultSnapToleranceUnit)[0]
+        if snapType == "off":
+            return result
+
+        if snappingMode == "all_layers":
+            layers = [layer for layer in self.canvas.layers() if layer.type() == QgsMapLayer.VectorLayer]
+        else:
+            layer = self.canvas.currentLayer()
+            layers = [layer] if layer is not None and layer.type() == QgsMapLayer.VectorLayer else []
+        for layer in layers:
+            result.append((layer, "vertex" in snapType, "segment" in snapType, tolerance, unit))
+        return result
+
+    def snappingLayers(self):
+        if self.layerSettings is None or self.settingsLayer is not self.canvas.currentLayer():
+            self.settingsLayer = self.canvas.currentLayer()
+            self.layerSettings = self.readSettings()
+        return self.layerSettings
+
+    def layerTolerance(self, layer, tolerance, unit):
+        """
+        Converts a project tolerance to layer units at the current scale
+        """
+        return QgsTolerance.toleranceInMapUnits(tolerance, layer, self.canvas.mapRenderer(), QgsTolerance.UnitType(unit))
+
+    def layerExtent(self, layer):
+        """
+        Returns the visible extent in layer coordinates (reprojected only when the canvas moved)
+        """
+        extent = self.canvas.extent()
+        transform = self.transforms.transform(layer)
+        cached = self.layerExtents.get(layer.id())
+        if cached is not None and cached[0] == extent and cached[1] is transform:
+            return cached[2]
+        layerExtent = self.transforms.rectToLayer(layer, extent)
+        self.layerExtents[layer.id()] = (extent, transform, layerExtent)
+        return layerExtent
+
+    def gridFor(self, layer, tolerance, extent=None):
+        """
+        Returns the grid of a layer, (re)building it if it does not cover the visible extent
+        @param {QgsVectorLayer} layer
+        @param {float} tolerance The snapping tolerance in layer units (used to size the cells)
+        @param {QgsRectangle} extent The visible extent in layer coordinates (read from the canvas if None)
+        @returns {SnapGrid}
+        """
+        if extent is None:
+            extent = self.layerExtent(layer)
+        self.watchLayer(layer)
+        with self.lock:
+            return self.coveringGrid(layer, tolerance, extent)
+
+    def coveringGrid(self, layer, tolerance, extent):
+        """
+        Returns the grid of a layer covering the extent. The caller holds the lock
+        and has connected the edit signals of the layer (see watchLayer).
+        """
+        grid = self.grids.get(layer.id())
+        if grid is not None and grid.covers(extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()):
+            return grid
+
+        grid = self.loadCache(layer, extent)
+        if grid is not None:
+            self.grids[layer.id()] = grid
+            self.temporaryIds[layer.id()] = set()
+            self.addPendingToGrid(grid, layer.id())
+            return grid
+
+        grid = self.emptyGrid(tolerance, extent)
+        self.temporaryIds[layer.id()] = self.fillGrid(grid, layer)
+        self.grids[layer.id()] = grid
+        self.saveCache(layer, grid)
+        # Added after saving, the queued geometries are not part of the datasource
+        self.addPendingToGrid(grid, layer.id())
+        return grid
+
+    def emptyGrid(self, tolerance, extent):
+        """
+        Returns an empty grid covering the extent with a margin, with cells sized for the tolerance
+        """
+        marginX = extent.width() * self.coverageMargin
+        marginY = extent.height() * self.coverageMargin
+        coverage = (extent.xMinimum() - marginX, extent.yMinimum() - marginY, extent.xMaximum() + marginX, extent.yMaximum() + marginY)
+        diagonal = ((coverage[2] - coverage[0]) ** 2 + (coverage[3] - coverage[1]) ** 2) ** 0.5
+        cellSize = max(2.0 * tolerance, diagonal / self.maxCellsAcross)
+        if cellSize <= 0:
+            cellSize = 1.0
+        return SnapGrid(cellSize, coverage)
+
+    def gridTask(self, layer, tolerance, extent):
+        """
+        Collects what the snapping thread needs to fill the grid of a layer: the cache file and
+        a feature source, a snapshot of the layer and its edit buffer (GUI thread only)
+        @returns {tuple} Task for buildGrid, None if the grid covers the extent or is already being filled
+        """
+        self.watchLayer(layer)
+        layerId = layer.id()
+        with self.lock:
+            grid = self.grids.get(layerId)
+            if grid is not None and grid.covers(extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()):
+                return None
+            if layerId in self.building:
+                return None
+            self.building.add(layerId)
+            editCount = self.editCounts.get(layerId, 0)
+        key = self.cacheKey(layer)
+        path = self.cachePath(layer) if key is not None else None
+        return (layerId, editCount, key, path, tolerance, QgsRectangle(extent), QgsVectorLayerFeatureSource(layer))
+
+    def buildGrid(self, task):
+        """
+        Loads or fills the grid of a task of gridTask (may run in any thread), and uses it
+        unless the layer was edited in the meantime (it is then filled again on the next query)
+        """
+        layerId, editCount, key, path, tolerance, extent, source = task
+        try:
+            grid = self.readCache(path, key, extent) if key is not None else None
+            temporaryIds = set()
+            if grid is None:
+                grid = self.emptyGrid(tolerance, extent)
+                temporaryIds = self.fillGrid(grid, source)
+                if key is not None:
+                    self.writeCache(path, key, grid)
+            with self.lock:
+                if self.editCounts.get(layerId, 0) == editCount:
+                    self.grids[layerId] = grid
+                    self.temporaryIds[layerId] = temporaryIds
+                    self.addPendingToGrid(grid, layerId)
+        finally:
+            self.dropTask(task)
+
+    def dropTask(self, task):
+        """
+        Allows a new task for the layer of a task which was run or dropped
+        """
+        with self.lock:
+            self.building.discard(task[0])
+
+    def addPendingToGrid(self, grid, layerId):
+        for key, geometry in self.pendingGeometries.get(layerId, {}).items():
+            self.addToGrid(grid, key, geometry)
+
+    def fillGrid(self, grid, source):
+        """
+        Adds all features of a layer or feature source intersecting the coverage to the grid
+        @returns {set} The temporary (not yet committed) feature ids added to the grid
+        """
+        coverage = grid.coverage
+        request = QgsFeatureRequest().setFilterRect(QgsRectangle(coverage[0], coverage[1], coverage[2], coverage[3])).setSubsetOfAttributes([])
+        temporaryIds = set()
+        for feature in source.getFeatures(request):
+            parts, withSegments = geometryParts(feature.geometry())
+            grid.addFeature(feature.id(), parts, withSegments)
+            if feature.id() < 0:
+                temporaryIds.add(feature.id())
+        return temporaryIds
+
+    def prepare(self):
+        """
+        Loads or builds the grids of all snappable layers for the visible extent
+        (used when the tool is activated, so that the first mouse moves are fast)
+        """
+        for layer, toVertex, toSegment, tolerance, unit in self.snappingLayers():
+            layerTolerance = self.layerTolerance(layer, tolerance, unit)
+            if layerTolerance > 0:
+                self.gridFor(layer, layerTolerance)
+
+    def addTopologicalPoints(self, layer, geometry):
+        """
+        Inserts the vertices of a new geometry into the segments of the layer
+        features they lie on (like QgsVectorLayer.addTopologicalPoints, but only
+        the features found in the grid around the new vertices are touched).
+        The vertices are inserted feature by feature, from the last one.
+        @param {QgsGeometry} geometry New geometry in layer coordinates
+        @returns {bool} False if the grid of the layer does not cover the geometry (nothing was inserted)
+        """
+        # Same search distance as QGIS
+        epsilon = 1e-12 if layer.crs().geographicFlag() else 1e-8
+        box = geometry.boundingBox()
+        grid = self.gridFor(layer, 0.0)
+        insertions = {}
+        with self.lock:
+            if not grid.covers(box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum()):
+                return False
+            pending = self.pendingGeometries.get(layer.id(), {})
+            parts, withSegments = geometryParts(geometry)
+            for part in parts:
+                for x, y in part:
+                    segments = grid.segmentsNear(x, y, epsilon)
+                    if not segments:
+                        continue
+                    withVertex = grid.featuresWithVertexNear(x, y, epsilon)
+                    for fid, (afterVertex, t) in segments.items():
+                        # The queued geometries get their vertices once they are in the layer
+                        if fid not in withVertex and fid not in pending:
+                            insertions.setdefault(fid, set()).add((afterVertex, t, x, y))
+
+        # Inserting from the end keeps the indexes of the remaining insertions valid
+        for fid, points in insertions.items():
+            for afterVertex, t, x, y in sorted(points, reverse=True):
+                layer.insertVertex(x, y, fid, afterVertex)
+        return True
+
+    def cacheKey(self, layer):
+        """
+        Returns the key identifying the current state of a layer datasource, or None if
+        the layer cannot be cached (pending edits or no modification time from the provider)
+        """
+        if layer.isModified():
+            return None
+        timestamp = layer.dataProvider().dataTimestamp()
+        if not timestamp.isValid():
+            return None
+        return "%s|%s|%s|%s" % (layer.source(), layer.crs().authid(), timestamp.toString(Qt.ISODate), self.cacheVersion)
+
+    def cachePath(self, layer):
+        """
+        Returns the path of the cache file of a layer (one file per datasource and CRS)
+        """
+        directory = os.path.join(QgsApplication.qgisSettingsDirPath(), "improvedpolygoncapturing", "snapcache")
+        name = hashlib.sha1(("%s|%s" % (layer.source(), layer.crs().authid())).encode("utf-8")).hexdigest()
+        # Marshal files are specific to the Python version
+        return os.path.join(directory, "%s-py%d%d.grid" % (name, sys.version_info[0], sys.version_info[1]))
+
+    def loadCache(self, layer, extent):
+        """
+        Reads the cached grid of a layer. The header holds the key and the coverage,
+        so that a stale or too small grid is rejected without reading its content.
+        @param {QgsRectangle} extent The extent the grid has to cover, in layer coordinates
+        @returns {SnapGrid} The grid or None if there is no valid cache
+        """
+        key = self.cacheKey(layer)
+        if key is None:
+            return None
+        return self.readCache(self.cachePath(layer), key, extent)
+
+    def readCache(self, path, key, extent):
+        """
+        Reads a cache file (may run in any thread, see loadCache)
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as cacheFile:
+                cachedKey, coverage = marshal.load(cacheFile)
+                if cachedKey != key:
+                    return None
+                if coverage is None or coverage[0] > extent.xMinimum() or coverage[1] > extent.yMinimum() \
+                        or coverage[2] < extent.xMaximum() or coverage[3] < extent.yMaximum():
+                    return None
+                return SnapGrid.load(cacheFile)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def saveCache(self, layer, grid):
+        """
+        Writes the grid of a layer to its cache file
+        """
+        key = self.cacheKey(layer)
+        if key is None:
+            return
+        self.writeCache(self.cachePath(layer), key, grid)
+
+    def writeCache(self, path, key, grid):
+        """
+        Writes a cache file (may run in any thread, see saveCache)
+        """
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Write to a temporary file first, so that an interrupted write never leaves a broken cache
+            with open(path + ".tmp", "wb") as cacheFile:
+                marshal.dump((key, grid.coverage), cacheFile)
+                grid.dump(cacheFile)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError):
+            QgsMessageLog.logMessage("Could not write the snapping cache %s" % path, "Improved Polygon Capturing")
+
+    def prepareQuery(self, qgspoint, tasks=None):
+        """
+        Collects everything a snapping query needs from the canvas (GUI thread only).
+        The grids not covering the visible extent yet are built here, or by the snapping
+        thread if a task list is given (the layer is then not snapped to until its grid is ready).
+        @param {QgsPoint} qgspoint The point to snap in map coordinates
+        @param {list} tasks Receives the tasks of the missing grids (see gridTask)
+        @returns {list} List of (layer, x, y, tolerance, toVertex, toSegment, extent) in layer coordinates
+        """
+        query = []
+        for layer, toVertex, toSegment, tolerance, unit in self.snappingLayers():
+            layerTolerance = self.layerTolerance(layer, tolerance, unit)
+            if layerTolerance <= 0:
+                continue
+            layerPt = self.transforms.toLayer(layer, qgspoint)
+            extent = self.layerExtent(layer)
+            if tasks is None:
+                self.gridFor(layer, layerTolerance, extent)
+            else:
+                task = self.gridTask(layer, layerTolerance, extent)
+                if task is not None:
+                    tasks.append(task)
+            query.append((layer, layerPt.x(), layerPt.y(), layerTolerance, toVertex, toSegment, extent))
+        return query
+
+    def runQuery(self, query):
+        """
+        Searches the existing grids (may run in any thread)
+        @param {list} query Result of prepareQuery
+        @returns {tuple} (layer, x, y) of the snapped point in layer coordinates, or None
+        """
+        best = None
+        bestDistance = None
+        for layer, x, y, tolerance, toVertex, toSegment, extent in query:
+            with self.lock:
+                grid = self.grids.get(layer.id())
+                if grid is None:
+                    continue
+
+                # Like QgsVectorLayer.snapToGeometry, a vertex within the tolerance wins over
+                # the segments (the nearest point of the adjacent segments is always closer)
+                candidate = None
+                if toVertex:
+                    candidate = grid.nearestVertex(x, y, tolerance)
+                if candidate is None and toSegment:
+                    candidate = grid.nearestSegment(x, y, tolerance)
+            if candidate is None:
+                continue
+            # Compare the layers in tolerance units, since they may use different units
+            distance = candidate[0] / tolerance
+            if bestDistance is None or distance < bestDistance:
+                bestDistance = distance
+                best = (layer, candidate[1], candidate[2])
+        return best
+
+    def finishQuery(self, result):
+        """
+        Converts the result of runQuery back to map coordinates (GUI thread only)
+        @returns {QgsPoint} Snapped point in map coordinates or None if it does not snap
+        """
+        if result is None:
+            return None
+        return self.transforms.toMap(result[0], QgsPoint(result[1], result[2]))
+
+    def snap(self, qgspoint):
+        """
+        Snaps a point to the snappable layers
+        @param {QgsPoint} qgspoint The point to snap in map coordinates
+        @returns {QgsPoint} Snapped point in map coordinates or None if it does not snap
+        """
+        return self.finishQuery(self.runQuery(self.prepareQuery(qgspoint)))
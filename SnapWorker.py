@@ -0,0 +1,92 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+
+from PyQt4.QtCore import *
+
+class SnapWorker(QThread):
+    """
+    Thread running the snapping queries of the mouse moves. Only the latest
+    request is kept: a request posted while another one is waiting replaces
+    it. The grids missing from the snapping index are filled here too, before
+    the query (none of their tasks is dropped). The result is sent with the "snapped" signal together with the
+    generation number of the request, so that the receiver can drop the
+    results of superseded cursor positions.
+    """
+    def __init__(self, snapIndex):
+        QThread.__init__(self)
+        self.snapIndex = snapIndex
+        self.condition = threading.Condition()
+        # (generation, query) waiting to be processed
+        self.pending = None
+        # Tasks of the grids to fill (see SnapIndex.gridTask)
+        self.tasks = []
+        self.stopping = False
+
+    def request(self, generation, query, tasks=()):
+        """
+        Posts a snapping query (see SnapIndex.prepareQuery)
+        @param {int} generation Number identifying the cursor position
+        @param {list} query The prepared query
+        @param {list} tasks Grids to fill before the query
+        """
+        with self.condition:
+            self.pending = (generation, query)
+            self.tasks.extend(tasks)
+            self.condition.notify()
+
+    def stop(self):
+        """
+        Stops the thread and waits for it to finish
+        """
+        with self.condition:
+            self.stopping = True
+            self.pending = None
+            tasks = self.tasks
+            self.tasks = []
+            self.condition.notify()
+        self.wait()
+        for task in tasks:
+            self.snapIndex.dropTask(task)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.tasks and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    self.stopping = False
+                    return
+                if self.tasks:
+                    task = self.tasks.pop(0)
+                else:
+                    task = None
+                    generation, query = self.pending
+                    self.pending = None
+            if task is not None:
+                # One task at a time, so that stop() does not wait for all of them
+                self.snapIndex.buildGrid(task)
+                continue
+            result = self.snapIndex.runQuery(query)
+            # Short-circuit signal, queued to the GUI thread
+            self.emit(SIGNAL("snapped"), generation, result)
@@ -0,0 +1,117 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from array import array
+
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+from qgis.core import *
+
+def crsKey(crs):
+    return crs.authid() or crs.toProj4()
+
+class TransformCache(object):
+    """
+    Coordinate transforms between the layers and the canvas, created once per
+    (layer CRS, canvas CRS) pair instead of on every conversion. The canvas
+    CRS is read again when it changes or when on the fly reprojection is
+    toggled. The conversions return the same objects when no transform is
+    needed.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        # (layer CRS key, canvas CRS key) -> QgsCoordinateTransform from the layer to the canvas
+        self.transforms = {}
+        # Canvas CRS, False if the layers are not reprojected, None if not read yet
+        self.destinationCrs = None
+        QObject.connect(self.canvas, SIGNAL("destinationCrsChanged()"), self.invalidate)
+        QObject.connect(self.canvas, SIGNAL("hasCrsTransformEnabledChanged(bool)"), self.invalidate)
+
+    def invalidate(self):
+        self.destinationCrs = None
+
+    def transform(self, layer):
+        """
+        Returns the transform from the layer CRS to the canvas CRS
+        @returns {QgsCoordinateTransform} None if the coordinates are the same
+        """
+        if self.destinationCrs is None:
+            renderer = self.canvas.mapRenderer()
+            self.destinationCrs = renderer.destinationCrs() if renderer.hasCrsTransformEnabled() else False
+        if self.destinationCrs is False:
+            return None
+        layerCrs = layer.crs()
+        key = (crsKey(layerCrs), crsKey(self.destinationCrs))
+        if key[0] == key[1]:
+            return None
+        transform = self.transforms.get(key)
+        if transform is None:
+            transform = self.transforms[key] = QgsCoordinateTransform(layerCrs, self.destinationCrs)
+        return transform
+
+    def toLayer(self, layer, point):
+        """
+        @param {QgsPoint} point Point in map coordinates
+        @returns {QgsPoint} Point in layer coordinates
+        """
+        transform = self.transform(layer)
+        if transform is None:
+            return point
+        return transform.transform(point, QgsCoordinateTransform.ReverseTransform)
+
+    def toMap(self, layer, point):
+        """
+        @param {QgsPoint} point Point in layer coordinates
+        @returns {QgsPoint} Point in map coordinates
+        """
+        transform = self.transform(layer)
+        if transform is None:
+            return point
+        return transform.transform(point)
+
+    def toLayerCoordinates(self, layer, coordinates):
+        """
+        Reprojects points from map to layer coordinates with a single call to the transform
+        @param {array} coordinates Flat array of doubles (x0, y0, x1, y1, ...)
+        @returns {array} The same array if no transform is needed, else a new one
+        """
+        transform = self.transform(layer)
+        if transform is None:
+            return coordinates
+        polygon = QPolygonF([QPointF(coordinates[i], coordinates[i + 1]) for i in range(0, len(coordinates), 2)])
+        # Transformed in place, in one batch
+        transform.transformPolygon(polygon, QgsCoordinateTransform.ReverseTransform)
+        result = array('d')
+        for point in polygon:
+            result.append(point.x())
+            result.append(point.y())
+        return result
+
+    def rectToLayer(self, layer, rectangle):
+        """
+        @param {QgsRectangle} rectangle Rectangle in map coordinates
+        @returns {QgsRectangle} Bounding box of the rectangle in layer coordinates
+        """
+        transform = self.transform(layer)
+        if transform is None:
+            return rectangle
+        return transform.transformBoundingBox(rectangle, QgsCoordinateTransform.ReverseTransform)
@@ -0,0 +1,135 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Closure adjustment of traverses, without any Qt or QGIS dependency. Points
+are (x, y) tuples, the last point of a closed traverse being measured back
+onto the first one. Both adjustments are single passes over the points (the
+least squares normal equations of a closed traverse are a 2x2 system).
+"""
+import math
+
+COMPASS = "compass"
+LEAST_SQUARES = "leastSquares"
+
+def traverseLength(points):
+    """
+    Returns the sum of the edge lengths
+    """
+    return sum(math.hypot(points[i][0] - points[i - 1][0], points[i][1] - points[i - 1][1]) for i in range(1, len(points)))
+
+def misclosure(points):
+    """
+    Returns the misclosure vector, from the first point to the last one
+    @returns {tuple} (dx, dy)
+    """
+    return points[-1][0] - points[0][0], points[-1][1] - points[0][1]
+
+def precisionRatio(length, error):
+    """
+    Returns N of the precision ratio 1:N
+    @returns {float} None if the traverse closes exactly
+    """
+    if error <= 0.0:
+        return None
+    return length / error
+
+def compassRule(points):
+    """
+    Distributes the misclosure in proportion to the cumulated length of the edges (Bowditch rule)
+    @returns {list} of (x, y), the last point being on the first one
+    """
+    fx, fy = misclosure(points)
+    length = traverseLength(points)
+    if length == 0.0:
+        return list(points)
+    adjusted = [points[0]]
+    cumulated = 0.0
+    for i in range(1, len(points)):
+        cumulated += math.hypot(points[i][0] - points[i - 1][0], points[i][1] - points[i - 1][1])
+        adjusted.append((points[i][0] - fx * cumulated / length, points[i][1] - fy * cumulated / length))
+    adjusted[-1] = points[0]
+    return adjusted
+
+def leastSquares(points, distanceSigma=0.005, directionSigma=0.0015, iterations=5):
+    """
+    Adjusts the edge lengths and directions so that the traverse closes, each one
+    being corrected in proportion to its variance (condition adjustment)
+    @param {float} distanceSigma Standard deviation of the edge lengths in map units
+    @param {float} directionSigma Standard deviation of the edge directions in degrees
+    @returns {list} of (x, y), the last point being on the first one
+    """
+    qd = distanceSigma * distanceSigma
+    qa = (directionSigma / 180.0 * math.pi) ** 2
+    # (length, direction) of the edges
+    edges = []
+    for i in range(1, len(points)):
+        dx = points[i][0] - points[i - 1][0]
+        dy = points[i][1] - points[i - 1][1]
+        edges.append((math.hypot(dx, dy), math.atan2(dy, dx)))
+
+    for iteration in range(iterations):
+        # Misclosure and normal matrix of the closure conditions sum(dx) = sum(dy) = 0
+        fx = fy = nxx = nxy = nyy = 0.0
+        for length, direction in edges:
+            c = math.cos(direction)
+            s = math.sin(direction)
+            dx = length * c
+            dy = length * s
+            fx += dx
+            fy += dy
+            nxx += qd * c * c + qa * dy * dy
+            nxy += qd * c * s - qa * dx * dy
+            nyy += qd * s * s + qa * dx * dx
+        determinant = nxx * nyy - nxy * nxy
+        if math.hypot(fx, fy) < 1e-12 or determinant == 0.0:
+            break
+        kx = (nyy * fx - nxy * fy) / determinant
+        ky = (nxx * fy - nxy * fx) / determinant
+        corrected = []
+        for length, direction in edges:
+            c = math.cos(direction)
+            s = math.sin(direction)
+            corrected.append((length - qd * (c * kx + s * ky), direction - qa * length * (c * ky - s * kx)))
+        edges = corrected
+
+    adjusted = [points[0]]
+    for length, direction in edges:
+        adjusted.append((adjusted[-1][0] + length * math.cos(direction), adjusted[-1][1] + length * math.sin(direction)))
+    adjusted[-1] = points[0]
+    return adjusted
+
+def adjustTraverse(points, method, tolerance):
+    """
+    Closes a traverse whose last point was measured back onto the first one
+    @param {list} points (x, y) of the traverse
+    @param {str} method COMPASS or LEAST_SQUARES
+    @param {float} tolerance Largest misclosure which is adjusted, in map units
+    @returns {tuple} (points, misclosure, ratio) where points is None if the misclosure
+                     exceeds the tolerance, and ratio is N of the precision ratio 1:N
+    """
+    error = math.hypot(*misclosure(points))
+    ratio = precisionRatio(traverseLength(points), error)
+    if error > tolerance:
+        return None, error, ratio
+    if method == LEAST_SQUARES:
+        return leastSquares(points), error, ratio
+    return compassRule(points), error, ratio
@@ -0,0 +1,193 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Computation of the traverse geometries as WKB, without any Qt or QGIS
+dependency so that it can run in worker processes. Points are (x, y) tuples.
+"""
+import math
+import multiprocessing
+import os
+import sys
+from collections import deque
+
+import GeometryCore
+import TraverseAdjustment
+from WkbWriter import coordinatesOf, geometryWkb
+
+# Distance under which the last vertex of a polygon is considered to be on the first one
+CLOSURE_EPSILON = 1e-9
+
+def traversePoints(start, legs, relative):
+    """
+    Computes the vertices of a traverse with the construction rules of the capture tool
+    (both the distance and the angle locked)
+    @param {tuple} start (x, y) of the first vertex
+    @param {list} legs (distance, angle) of the edges
+    @param {bool} relative True if the angles are relative to the previous edge
+    @returns {list} of (x, y), one more than the legs
+    """
+    points = [start]
+    secondLastPt = None
+    for distance, angle in legs:
+        lastPt = points[-1]
+        x, y, computedDistance, computedAngle = GeometryCore.constructPoint(lastPt, lastPt, secondLastPt, relative, distance, angle, True, True)
+        points.append((x, y))
+        secondLastPt = lastPt
+    return points
+
+def closeRing(points):
+    """
+    Returns the vertices of a closed ring: the last vertex is moved on the first one if
+    they (almost) coincide, else the first vertex is added at the end
+    """
+    first = points[0]
+    last = points[-1]
+    if math.hypot(last[0] - first[0], last[1] - first[1]) <= CLOSURE_EPSILON:
+        return points[:-1] + [first]
+    return points + [first]
+
+def ringArea(ring):
+    """
+    Returns the signed area of a closed ring (shoelace formula)
+    """
+    area = 0.0
+    for i in range(len(ring) - 1):
+        area += ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1]
+    return area / 2.0
+
+def segmentsIntersect(a, b, c, d):
+    """
+    Returns True if the segments ab and cd intersect (touching included)
+    """
+    def orientation(p, q, r):
+        value = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+        return (value > 0) - (value < 0)
+
+    def onSegment(p, q, r):
+        return min(p[0], q[0]) <= r[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= r[1] <= max(p[1], q[1])
+
+    o1 = orientation(a, b, c)
+    o2 = orientation(a, b, d)
+    o3 = orientation(c, d, a)
+    o4 = orientation(c, d, b)
+    if o1 != o2 and o3 != o4:
+        return True
+    return (o1 == 0 and onSegment(a, b, c)) or (o2 == 0 and onSegment(a, b, d)) or \
+           (o3 == 0 and onSegment(c, d, a)) or (o4 == 0 and onSegment(c, d, b))
+
+def isSimple(points, closed):
+    """
+    Returns True if the non adjacent edges of a line or of a closed ring don't intersect
+    """
+    segments = len(points) - 1
+    for i in range(segments - 1):
+        # The first and the last edges of a ring are adjacent
+        last = segments - 1 if closed and i == 0 else segments
+        for j in range(i + 2, last):
+            if segmentsIntersect(points[i], points[i + 1], points[j], points[j + 1]):
+                return False
+    return True
+
+def buildTraverse(task):
+    """
+    Computes and checks the geometry of a traverse
+    @param {tuple} task (start, legs, relative, polygon, multi, adjustment, tolerance), see traversePoints,
+                   geometryWkb and TraverseAdjustment.adjustTraverse (adjustment None to close the
+                   polygons with an additional edge)
+    @returns {tuple} (WKB, None) or (None, message) if the geometry is invalid
+    """
+    start, legs, relative, polygon, multi, adjustment, tolerance = task
+    points = traversePoints(start, legs, relative)
+    if polygon:
+        if adjustment:
+            adjusted, error, ratio = TraverseAdjustment.adjustTraverse(points, adjustment, tolerance)
+            if adjusted is None:
+                return None, "the misclosure %.3f exceeds the tolerance" % error
+            points = adjusted
+        points = closeRing(points)
+        if len(points) < 4 or ringArea(points) == 0.0:
+            return None, "the polygon has no area"
+    if not isSimple(points, polygon):
+        return None, "the edges intersect each other"
+    return geometryWkb(coordinatesOf(points), polygon, multi), None
+
+class TraverseBuilder(object):
+    """
+    Builds the geometries of traverses in the calling process, or in a pool of
+    worker processes if more than one process is requested and the pool can
+    be used. Both give the same WKB, in the order of the tasks. The pool is
+    opt-in: on Linux the workers are forks of the whole calling process,
+    which is QGIS itself inside the plugin.
+    """
+    def __init__(self, processes=1):
+        """
+        @param {int} processes Number of worker processes, None for the number of processors
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.pool = None
+        # Inside QGIS (e.g. on Windows), the workers would start the application instead of Python
+        if processes > 1 and os.path.basename(sys.executable).lower().startswith("python"):
+            try:
+                self.pool = multiprocessing.Pool(processes)
+            except (OSError, ImportError):
+                self.pool = None
+
+    def build(self, tasks):
+        """
+        @param {list} tasks See buildTraverse
+        @returns {list} (WKB, error) of the tasks, in the same order
+        """
+        if self.pool is None:
+            return [buildTraverse(task) for task in tasks]
+        return self.pool.map(buildTraverse, tasks, self.chunkSize(tasks))
+
+    def buildWindows(self, windows):
+        """
+        Builds windows of tasks, the workers computing the next windows while the
+        caller consumes the results of the current one
+        @param {iterable} windows (key, list of tasks), the key being passed through
+        @returns {generator} of (key, list of (WKB, error)), in the order of the windows
+        """
+        if self.pool is None:
+            for key, tasks in windows:
+                yield key, self.build(tasks)
+            return
+        pending = deque()
+        for key, tasks in windows:
+            pending.append((key, self.pool.map_async(buildTraverse, tasks, self.chunkSize(tasks))))
+            if len(pending) > self.processes:
+                key, result = pending.popleft()
+                yield key, result.get()
+        while pending:
+            key, result = pending.popleft()
+            yield key, result.get()
+
+    def chunkSize(self, tasks):
+        return max(1, len(tasks) // (self.processes * 4))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
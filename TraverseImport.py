@@ -0,0 +1,226 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import io
+import re
+from itertools import islice
+
+from PyQt4.QtCore import *
+from qgis.core import *
+
+from RapidCapture import templateAttributes
+from TraverseBuilder import TraverseBuilder
+
+# Separators of the fields of a record, the fields of the lines without any being separated by spaces
+SEPARATORS = re.compile(r"\s*[,;\t]\s*")
+
+class Traverse(object):
+    """
+    Traverse of a parcel: a start point followed by distance/angle pairs, the
+    angles being in degrees like in the dock widget
+    """
+    def __init__(self, name, lineNumber, start):
+        self.name = name
+        # Line of the START record, used in the messages
+        self.lineNumber = lineNumber
+        # (x, y) of the first vertex
+        self.start = start
+        # List of (distance, angle)
+        self.legs = []
+        # Message of the first invalid record, None if the traverse could be read
+        self.error = None
+
+def readRecords(lines):
+    """
+    Splits the lines of a traverse file in records, skipping the empty lines and the comments (#)
+    @param {iterable} lines Lines of the file
+    @returns {generator} of (line number, list of fields)
+    """
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield lineNumber, SEPARATORS.split(line) if SEPARATORS.search(line) else line.split()
+
+def readTraverses(records):
+    """
+    Groups the records in traverses. A traverse starts with a "START,<name>,<x>,<y>"
+    record, followed by one "<distance>,<angle>" record per edge.
+    @param {iterable} records (line number, fields) as returned by readRecords
+    @returns {generator} of Traverse (the invalid ones have an error)
+    """
+    traverse = None
+    for lineNumber, fields in records:
+        if fields[0].upper() == "START":
+            if traverse is not None:
+                yield traverse
+            traverse = Traverse(fields[1] if len(fields) > 1 else "", lineNumber, None)
+            try:
+                if len(fields) != 4:
+                    raise ValueError()
+                traverse.start = (float(fields[2]), float(fields[3]))
+            except ValueError:
+                traverse.error = "line %d: expected START,<name>,<x>,<y>" % lineNumber
+            continue
+
+        if traverse is None:
+            traverse = Traverse("", lineNumber, None)
+            traverse.error = "line %d: the file must begin with a START record" % lineNumber
+        if traverse.error is not None:
+            continue
+        try:
+            if len(fields) != 2:
+                raise ValueError()
+            traverse.legs.append((float(fields[0]), float(fields[1])))
+        except ValueError:
+            traverse.error = "line %d: expected <distance>,<angle>" % lineNumber
+    if traverse is not None:
+        yield traverse
+
+def checkTraverse(traverse, isPolygon):
+    """
+    Returns why a traverse can't be turned into a feature (the geometry itself is checked by buildTraverse)
+    @returns {str} None if the traverse is valid
+    """
+    if traverse.error is not None:
+        return traverse.error
+    if len(traverse.legs) < (2 if isPolygon else 1):
+        return "line %d: not enough edges for a %s" % (traverse.lineNumber, "polygon" if isPolygon else "line")
+    for distance, angle in traverse.legs:
+        if distance <= 0:
+            return "line %d: the distances must be positive" % traverse.lineNumber
+    return None
+
+def validTraverses(traverses, isPolygon, skipped):
+    """
+    Filters out the traverses which can't be turned into features
+    @param {list} skipped Receives the messages of the traverses which were skipped
+    @returns {generator} of Traverse
+    """
+    for traverse in traverses:
+        error = checkTraverse(traverse, isPolygon)
+        if error is None:
+            yield traverse
+        else:
+            skipped.append(error)
+
+def traverseFeatures(layer, traverses, builder, relative=True, nameField=None, template=None, skipped=None, windowSize=500, adjustment=None, tolerance=0.5):
+    """
+    Turns the traverses into features of the layer, the geometries being computed by
+    the builder windowSize traverses at a time (in the order of the traverses)
+    @param {TraverseBuilder} builder
+    @param {str} nameField Field receiving the name of the traverses (None to drop the names)
+    @param {dict} template Field name -> value of the other attributes
+    @param {list} skipped Receives the messages of the traverses which were skipped
+    @param {str} adjustment Closure adjustment of the polygons (TraverseAdjustment.COMPASS or LEAST_SQUARES), None to
+                            close them with an additional edge
+    @param {float} tolerance Largest misclosure of the adjusted polygons, in layer units
+    @returns {generator} of QgsFeature
+    """
+    if skipped is None:
+        skipped = []
+    isPolygon = layer.geometryType() == QGis.Polygon
+    multi = layer.wkbType() in (QGis.WKBMultiPolygon, QGis.WKBMultiLineString)
+    template = dict(template or {})
+    windows = ((window, [(traverse.start, traverse.legs, relative, isPolygon, multi, adjustment, tolerance) for traverse in window])
+               for window in batches(validTraverses(traverses, isPolygon, skipped), windowSize))
+    for window, results in builder.buildWindows(windows):
+        for traverse, (wkb, error) in zip(window, results):
+            if error is not None:
+                skipped.append("line %d: %s" % (traverse.lineNumber, error))
+                continue
+            geometry = QgsGeometry()
+            geometry.fromWkb(wkb)
+            feature = QgsFeature()
+            feature.setGeometry(geometry)
+            if nameField is not None:
+                template[nameField] = traverse.name
+            feature.setAttributes(templateAttributes(layer, template))
+            yield feature
+
+def batches(items, size):
+    """
+    Splits an iterable in lists of at most size items, without reading it ahead
+    @returns {generator} of list
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def importTraverses(layer, lines, relative=True, nameField=None, template=None, batchSize=500, processes=1, adjustment=None, tolerance=0.5):
+    """
+    Adds the traverses read from lines to the layer, batchSize features at a time.
+    If the layer is being edited, the features are added to its edit buffer as a
+    single undo entry, else they are written directly to the datasource (so that
+    the memory stays the same whatever the number of traverses).
+    @param {QgsVectorLayer} layer Polygon or line layer
+    @param {iterable} lines Lines of the traverse file (see readTraverses)
+    @param {bool} relative True if the angles are relative to the previous edge
+    @param {int} processes Number of processes computing the geometries (1 computes them in the calling process,
+                           None uses one worker process per processor)
+    @param {str} adjustment Closure adjustment of the polygons, see traverseFeatures
+    @returns {tuple} (number of added features, list of the messages of the skipped traverses)
+    """
+    if layer.geometryType() not in (QGis.Polygon, QGis.Line):
+        raise ValueError("Traverses can only be imported in polygon or line layers")
+    skipped = []
+    added = 0
+    builder = TraverseBuilder(processes)
+    features = traverseFeatures(layer, readTraverses(readRecords(lines)), builder, relative, nameField, template, skipped, batchSize, adjustment, tolerance)
+    editable = layer.isEditable()
+    if editable:
+        layer.beginEditCommand(QCoreApplication.translate("ImprovedPolygonCapturing", "Import traverses"))
+    try:
+        for batch in batches(features, batchSize):
+            if editable:
+                if not layer.addFeatures(batch, False):
+                    raise IOError("Could not add the features to the layer")
+            else:
+                ok, written = layer.dataProvider().addFeatures(batch)
+                if not ok:
+                    raise IOError("; ".join(layer.dataProvider().errors()))
+            added += len(batch)
+    except:
+        if editable:
+            layer.destroyEditCommand()
+        raise
+    finally:
+        builder.close()
+    if editable:
+        layer.endEditCommand()
+    layer.updateExtents()
+    layer.triggerRepaint()
+    for message in skipped:
+        QgsMessageLog.logMessage("Skipped traverse, %s" % message, "Improved Polygon Capturing")
+    return added, skipped
+
+def importFile(layer, path, relative=True, nameField=None, template=None, batchSize=500, processes=1, adjustment=None, tolerance=0.5, encoding="utf-8"):
+    """
+    Adds the traverses of a CSV or text file to the layer (see importTraverses)
+    @param {str} path Path of the traverse file
+    @returns {tuple} (number of added features, list of the messages of the skipped traverses)
+    """
+    with io.open(path, "r", encoding=encoding) as lines:
+        return importTraverses(layer, lines, relative, nameField, template, batchSize, processes, adjustment, tolerance)
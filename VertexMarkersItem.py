@@ -0,0 +1,151 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from array import array
+
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+from qgis.core import *
+from qgis.gui import *
+
+class VertexMarkersItem(QgsMapCanvasItem):
+    """
+    Single canvas item drawing the markers of all captured vertices (the
+    same red crosses as QgsVertexMarker). The map coordinates are kept in a
+    flat array of doubles which is reused from one feature to the next. The
+    crosses are kept in QPainterPaths of chunkSize vertices in item
+    coordinates, extended on each new vertex. Removing a vertex only rebuilds
+    the last path, moving the map rebuilds them all. A repaint (e.g. for a
+    rubberband update) is one drawPath per path touching the exposed area.
+    """
+    # Size of the arrays kept after clear() (in doubles)
+    keptCapacity = 2 * 4096
+    # Number of vertices per path
+    chunkSize = 256
+
+    def __init__(self, canvas):
+        QgsMapCanvasItem.__init__(self, canvas)
+        self.canvas = canvas
+        # x0, y0, x1, y1, ... in map coordinates, only the first 2*count values are used
+        self.coordinates = array('d')
+        # The same vertices in item coordinates
+        self.pixels = array('d')
+        self.count = 0
+        self.iconSize = 10
+        self.penWidth = 1
+        self.color = QColor(255, 0, 0)
+        self.paths = []
+        # Makes option.exposedRect the area to repaint instead of the whole item
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.updatePosition()
+
+    def append(self, point):
+        """
+        Adds the marker of a vertex
+        @param {QgsPoint} point Vertex in map coordinates
+        """
+        pixel = self.toCanvasCoordinates(point) - self.pos()
+        index = 2 * self.count
+        if index < len(self.coordinates):
+            self.coordinates[index] = point.x()
+            self.coordinates[index + 1] = point.y()
+            self.pixels[index] = pixel.x()
+            self.pixels[index + 1] = pixel.y()
+        else:
+            self.coordinates.append(point.x())
+            self.coordinates.append(point.y())
+            self.pixels.append(pixel.x())
+            self.pixels.append(pixel.y())
+        self.count += 1
+        if len(self.paths) * self.chunkSize < self.count:
+            self.paths.append(QPainterPath())
+        self.addCross(self.paths[-1], pixel.x(), pixel.y())
+        self.update(self.crossRect(pixel.x(), pixel.y()))
+
+    def removeLast(self):
+        """
+        Removes the marker of the last vertex
+        """
+        if self.count > 0:
+            self.count -= 1
+            index = 2 * self.count
+            self.rebuildPaths((self.count - 1) // self.chunkSize if self.count else 0)
+            self.update(self.crossRect(self.pixels[index], self.pixels[index + 1]))
+
+    def clear(self):
+        """
+        Removes all markers. The arrays are kept for the next feature, unless they grew very large.
+        """
+        self.count = 0
+        if len(self.coordinates) > self.keptCapacity:
+            del self.coordinates[self.keptCapacity:]
+            del self.pixels[self.keptCapacity:]
+        self.paths = []
+        self.update()
+
+    def addCross(self, path, x, y):
+        half = self.iconSize / 2.0
+        path.moveTo(x - half, y - half)
+        path.lineTo(x + half, y + half)
+        path.moveTo(x - half, y + half)
+        path.lineTo(x + half, y - half)
+
+    def crossRect(self, x, y):
+        """
+        Returns the area covered by the cross of a vertex, in item coordinates
+        """
+        half = self.iconSize / 2.0 + self.penWidth
+        return QRectF(x - half, y - half, 2 * half, 2 * half)
+
+    def rebuildPaths(self, first=0):
+        """
+        Builds the paths again from the given one
+        """
+        del self.paths[first:]
+        pixels = self.pixels
+        for i in range(2 * first * self.chunkSize, 2 * self.count, 2):
+            if i % (2 * self.chunkSize) == 0:
+                self.paths.append(QPainterPath())
+            self.addCross(self.paths[-1], pixels[i], pixels[i + 1])
+
+    def updatePosition(self):
+        # The item covers the whole canvas, the pixel positions change with the map
+        self.setRect(self.canvas.extent())
+        origin = self.pos()
+        coordinates = self.coordinates
+        for i in range(0, 2 * self.count, 2):
+            pixel = self.toCanvasCoordinates(QgsPoint(coordinates[i], coordinates[i + 1])) - origin
+            self.pixels[i] = pixel.x()
+            self.pixels[i + 1] = pixel.y()
+        self.rebuildPaths()
+
+    def paint(self, painter, option=None, widget=None):
+        if self.count == 0:
+            return
+        exposed = option.exposedRect if option is not None else None
+        pen = QPen(self.color)
+        pen.setWidth(self.penWidth)
+        painter.setPen(pen)
+        for path in self.paths:
+            if exposed is not None and not exposed.intersects(path.controlPointRect().adjusted(-self.penWidth, -self.penWidth, self.penWidth, self.penWidth)):
+                continue
+            painter.drawPath(path)
@@ -0,0 +1,68 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Little endian WKB of polygons and lines, written from flat arrays of
+doubles (x0, y0, x1, y1, ...) without any Qt or QGIS dependency, so that
+the geometries can be created with QgsGeometry.fromWkb instead of lists of
+QgsPoint.
+"""
+import struct
+import sys
+from array import array
+
+# WKB geometry types
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+def coordinatesOf(points):
+    """
+    Returns the flat array of the coordinates of (x, y) points
+    @returns {array} of doubles
+    """
+    return array("d", [value for point in points for value in point])
+
+def packCoordinates(coordinates):
+    """
+    Returns the WKB of a point sequence (count and little endian coordinates)
+    @param {array} coordinates Flat array of doubles
+    """
+    if sys.byteorder != "little":
+        coordinates = array("d", coordinates)
+        coordinates.byteswap()
+    return struct.pack("<I", len(coordinates) // 2) + (coordinates.tobytes() if hasattr(coordinates, "tobytes") else coordinates.tostring())
+
+def geometryWkb(coordinates, polygon, multi):
+    """
+    Returns the WKB of a polygon (with a single ring, which must be closed) or of a line
+    @param {array} coordinates Flat array of doubles
+    """
+    if polygon:
+        wkb = struct.pack("<BII", 1, WKB_POLYGON, 1) + packCoordinates(coordinates)
+        if multi:
+            wkb = struct.pack("<BII", 1, WKB_MULTIPOLYGON, 1) + wkb
+    else:
+        wkb = struct.pack("<BI", 1, WKB_LINESTRING) + packCoordinates(coordinates)
+        if multi:
+            wkb = struct.pack("<BII", 1, WKB_MULTILINESTRING, 1) + wkb
+    return wkb
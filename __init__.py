@@ -29,7 +29,12 @@ def qgisMinimumVersion():
   return "1.0"
 def classFactory(iface): 
   # load AddVertexOnRadius class from file AddVertexOnRadius
+  import time
+  start = time.time()
   from ImprovedPolygonCapturing import ImprovedPolygonCapturing 
-  return ImprovedPolygonCapturing(iface)
+  plugin = ImprovedPolygonCapturing(iface)
+  # initGui adds its own time and logs the total
+  plugin.loadTime = time.time() - start
+  return plugin
 
 
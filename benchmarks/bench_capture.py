@@ -0,0 +1,408 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Headless benchmark of the capture pipeline. The PyQt4 and QGIS objects used
+by QgsMapToolCapturePolygon are replaced by the stand-ins of the "standins"
+directory, so that scripted mouse move/press/finish streams can be played
+against synthetic parcel layers without a running QGIS.
+
+Usage:
+    python benchmarks/bench_capture.py [--vertices 10000,100000,1000000]
+                                       [--features 20] [--moves 30] [--seed 1]
+                                       [--write-behind] [--rapid] [--reproject]
+                                       [--adjust compass|leastSquares] [--long 20000]
+                                       [--async-snapping]
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "standins"))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from PyQt4.QtCore import QPoint, Qt, QSettings
+from qgis.core import QGis, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry, QgsMapLayerRegistry, QgsPoint, QgsProject, QgsRectangle, QgsVectorLayer
+from qgis.gui import QgsMapCanvas, QgsMessageBar
+
+import AsyncWriter
+from ConstraintState import ConstraintState
+import GeometryCore
+from Profiler import Profiler
+from QgsMapToolCapturePolygon import QgsMapToolCapturePolygon
+
+# Size of a synthetic parcel in map units
+PARCEL_SIZE = 10.0
+# Size of the visible extent in parcels
+VIEW_PARCELS = 40
+
+class Iface(object):
+    """
+    Stand-in for the QgisInterface
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.bar = QgsMessageBar()
+
+    def mapCanvas(self):
+        return self.canvas
+
+    def messageBar(self):
+        return self.bar
+
+    def openFeatureForm(self, layer, feature, updateFeatureOnly=False):
+        return True
+
+class MouseEvent(object):
+    def __init__(self, x, y, button=Qt.LeftButton):
+        self._pos = QPoint(x, y)
+        self._button = button
+
+    def pos(self):
+        return self._pos
+
+    def button(self):
+        return self._button
+
+class KeyEvent(object):
+    def __init__(self, key):
+        self._key = key
+        self.accepted = False
+
+    def key(self):
+        return self._key
+
+    def accept(self):
+        self.accepted = True
+
+    def ignore(self):
+        self.accepted = False
+
+class Timings(object):
+    """
+    Records the latency of the calls of some methods of an object
+    """
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, target, name):
+        method = getattr(target, name)
+        samples = self.samples.setdefault(name, [])
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                samples.append(time.time() - start)
+        setattr(target, name, timed)
+
+class SqliteProvider(object):
+    """
+    Stand-in for the provider of a SpatiaLite layer: the features are inserted
+    into a local SQLite database, the geometries being stored as coordinate lists
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def addFeatures(self, features):
+        with self.connection:
+            cursor = self.connection.cursor()
+            for feature in features:
+                coordinates = ",".join("%r %r" % (p.x(), p.y()) for p in feature.geometry().vertices())
+                cursor.execute("INSERT INTO features (geometry) VALUES (?)", (coordinates,))
+                feature.setFeatureId(cursor.lastrowid)
+        return True, features
+
+    def errors(self):
+        return []
+
+def sqliteConnection(layer):
+    """
+    Connection factory of the AsyncWriter opening the SQLite database of the layer
+    """
+    connection = sqlite3.connect(layer.source(), check_same_thread=False)
+    connection.execute("CREATE TABLE IF NOT EXISTS features (fid INTEGER PRIMARY KEY, geometry TEXT)")
+    connection.commit()
+    return connection, SqliteProvider(connection)
+
+def percentile(sortedValues, q):
+    if not sortedValues:
+        return float("nan")
+    index = min(len(sortedValues) - 1, int(math.ceil(q / 100.0 * len(sortedValues))) - 1)
+    return sortedValues[max(index, 0)]
+
+def syntheticLayer(vertexCount):
+    """
+    Builds a layer of square parcels (5 vertices per closed ring) laid out on a square grid
+    """
+    parcelCount = max(1, vertexCount // 5)
+    side = int(math.ceil(math.sqrt(parcelCount)))
+    layer = QgsVectorLayer(QGis.Polygon, QGis.WKBPolygon, "parcels")
+    for fid in range(parcelCount):
+        x = (fid % side) * PARCEL_SIZE
+        y = (fid // side) * PARCEL_SIZE
+        ring = [QgsPoint(x, y), QgsPoint(x + PARCEL_SIZE, y), QgsPoint(x + PARCEL_SIZE, y + PARCEL_SIZE), QgsPoint(x, y + PARCEL_SIZE), QgsPoint(x, y)]
+        layer.loadFeature(fid, QgsGeometry.fromPolygon([ring]))
+    return layer, side * PARCEL_SIZE
+
+def setupProject(tolerancePixels):
+    project = QgsProject.instance()
+    project.entries[("Digitizing", "/SnappingMode")] = "current_layer"
+    project.entries[("Digitizing", "/DefaultSnapType")] = "to vertex and segment"
+    project.entries[("Digitizing", "/DefaultSnapTolerance")] = tolerancePixels
+    project.entries[("Digitizing", "/DefaultSnapToleranceUnit")] = 1
+
+def run(vertexCount, features, moves, rng, profiler, database=None, reproject=False, adjust=False, longVertices=0):
+    """
+    Plays a capture session against a synthetic layer
+    @param {str} database Path of the SQLite database receiving the features in write-behind mode
+    @param {bool} reproject Store the layer in LV03 and show it in LV95, instead of using the same CRS
+    @param {bool} adjust Read the misclosure like the dock widget after each preview update
+    @param {int} longVertices Number of vertices of an additional long feature (0 for none), 100 of
+                 them being removed with backspace before it is finished
+    @returns {tuple} (build time of the snapping index, Timings)
+    """
+    layer, size = syntheticLayer(vertexCount)
+    if database is not None:
+        layer.setDataSource(database, "spatialite")
+    QgsMapLayerRegistry.instance().addMapLayer(layer)
+    centerX = centerY = size / 2.0
+    if reproject:
+        layer.setCrs(QgsCoordinateReferenceSystem("EPSG:21781"))
+        centerX += 2000000.0
+        centerY += 1000000.0
+    half = VIEW_PARCELS * PARCEL_SIZE / 2.0
+    canvas = QgsMapCanvas(QgsRectangle(centerX - half, centerY - half, centerX + half, centerY + half), 1000)
+    canvas.setLayers([layer])
+    canvas.setCurrentLayer(layer)
+
+    transformsCreated = QgsCoordinateTransform.created
+    tool = QgsMapToolCapturePolygon(Iface(canvas), ConstraintState(), True, profiler)
+    canvas.setMapTool(tool)
+    start = time.time()
+    if not tool.asyncSnapping:
+        tool.snapIndex.prepare()
+    buildTime = time.time() - start
+
+    timings = Timings()
+    for name in ("moveVertex", "addVertex", "finishFeature", "clearMapCanvas", "closure"):
+        timings.wrap(tool, name)
+
+    # Mouse positions of the session, replayed after the capture
+    positions = []
+    for i in range(features):
+        x = rng.uniform(100, 900)
+        y = rng.uniform(100, 900)
+        for vertex in range(4):
+            for move in range(moves):
+                x = min(max(x + rng.uniform(-15, 15), 0), 1000)
+                y = min(max(y + rng.uniform(-15, 15), 0), 1000)
+                tool.canvasMoveEvent(MouseEvent(x, y))
+                positions.append((x, y))
+                # Two mouse events per displayed frame
+                if move % 2:
+                    tool.moveTimer.fire()
+                    if adjust:
+                        tool.closure()
+            tool.canvasPressEvent(MouseEvent(x, y))
+        tool.canvasPressEvent(MouseEvent(x, y, Qt.RightButton))
+
+    replay(tool, positions, timings)
+
+    if longVertices:
+        # A long feature winding through the view, without preview updates
+        long = timings.samples.setdefault("long addVertex", [])
+        undo = timings.samples.setdefault("undo", [])
+        finish = timings.samples.setdefault("long finish", [])
+        addVertex = tool.addVertex
+        for i in range(longVertices):
+            start = time.time()
+            addVertex(tool.toMapCoordinates(QPoint(100 + (i % 800), 100 + (i // 800) % 800)))
+            long.append(time.time() - start)
+        for i in range(100):
+            start = time.time()
+            tool.keyPressEvent(KeyEvent(Qt.Key_Backspace))
+            undo.append(time.time() - start)
+        start = time.time()
+        tool.finishFeature(None)
+        finish.append(time.time() - start)
+
+    tool.deactivate()
+    timings.transforms = QgsCoordinateTransform.created - transformsCreated
+
+    # Switching back to the tool binds it to the layer again, the caches are kept
+    reactivations = timings.samples.setdefault("reactivation", [])
+    for i in range(10):
+        start = time.time()
+        tool.setLayer(layer, True)
+        canvas.setMapTool(tool)
+        tool.snapIndex.prepare()
+        reactivations.append(time.time() - start)
+        tool.deactivate()
+
+    tool.release()
+    timings.captured = tool.captured.count(layer)
+    timings.adjusted = len(tool.iface.messageBar().messages)
+    return buildTime, timings
+
+def referencePointPos(pt, lastPt, secondLastPt, relative, inputDistance, inputAngle, distanceLock, angleLock):
+    """
+    Copy of the formulas of the original calculatePointPos and projectedDistance, before
+    they were moved to GeometryCore (the QVector2D dot product is written out)
+    @returns {tuple} (x, y, distance shown in the spin box or None, angle shown in the spin box or None)
+    """
+    shownDistance = None
+    shownAngle = None
+    if relative:
+        if secondLastPt is not None:
+            lastAngle = math.atan2(lastPt[1] - secondLastPt[1], lastPt[0] - secondLastPt[0])
+        else:
+            lastAngle = 0
+    if angleLock:
+        if not relative:
+            newAngle = inputAngle / 180.0 * math.pi
+        else:
+            newAngle = lastAngle + inputAngle / 180.0 * math.pi
+    else:
+        newAngle = math.atan2((pt[1] - lastPt[1]), pt[0] - lastPt[0])
+        if not relative:
+            shownAngle = newAngle / math.pi * 180.0
+        else:
+            shownAngle = (newAngle - lastAngle) / math.pi * 180.0
+    if distanceLock:
+        newDist = inputDistance
+    else:
+        if angleLock:
+            newDist = (pt[0] - lastPt[0]) * math.cos(newAngle) + (pt[1] - lastPt[1]) * math.sin(newAngle)
+        else:
+            newDist = math.sqrt((pt[0] - lastPt[0]) * (pt[0] - lastPt[0]) + (pt[1] - lastPt[1]) * (pt[1] - lastPt[1]))
+        shownDistance = newDist
+    if distanceLock or angleLock:
+        return lastPt[0] + math.cos(newAngle) * newDist, lastPt[1] + math.sin(newAngle) * newDist, shownDistance, shownAngle
+    return pt[0], pt[1], shownDistance, shownAngle
+
+def replay(tool, positions, timings):
+    """
+    Constructs the points of the recorded mouse positions after two vertices, one
+    at a time like the preview (calculatePointPos) and in one batch
+    (GeometryCore.constructPoints), and checks both against the formulas of the
+    original tool (referencePointPos)
+    """
+    single = timings.samples.setdefault("replay", [])
+    batch = timings.samples.setdefault("replay batch", [])
+    points = [tool.toMapCoordinates(QPoint(x, y)) for x, y in positions]
+    xs = [point.x() for point in points]
+    ys = [point.y() for point in points]
+    # Bypass the timed methods, these vertices are not part of the session
+    QgsMapToolCapturePolygon.addVertex(tool, tool.toMapCoordinates(QPoint(500, 500)))
+    QgsMapToolCapturePolygon.addVertex(tool, tool.toMapCoordinates(QPoint(520, 510)))
+    lastPt = tool.captureBuffer.point(-1)
+    secondLastPt = tool.captureBuffer.point(-2)
+
+    def check(name, expected, value):
+        if (expected is None) != (value is None) or (expected is not None and abs(expected - value) > 1e-9 * max(1.0, abs(expected))):
+            raise AssertionError("%s differs from the original formulas: %r instead of %r" % (name, value, expected))
+
+    for relative in (False, True):
+        for distanceLock, angleLock in ((False, False), (True, False), (False, True), (True, True)):
+            reference = [referencePointPos((x, y), lastPt, secondLastPt, relative, 12.5, 30.0, distanceLock, angleLock) for x, y in zip(xs, ys)]
+            start = time.time()
+            preview = [tool.calculatePointPos(point, relative, 12.5, 30.0, distanceLock, angleLock) for point in points]
+            single.append(time.time() - start)
+            start = time.time()
+            resultX, resultY, distances, angles = GeometryCore.constructPoints(xs, ys, lastPt, secondLastPt, relative, 12.5, 30.0, distanceLock, angleLock)
+            batch.append(time.time() - start)
+            for i, (x, y, distance, angle) in enumerate(reference):
+                check("calculatePointPos x", x, preview[i].x())
+                check("calculatePointPos y", y, preview[i].y())
+                check("constructPoints x", x, resultX[i])
+                check("constructPoints y", y, resultY[i])
+                check("constructPoints distance", distance, distances[i])
+                check("constructPoints angle", angle, angles[i])
+    QgsMapToolCapturePolygon.clearMapCanvas(tool)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capture pipeline with stand-ins for QGIS")
+    parser.add_argument("--vertices", default="10000,100000,1000000", help="comma separated vertex counts of the synthetic layers")
+    parser.add_argument("--features", type=int, default=20, help="number of features to capture per layer")
+    parser.add_argument("--moves", type=int, default=30, help="number of mouse moves before each click")
+    parser.add_argument("--tolerance", type=float, default=10, help="snapping tolerance in pixels")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--session", type=int, default=None, help="capture session mode, flushing every N features")
+    parser.add_argument("--profile", action="store_true", help="also print the stage durations recorded by the tool's profiler")
+    parser.add_argument("--write-behind", action="store_true", help="write the features to a local SQLite database in write-behind mode")
+    parser.add_argument("--rapid", action="store_true", help="rapid-capture mode (no attribute form)")
+    parser.add_argument("--reproject", action="store_true", help="show the layer in another CRS than its own")
+    parser.add_argument("--adjust", choices=("compass", "leastSquares"), help="adjust the closure of every feature and read the live misclosure")
+    parser.add_argument("--async-snapping", action="store_true", help="snap the mouse moves in the snapping thread, which also builds the grid")
+    parser.add_argument("--long", type=int, default=0, help="also capture a feature with this number of vertices, and undo 100 of them")
+    args = parser.parse_args()
+
+    setupProject(args.tolerance)
+    database = None
+    if args.write_behind:
+        database = os.path.join(tempfile.mkdtemp(), "capture.sqlite")
+        AsyncWriter.providerConnection = sqliteConnection
+        QSettings().setValue("/improvedpolygoncapturing/writeBehind", True)
+    if args.rapid:
+        QSettings().setValue("/improvedpolygoncapturing/rapidCapture", True)
+        QSettings().setValue("/improvedpolygoncapturing/attributeTemplate", '{"name": "parcel"}')
+    if args.session is not None:
+        QSettings().setValue("/improvedpolygoncapturing/captureSession", True)
+        QSettings().setValue("/improvedpolygoncapturing/sessionFlushEvery", args.session)
+    if args.async_snapping:
+        QSettings().setValue("/improvedpolygoncapturing/asyncSnapping", True)
+    if args.adjust:
+        # The scripted polygons don't close, the tolerance makes them all adjusted
+        QSettings().setValue("/improvedpolygoncapturing/closureAdjustment", args.adjust)
+        QSettings().setValue("/improvedpolygoncapturing/closureTolerance", 1e9)
+    print("%10s %-15s %7s %10s %10s %10s %10s" % ("vertices", "stage", "calls", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for vertexCount in [int(v) for v in args.vertices.split(",")]:
+        profiler = Profiler()
+        profiler.enabled = args.profile
+        buildTime, timings = run(vertexCount, args.features, args.moves, random.Random(args.seed), profiler, database, args.reproject, bool(args.adjust), args.long)
+        print("%10d %-15s %7d %10.3f" % (vertexCount, "snap index", 1, buildTime * 1000.0))
+        if database is not None:
+            written = sqlite3.connect(database).execute("SELECT COUNT(*) FROM features").fetchone()[0]
+            print("%10d %-15s %7d" % (vertexCount, "rows written", written))
+        if args.rapid:
+            print("%10d %-15s %7d" % (vertexCount, "recorded ids", timings.captured))
+        if args.reproject:
+            print("%10d %-15s %7d" % (vertexCount, "transforms", timings.transforms))
+        if args.adjust:
+            print("%10d %-15s %7d" % (vertexCount, "adjusted", timings.adjusted))
+        for name in ("moveVertex", "addVertex", "finishFeature", "clearMapCanvas", "reactivation") + ("replay", "replay batch") + (("closure",) if args.adjust else ()) + (("long addVertex", "undo", "long finish") if args.long else ()):
+            samples = sorted(timings.samples[name])
+            print("%10d %-15s %7d %10.3f %10.3f %10.3f %10.3f" % (vertexCount, name, len(samples),
+                  percentile(samples, 50) * 1000.0, percentile(samples, 95) * 1000.0,
+                  percentile(samples, 99) * 1000.0, (samples[-1] if samples else float("nan")) * 1000.0))
+        for name, count, p50, p95, p99 in profiler.statistics():
+            print("%10d %-15s %7d %10.3f %10.3f %10.3f" % (vertexCount, "  " + name, count, p50, p95, p99))
+
+if __name__ == "__main__":
+    main()
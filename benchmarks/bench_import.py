@@ -0,0 +1,144 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Headless benchmark of the traverse import. A synthetic traverse file is
+written, then imported by a fresh interpreter (with the stand-ins of the
+"standins" directory) into a layer whose provider only counts the written
+features, so that the peak memory of the import itself can be compared
+between file sizes.
+
+Usage:
+    python benchmarks/bench_import.py [--parcels 10000,50000] [--batch 500]
+                                      [--processes 1,2,4]
+
+Each import with more than one process must give the same features as the
+single-process import, which is checked with a digest of the geometries.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLUGIN = os.path.dirname(HERE)
+
+def writeTraverses(path, parcels, rng):
+    """
+    Writes a traverse file of irregular quadrilaterals, with relative angles
+    """
+    with open(path, "w") as output:
+        output.write("# synthetic traverses\n")
+        for i in range(parcels):
+            width = rng.uniform(8.0, 12.0)
+            height = rng.uniform(8.0, 12.0)
+            output.write("START,parcel %d,%.3f,%.3f\n" % (i, (i % 1000) * 15.0, (i // 1000) * 15.0))
+            output.write("%.3f,0\n%.3f,90\n%.3f,90\n%.3f,90\n" % (width, height, width, height))
+
+def measure(path, batchSize, processes):
+    """
+    Imports a traverse file and returns the duration and the peak memory
+    """
+    sys.path.insert(0, os.path.join(HERE, "standins"))
+    sys.path.insert(0, PLUGIN)
+    from qgis.core import QgsVectorLayer
+    import TraverseImport
+
+    class CountingProvider(object):
+        def __init__(self):
+            self.count = 0
+            self.digest = hashlib.md5()
+
+        def fields(self):
+            return []
+
+        def addFeatures(self, features):
+            self.count += len(features)
+            for feature in features:
+                self.digest.update(feature.geometry().asWkb().encode("ascii"))
+            return True, features
+
+        def errors(self):
+            return []
+
+    class DatasourceLayer(QgsVectorLayer):
+        """
+        Layer which is not being edited, so that the features go to the provider
+        """
+        def __init__(self):
+            QgsVectorLayer.__init__(self)
+            self._provider = CountingProvider()
+
+        def isEditable(self):
+            return False
+
+    layer = DatasourceLayer()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    added, skipped = TraverseImport.importFile(layer, path, batchSize=batchSize, processes=processes)
+    duration = time.time() - start
+    return {
+        "added": added,
+        "written": layer.dataProvider().count,
+        "digest": layer.dataProvider().digest.hexdigest(),
+        "seconds": duration,
+        "memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the traverse import with stand-ins for QGIS")
+    parser.add_argument("--parcels", default="10000,50000", help="comma separated numbers of parcels")
+    parser.add_argument("--batch", type=int, default=500, help="number of features written at once")
+    parser.add_argument("--processes", default="1", help="comma separated numbers of worker processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--once", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.once:
+        print(json.dumps(measure(args.once, args.batch, int(args.processes))))
+        return
+
+    print("%10s %10s %10s %12s %12s" % ("parcels", "processes", "seconds", "parcels/s", "peak kB"))
+    for parcels in [int(value) for value in args.parcels.split(",")]:
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        digest = None
+        try:
+            writeTraverses(path, parcels, random.Random(args.seed))
+            for processes in [int(value) for value in args.processes.split(",")]:
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--once", path,
+                                                  "--batch", str(args.batch), "--processes", str(processes)])
+                result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+                assert result["added"] == result["written"] == parcels
+                assert digest is None or result["digest"] == digest, "the features depend on the number of processes"
+                digest = result["digest"]
+                print("%10d %10d %10.3f %12.0f %12d" % (parcels, processes, result["seconds"], parcels / result["seconds"], result["memory"]))
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
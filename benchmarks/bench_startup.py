@@ -0,0 +1,108 @@
+"""
+/***************************************************************************
+ImprovedPolygonCapturing
+A QGIS plugin
+Improved polygon capturing - add linesegments with preset length.
+                             -------------------
+begin                : 2010-06-28
+copyright            : (C) 2010 by Adrian Weber
+email                : adrian.weber@cde.unibe.ch
+contributor          : Olivier Dalang ( olivier.dalang@gmail.com )
+git repo             : https://github.com/olivierdalang/improvedpolygoncapturing2
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Measures the plugin load time at QGIS startup (classFactory and initGui)
+and the cost deferred to the first use of the tool (translator, dock widget,
+map tool modules), with the stand-ins of the "standins" directory. Each run
+is a fresh interpreter, since Python caches the imported modules.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 20]
+"""
+import argparse
+import imp
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLUGIN = os.path.dirname(HERE)
+
+def measure():
+    """
+    Loads the plugin like QGIS does and returns the durations in milliseconds
+    """
+    sys.path.insert(0, os.path.join(HERE, "standins"))
+    sys.path.insert(0, PLUGIN)
+    from PyQt4.QtCore import QSettings
+    from PyQt4.QtGui import QWidget
+    from qgis.core import QgsRectangle
+    from qgis.gui import QgsMapCanvas
+
+    class Iface(QWidget):
+        def __init__(self):
+            QWidget.__init__(self)
+            self.canvas = QgsMapCanvas(QgsRectangle(0, 0, 1000, 1000))
+            self.window = QWidget()
+            self.toolBar = QWidget()
+
+        def mapCanvas(self):
+            return self.canvas
+
+        def mainWindow(self):
+            return self.window
+
+        def digitizeToolBar(self):
+            return self.toolBar
+
+    QSettings().setValue("locale/userLocale", "de_CH")
+    result = {}
+    start = time.time()
+    package = imp.load_source("improvedpolygoncapturing", os.path.join(PLUGIN, "__init__.py"))
+    plugin = package.classFactory(Iface())
+    plugin.initGui()
+    result["startup"] = (time.time() - start) * 1000.0
+
+    start = time.time()
+    plugin.load()
+    result["first use"] = (time.time() - start) * 1000.0
+
+    # The compiled resources are not loaded anymore, the icons are read from their files
+    start = time.time()
+    import resources
+    result["resources module"] = (time.time() - start) * 1000.0
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the plugin load time with stand-ins for QGIS")
+    parser.add_argument("--runs", type=int, default=20, help="number of fresh interpreters to start")
+    parser.add_argument("--once", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.once:
+        print(json.dumps(measure()))
+        return
+
+    samples = {}
+    for run in range(args.runs):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--once"])
+        for name, value in json.loads(output.decode("utf-8").strip().splitlines()[-1]).items():
+            samples.setdefault(name, []).append(value)
+    print("%-20s %10s %10s" % ("stage", "median ms", "max ms"))
+    for name in ("startup", "first use", "resources module"):
+        values = sorted(samples[name])
+        print("%-20s %10.3f %10.3f" % (name, values[len(values) // 2], values[-1]))
+
+if __name__ == "__main__":
+    main()
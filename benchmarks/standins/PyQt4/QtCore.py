@@ -0,0 +1,208 @@
+"""
+Stand-ins for PyQt4.QtCore (see the package docstring)
+"""
+import threading as _threading
+
+def SIGNAL(signature):
+    return signature
+
+class Qt(object):
+    LeftButton = 1
+    RightButton = 2
+    ISODate = 1
+    LeftDockWidgetArea = 1
+    QueuedConnection = 2
+    Key_Backspace = 0x01000003
+
+class QObject(object):
+    def __init__(self, parent=None):
+        self._slots = {}
+
+    @staticmethod
+    def connect(sender, signal, slot, connectionType=None):
+        slots = sender.__dict__.setdefault("_slots", {})
+        slots.setdefault(signal, []).append(slot)
+        return True
+
+    @staticmethod
+    def disconnect(sender, signal, slot):
+        slots = sender.__dict__.get("_slots", {}).get(signal, [])
+        if slot in slots:
+            slots.remove(slot)
+        return True
+
+    def emit(self, signal, *args):
+        for slot in list(self.__dict__.get("_slots", {}).get(signal, [])):
+            slot(*args)
+
+    def blockSignals(self, block):
+        return False
+
+class QPoint(object):
+    def __init__(self, x=0, y=0):
+        if isinstance(x, QPoint):
+            x, y = x.x(), x.y()
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def __sub__(self, other):
+        return QPoint(self._x - other.x(), self._y - other.y())
+
+class QPointF(object):
+    def __init__(self, x=0.0, y=0.0):
+        self._x = float(x)
+        self._y = float(y)
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def setX(self, x):
+        self._x = float(x)
+
+    def setY(self, y):
+        self._y = float(y)
+
+class QRectF(object):
+    def __init__(self, x=0.0, y=0.0, width=0.0, height=0.0):
+        self._rect = (x, y, width, height)
+
+    def intersects(self, other):
+        x, y, width, height = self._rect
+        ox, oy, owidth, oheight = other._rect
+        return x < ox + owidth and ox < x + width and y < oy + oheight and oy < y + height
+
+    def adjusted(self, dx1, dy1, dx2, dy2):
+        x, y, width, height = self._rect
+        return QRectF(x + dx1, y + dy1, width - dx1 + dx2, height - dy1 + dy2)
+
+class QDateTime(object):
+    def __init__(self, stamp=None):
+        self._stamp = stamp
+
+    def isValid(self):
+        return self._stamp is not None
+
+    def toString(self, format=None):
+        return str(self._stamp)
+
+class QPyNullVariant(object):
+    def __init__(self, type=None):
+        self._type = type
+
+    def isNull(self):
+        return True
+
+class QSettings(object):
+    # Shared values, the benchmark driver may change them
+    values = {}
+
+    def value(self, key, default=None, type=None):
+        value = self.values.get(key, default)
+        if type is not None and value is not None:
+            value = type(value)
+        return value
+
+    def setValue(self, key, value):
+        self.values[key] = value
+
+class QTimer(QObject):
+    """
+    Timer that only fires when fire() is called by the benchmark driver
+    """
+    def __init__(self, parent=None):
+        QObject.__init__(self)
+        self._active = False
+        self._interval = 0
+        self._singleShot = False
+
+    def setSingleShot(self, singleShot):
+        self._singleShot = singleShot
+
+    def setInterval(self, interval):
+        self._interval = interval
+
+    def interval(self):
+        return self._interval
+
+    def isActive(self):
+        return self._active
+
+    def start(self, interval=None):
+        if interval is not None:
+            self._interval = interval
+        self._active = True
+
+    def stop(self):
+        self._active = False
+
+    def fire(self):
+        if not self._active:
+            return
+        if self._singleShot:
+            self._active = False
+        self.emit("timeout()")
+
+class QThread(QObject):
+    def __init__(self, parent=None):
+        QObject.__init__(self)
+        self._thread = None
+
+    def start(self):
+        self._thread = _threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+        return True
+
+    def run(self):
+        pass
+
+class QCoreApplication(object):
+    @staticmethod
+    def translate(context, text):
+        return text
+
+    @staticmethod
+    def installTranslator(translator):
+        return True
+
+class QFileInfo(object):
+    def __init__(self, path):
+        import os
+        self._path = os.path.abspath(path)
+
+    def exists(self):
+        import os
+        return os.path.exists(self._path)
+
+    def absolutePath(self):
+        import os
+        return os.path.dirname(self._path)
+
+class QTranslator(QObject):
+    def load(self, path):
+        return True
+
+def qVersion():
+    return "4.8.6"
+
+def qRegisterResourceData(version, structure, names, data):
+    return True
+
+def qUnregisterResourceData(version, structure, names, data):
+    return True
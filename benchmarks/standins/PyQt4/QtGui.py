@@ -0,0 +1,115 @@
+"""
+Stand-ins for PyQt4.QtGui (see the package docstring)
+"""
+from PyQt4.QtCore import QObject
+
+class QColor(object):
+    def __init__(self, *args):
+        self._rgba = args
+
+    def rgba(self):
+        return self._rgba
+
+class QPolygonF(list):
+    """
+    Sequence of QPointF
+    """
+
+class QPainterPath(object):
+    """
+    Records the elements of the path
+    """
+    def __init__(self):
+        self._elements = []
+
+    def moveTo(self, x, y):
+        self._elements.append((x, y))
+
+    def lineTo(self, x, y):
+        self._elements.append((x, y))
+
+    def elementCount(self):
+        return len(self._elements)
+
+    def controlPointRect(self):
+        from PyQt4.QtCore import QRectF
+        if not self._elements:
+            return QRectF()
+        xs = [x for x, y in self._elements]
+        ys = [y for x, y in self._elements]
+        return QRectF(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+class QGraphicsItem(object):
+    ItemUsesExtendedStyleOption = 0x200
+
+class QPixmap(object):
+    def __init__(self, data=None):
+        self.data = data
+
+class QCursor(object):
+    def __init__(self, pixmap=None):
+        self.pixmap = pixmap
+
+class QMessageBox(object):
+    # Messages shown during the benchmark, the driver may inspect them
+    messages = []
+
+    @classmethod
+    def critical(cls, parent, title, text):
+        cls.messages.append((title, text))
+
+def _ignore(*args, **kwargs):
+    return None
+
+class _Widget(QObject):
+    """
+    Widget accepting any method call (the benchmarks never look at the widgets)
+    """
+    def __init__(self, *args, **kwargs):
+        QObject.__init__(self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _ignore
+
+class QIcon(object):
+    def __init__(self, path=None):
+        self.path = path
+
+class QKeySequence(object):
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+class QAction(_Widget):
+    pass
+
+class QWidget(_Widget):
+    pass
+
+class QDockWidget(_Widget):
+    DockWidgetMovable = 1
+    DockWidgetFloatable = 2
+
+class QGridLayout(_Widget):
+    pass
+
+class QLabel(_Widget):
+    pass
+
+class QPushButton(_Widget):
+    pass
+
+class QCheckBox(_Widget):
+    pass
+
+class QDoubleSpinBox(_Widget):
+    pass
+
+class QShortcut(_Widget):
+    pass
+
+class QFileDialog(_Widget):
+    @staticmethod
+    def getSaveFileName(*args):
+        return ""
@@ -0,0 +1,5 @@
+"""
+Lightweight stand-ins for the PyQt4 classes used by the plugin, so that the
+capture pipeline can be benchmarked without Qt. Signals are delivered
+synchronously, timers only fire when the benchmark driver fires them.
+"""
@@ -0,0 +1,4 @@
+"""
+Lightweight stand-ins for the qgis.core / qgis.gui objects used by the map
+tool, so that the capture pipeline can be benchmarked without QGIS.
+"""
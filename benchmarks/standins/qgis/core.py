@@ -0,0 +1,533 @@
+"""
+Stand-ins for qgis.core (see the package docstring). The vector layer keeps
+its features in memory and filters them by bounding box, like a provider
+without spatial index would.
+"""
+import itertools as _itertools
+import struct as _struct
+
+from PyQt4.QtCore import QObject, QDateTime, QPyNullVariant
+
+NULL = QPyNullVariant()
+
+class QGis(object):
+    Point = 0
+    Line = 1
+    Polygon = 2
+    WKBPoint = 1
+    WKBLineString = 2
+    WKBPolygon = 3
+    WKBMultiPoint = 4
+    WKBMultiLineString = 5
+    WKBMultiPolygon = 6
+
+class QgsPoint(object):
+    __slots__ = ("_x", "_y")
+
+    def __init__(self, x=0.0, y=0.0):
+        if isinstance(x, QgsPoint):
+            x, y = x.x(), x.y()
+        self._x = float(x)
+        self._y = float(y)
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def __eq__(self, other):
+        return isinstance(other, QgsPoint) and self._x == other._x and self._y == other._y
+
+    def __repr__(self):
+        return "QgsPoint(%r, %r)" % (self._x, self._y)
+
+class QgsRectangle(object):
+    def __init__(self, xmin=0.0, ymin=0.0, xmax=0.0, ymax=0.0):
+        if isinstance(xmin, QgsRectangle):
+            xmin, ymin, xmax, ymax = xmin._box
+        self._box = (xmin, ymin, xmax, ymax)
+
+    def xMinimum(self):
+        return self._box[0]
+
+    def yMinimum(self):
+        return self._box[1]
+
+    def xMaximum(self):
+        return self._box[2]
+
+    def yMaximum(self):
+        return self._box[3]
+
+    def width(self):
+        return self._box[2] - self._box[0]
+
+    def height(self):
+        return self._box[3] - self._box[1]
+
+    def __eq__(self, other):
+        return isinstance(other, QgsRectangle) and self._box == other._box
+
+    def __ne__(self, other):
+        return not self == other
+
+    def intersects(self, other):
+        a = self._box
+        b = other._box
+        return a[0] <= b[2] and a[1] <= b[3] and a[2] >= b[0] and a[3] >= b[1]
+
+def _boundingBox(points):
+    xs = [p.x() for p in points]
+    ys = [p.y() for p in points]
+    return QgsRectangle(min(xs), min(ys), max(xs), max(ys))
+
+class QgsGeometry(object):
+    def __init__(self, geometryType=None, multipart=False, data=None):
+        self._type = geometryType
+        self._multipart = multipart
+        self._data = data
+
+    @staticmethod
+    def fromPolygon(rings):
+        return QgsGeometry(QGis.Polygon, False, [list(ring) for ring in rings])
+
+    @staticmethod
+    def fromMultiPolygon(polygons):
+        return QgsGeometry(QGis.Polygon, True, [[list(ring) for ring in polygon] for polygon in polygons])
+
+    @staticmethod
+    def fromPolyline(points):
+        return QgsGeometry(QGis.Line, False, list(points))
+
+    @staticmethod
+    def fromMultiPolyline(lines):
+        return QgsGeometry(QGis.Line, True, [list(line) for line in lines])
+
+    def type(self):
+        return self._type
+
+    def isMultipart(self):
+        return self._multipart
+
+    def asPolygon(self):
+        return self._data
+
+    def asMultiPolygon(self):
+        return self._data
+
+    def asPolyline(self):
+        return self._data
+
+    def asMultiPolyline(self):
+        return self._data
+
+    def vertices(self):
+        if self._type == QGis.Polygon:
+            polygons = self._data if self._multipart else [self._data]
+            return [p for polygon in polygons for ring in polygon for p in ring]
+        lines = self._data if self._multipart else [self._data]
+        return [p for line in lines for p in line]
+
+    def boundingBox(self):
+        return _boundingBox(self.vertices())
+
+    def insertVertex(self, x, y, beforeVertex):
+        """
+        Inserts a vertex, the index counting the vertices of all parts and rings like QgsGeometry
+        """
+        if self._type == QGis.Polygon:
+            polygons = self._data if self._multipart else [self._data]
+            sequences = [ring for polygon in polygons for ring in polygon]
+        else:
+            sequences = self._data if self._multipart else [self._data]
+        for sequence in sequences:
+            if 0 < beforeVertex < len(sequence):
+                sequence.insert(beforeVertex, QgsPoint(x, y))
+                return True
+            beforeVertex -= len(sequence)
+        return False
+
+    def asWkb(self):
+        return repr((self._type, self._multipart, self._data))
+
+    def fromWkb(self, wkb):
+        """
+        Reads little endian WKB of (multi) polygons and lines
+        """
+        def points(offset):
+            count = _struct.unpack_from("<I", wkb, offset)[0]
+            values = _struct.unpack_from("<%dd" % (2 * count), wkb, offset + 4)
+            return [QgsPoint(values[i], values[i + 1]) for i in range(0, len(values), 2)], offset + 4 + 16 * count
+
+        def geometry(offset):
+            wkbType = _struct.unpack_from("<I", wkb, offset + 1)[0]
+            offset += 5
+            if wkbType in (QGis.WKBLineString, QGis.WKBPolygon):
+                if wkbType == QGis.WKBLineString:
+                    return points(offset)
+                rings = []
+                for i in range(_struct.unpack_from("<I", wkb, offset)[0]):
+                    ring, offset = points(offset + 4 if i == 0 else offset)
+                    rings.append(ring)
+                return rings, offset
+            parts = []
+            offset += 4
+            for i in range(_struct.unpack_from("<I", wkb, offset - 4)[0]):
+                part, offset = geometry(offset)
+                parts.append(part)
+            return parts, offset
+
+        wkbType = _struct.unpack_from("<I", wkb, 1)[0]
+        self._type = QGis.Line if wkbType in (QGis.WKBLineString, QGis.WKBMultiLineString) else QGis.Polygon
+        self._multipart = wkbType in (QGis.WKBMultiLineString, QGis.WKBMultiPolygon)
+        self._data = geometry(0)[0]
+
+class QgsField(object):
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+class QgsFeature(object):
+    def __init__(self, fid=0):
+        self._id = fid
+        self._geometry = None
+        self._attributes = []
+
+    def id(self):
+        return self._id
+
+    def setFeatureId(self, fid):
+        self._id = fid
+
+    def geometry(self):
+        return self._geometry
+
+    def setGeometry(self, geometry):
+        self._geometry = geometry
+
+    def attributes(self):
+        return self._attributes
+
+    def setAttributes(self, attributes):
+        self._attributes = attributes
+
+class QgsFeatureRequest(object):
+    def __init__(self, fid=None):
+        self.fid = fid
+        self.fids = None
+        self.rect = None
+
+    def setFilterRect(self, rect):
+        self.rect = rect
+        return self
+
+    def setFilterFids(self, fids):
+        self.fids = set(fids)
+        return self
+
+    def setSubsetOfAttributes(self, attributes):
+        return self
+
+class QgsCoordinateReferenceSystem(object):
+    def __init__(self, authid="EPSG:2056"):
+        self._authid = authid
+
+    def authid(self):
+        return self._authid
+
+    def geographicFlag(self):
+        return False
+
+    def toProj4(self):
+        return ""
+
+class QgsCoordinateTransform(object):
+    """
+    Transform between the Swiss LV03 (EPSG:21781) and LV95 (EPSG:2056) frames,
+    which only differ by a false origin; the other pairs are identities
+    """
+    ForwardTransform = 0
+    ReverseTransform = 1
+    # Offsets from the source to the destination, per (source, destination) authids
+    offsets = {("EPSG:21781", "EPSG:2056"): (2000000.0, 1000000.0), ("EPSG:2056", "EPSG:21781"): (-2000000.0, -1000000.0)}
+    # Number of transforms created, the benchmark driver may inspect it
+    created = 0
+
+    def __init__(self, source, destination):
+        QgsCoordinateTransform.created += 1
+        self._offset = self.offsets.get((source.authid(), destination.authid()), (0.0, 0.0))
+
+    def transform(self, point, direction=0):
+        dx, dy = self._offset
+        if direction == QgsCoordinateTransform.ReverseTransform:
+            dx, dy = -dx, -dy
+        return QgsPoint(point.x() + dx, point.y() + dy)
+
+    def transformPolygon(self, polygon, direction=0):
+        dx, dy = self._offset
+        if direction == QgsCoordinateTransform.ReverseTransform:
+            dx, dy = -dx, -dy
+        for point in polygon:
+            point.setX(point.x() + dx)
+            point.setY(point.y() + dy)
+
+    def transformBoundingBox(self, rectangle, direction=0):
+        lower = self.transform(QgsPoint(rectangle.xMinimum(), rectangle.yMinimum()), direction)
+        upper = self.transform(QgsPoint(rectangle.xMaximum(), rectangle.yMaximum()), direction)
+        return QgsRectangle(lower.x(), lower.y(), upper.x(), upper.y())
+
+class QgsDataProvider(object):
+    def __init__(self, layer):
+        self._layer = layer
+
+    def fields(self):
+        return [QgsField("id"), QgsField("name")]
+
+    def dataTimestamp(self):
+        return QDateTime(None)
+
+    def name(self):
+        return "memory"
+
+class QgsMapLayer(QObject):
+    VectorLayer = 0
+    RasterLayer = 1
+
+def _selectFeatures(features, boxes, request):
+    if request is not None and request.fid is not None:
+        feature = features.get(request.fid)
+        return iter([feature] if feature is not None else [])
+    if request is not None and request.fids is not None:
+        return iter([features[fid] for fid in request.fids if fid in features])
+    if request is not None and request.rect is not None:
+        rect = request.rect
+        return iter([features[fid] for fid, box in boxes.items() if box.intersects(rect)])
+    return iter(list(features.values()))
+
+class QgsVectorLayerFeatureSource(object):
+    """
+    Snapshot of the features of a layer, readable from any thread
+    """
+    def __init__(self, layer):
+        self._features = dict(layer._features)
+        self._boxes = dict(layer._boxes)
+
+    def getFeatures(self, request=None):
+        return _selectFeatures(self._features, self._boxes, request)
+
+class QgsVectorLayer(QgsMapLayer):
+    """
+    In-memory vector layer. Added features get negative (temporary) ids like
+    in the edit buffer of QGIS.
+    """
+    _ids = _itertools.count(1)
+
+    def __init__(self, geometryType=QGis.Polygon, wkbType=QGis.WKBPolygon, name="layer"):
+        QgsMapLayer.__init__(self)
+        self._id = "%s_%d" % (name, next(self._ids))
+        self._geometryType = geometryType
+        self._wkbType = wkbType
+        self._features = {}
+        self._boxes = {}
+        self._nextTemporaryId = -1
+        self._name = name
+        self._providerType = "memory"
+        self._source = None
+        self._provider = QgsDataProvider(self)
+        self._crs = QgsCoordinateReferenceSystem()
+
+    def id(self):
+        return self._id
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return QgsMapLayer.VectorLayer
+
+    def geometryType(self):
+        return self._geometryType
+
+    def wkbType(self):
+        return self._wkbType
+
+    def isEditable(self):
+        return True
+
+    def isModified(self):
+        return self._nextTemporaryId != -1
+
+    def source(self):
+        if self._source is None:
+            return "memory://%s" % self._id
+        return self._source
+
+    def providerType(self):
+        return self._providerType
+
+    def setDataSource(self, source, providerType):
+        """
+        Pretends the layer is stored in another datasource (used to exercise the write-behind mode)
+        """
+        self._source = source
+        self._providerType = providerType
+
+    def crs(self):
+        return self._crs
+
+    def setCrs(self, crs):
+        self._crs = crs
+
+    def dataProvider(self):
+        return self._provider
+
+    def featureCount(self):
+        return len(self._features)
+
+    def loadFeature(self, fid, geometry):
+        """
+        Adds a feature as if it was stored by the provider (used to build synthetic layers)
+        """
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        self._features[fid] = feature
+        self._boxes[fid] = geometry.boundingBox()
+
+    def getFeatures(self, request=None):
+        return _selectFeatures(self._features, self._boxes, request)
+
+    def addFeature(self, feature, alsoUpdateExtent=True):
+        fid = self._nextTemporaryId
+        self._nextTemporaryId -= 1
+        feature.setFeatureId(fid)
+        self._features[fid] = feature
+        self._boxes[fid] = feature.geometry().boundingBox()
+        self.emit("featureAdded(QgsFeatureId)", fid)
+        return True
+
+    def addFeatures(self, features, makeSelected=True):
+        for feature in features:
+            self.addFeature(feature)
+        return True
+
+    def deleteFeature(self, fid):
+        if self._features.pop(fid, None) is None:
+            return False
+        del self._boxes[fid]
+        self.emit("featureDeleted(QgsFeatureId)", fid)
+        return True
+
+    def addTopologicalPoints(self, geometry):
+        return 0
+
+    def insertVertex(self, x, y, fid, beforeVertex):
+        feature = self._features.get(fid)
+        if feature is None or not feature.geometry().insertVertex(x, y, beforeVertex):
+            return False
+        self._boxes[fid] = feature.geometry().boundingBox()
+        self.emit("geometryChanged(QgsFeatureId,QgsGeometry&)", fid, feature.geometry())
+        return True
+
+    def removePolygonIntersections(self, geometry):
+        return 0
+
+    def beginEditCommand(self, text):
+        pass
+
+    def endEditCommand(self):
+        pass
+
+    def destroyEditCommand(self):
+        pass
+
+    def triggerRepaint(self):
+        pass
+
+    def updateExtents(self):
+        pass
+
+class QgsProject(QObject):
+    _instance = None
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.entries = {}
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = QgsProject()
+        return cls._instance
+
+    def readEntry(self, scope, key, default=""):
+        value = self.entries.get((scope, key))
+        return (default, False) if value is None else (value, True)
+
+    def readListEntry(self, scope, key):
+        value = self.entries.get((scope, key))
+        return ([], False) if value is None else (value, True)
+
+    def readDoubleEntry(self, scope, key, default=0.0):
+        value = self.entries.get((scope, key))
+        return (default, False) if value is None else (float(value), True)
+
+    def readNumEntry(self, scope, key, default=0):
+        value = self.entries.get((scope, key))
+        return (default, False) if value is None else (int(value), True)
+
+class QgsMapLayerRegistry(QObject):
+    _instance = None
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.layers = {}
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = QgsMapLayerRegistry()
+        return cls._instance
+
+    def mapLayer(self, layerId):
+        return self.layers.get(layerId)
+
+    def addMapLayer(self, layer):
+        self.layers[layer.id()] = layer
+        return layer
+
+    def removeMapLayer(self, layerId):
+        self.emit("layerWillBeRemoved(QString)", layerId)
+        self.layers.pop(layerId, None)
+
+class QgsTolerance(object):
+    LayerUnits = 0
+    Pixels = 1
+
+    @staticmethod
+    def UnitType(unit):
+        return unit
+
+    @staticmethod
+    def toleranceInMapUnits(tolerance, layer, renderer, unit=0):
+        if unit == QgsTolerance.Pixels:
+            return tolerance * renderer.mapUnitsPerPixel()
+        return tolerance
+
+class QgsApplication(object):
+    @staticmethod
+    def qgisSettingsDirPath():
+        import tempfile
+        return tempfile.gettempdir()
+
+class QgsMessageLog(object):
+    INFO = 0
+    WARNING = 1
+    CRITICAL = 2
+    messages = []
+
+    @classmethod
+    def logMessage(cls, message, tag="", level=0):
+        cls.messages.append((tag, message))
@@ -0,0 +1,206 @@
+"""
+Stand-ins for qgis.gui (see the package docstring). The layers are
+reprojected to the canvas CRS with the QgsCoordinateTransform stand-in.
+"""
+from PyQt4.QtCore import QObject, QPoint
+from PyQt4.QtGui import QColor
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsPoint, QgsRectangle
+
+class QgsMapRenderer(object):
+    def __init__(self, canvas):
+        self._canvas = canvas
+
+    def mapUnitsPerPixel(self):
+        return self._canvas.mapUnitsPerPixel()
+
+    def destinationCrs(self):
+        return self._canvas._crs
+
+    def hasCrsTransformEnabled(self):
+        return True
+
+    def mapToLayerCoordinates(self, layer, item):
+        transform = QgsCoordinateTransform(layer.crs(), self._canvas._crs)
+        if isinstance(item, QgsRectangle):
+            return transform.transformBoundingBox(item, QgsCoordinateTransform.ReverseTransform)
+        return transform.transform(item, QgsCoordinateTransform.ReverseTransform)
+
+    def layerToMapCoordinates(self, layer, item):
+        transform = QgsCoordinateTransform(layer.crs(), self._canvas._crs)
+        if isinstance(item, QgsRectangle):
+            return transform.transformBoundingBox(item)
+        return transform.transform(item)
+
+class QgsMapCanvasScene(object):
+    def __init__(self):
+        self.items = []
+
+    def addItem(self, item):
+        self.items.append(item)
+
+    def removeItem(self, item):
+        if item in self.items:
+            self.items.remove(item)
+
+class QgsMapCanvas(QObject):
+    def __init__(self, extent, width=1000):
+        QObject.__init__(self)
+        self._extent = extent
+        self._width = width
+        self._layers = []
+        self._currentLayer = None
+        self._mapTool = None
+        self._crs = QgsCoordinateReferenceSystem()
+        self._scene = QgsMapCanvasScene()
+        self._renderer = QgsMapRenderer(self)
+        self.refreshCount = 0
+
+    def extent(self):
+        return self._extent
+
+    def setExtent(self, extent):
+        self._extent = extent
+
+    def mapUnitsPerPixel(self):
+        return self._extent.width() / self._width
+
+    def mapRenderer(self):
+        return self._renderer
+
+    def setDestinationCrs(self, crs):
+        self._crs = crs
+        self.emit("destinationCrsChanged()")
+
+    def layers(self):
+        return self._layers
+
+    def setLayers(self, layers):
+        self._layers = layers
+
+    def currentLayer(self):
+        return self._currentLayer
+
+    def setCurrentLayer(self, layer):
+        self._currentLayer = layer
+
+    def scene(self):
+        return self._scene
+
+    def refresh(self):
+        self.refreshCount += 1
+
+    def setCursor(self, cursor):
+        pass
+
+    def mapTool(self):
+        return self._mapTool
+
+    def setMapTool(self, tool):
+        if self._mapTool is not None:
+            self._mapTool.deactivate()
+        self._mapTool = tool
+        tool.activate()
+
+    def toMapCoordinates(self, pos):
+        upp = self.mapUnitsPerPixel()
+        return QgsPoint(self._extent.xMinimum() + pos.x() * upp, self._extent.yMaximum() - pos.y() * upp)
+
+    def toCanvasCoordinates(self, point):
+        upp = self.mapUnitsPerPixel()
+        return QPoint((point.x() - self._extent.xMinimum()) / upp, (self._extent.yMaximum() - point.y()) / upp)
+
+class QgsMapTool(QObject):
+    def __init__(self, canvas):
+        QObject.__init__(self)
+        self._canvas = canvas
+
+    def toMapCoordinates(self, *args):
+        if len(args) == 2:
+            # (layer, point) -> point in map coordinates
+            return self._canvas.mapRenderer().layerToMapCoordinates(args[0], args[1])
+        return self._canvas.toMapCoordinates(args[0])
+
+    def toLayerCoordinates(self, layer, point):
+        return self._canvas.mapRenderer().mapToLayerCoordinates(layer, point)
+
+    def toCanvasCoordinates(self, point):
+        return self._canvas.toCanvasCoordinates(point)
+
+    def activate(self):
+        pass
+
+    def deactivate(self):
+        pass
+
+class QgsMessageBar(QObject):
+    INFO = 0
+    WARNING = 1
+    CRITICAL = 2
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.messages = []
+
+    def pushMessage(self, title, text, level=0, duration=0):
+        self.messages.append((title, text, level))
+
+class QgsRubberBand(object):
+    def __init__(self, canvas, geometryType=None):
+        self._points = []
+
+    def addPoint(self, point, doUpdate=True):
+        # Like QGIS, the first point is added twice: the last point is the one that moves
+        if not self._points:
+            self._points.append(QgsPoint(point))
+        self._points.append(QgsPoint(point))
+
+    def movePoint(self, point):
+        if self._points:
+            self._points[-1] = QgsPoint(point)
+
+    def removePoint(self, index=0, doUpdate=True, geometryIndex=0):
+        # Negative indexes count from the last point
+        del self._points[index]
+
+    def getPoint(self, index, vertexIndex):
+        return self._points[vertexIndex]
+
+    def numberOfVertices(self):
+        return len(self._points)
+
+    def reset(self, geometryType=None):
+        self._points = []
+
+    def addGeometry(self, geometry, layer=None):
+        self._points.extend(geometry.vertices())
+
+    def setColor(self, color):
+        pass
+
+    def setWidth(self, width):
+        pass
+
+class QgsMapCanvasItem(object):
+    def __init__(self, canvas):
+        canvas.scene().addItem(self)
+        self._canvas = canvas
+        self._rect = None
+
+    def setRect(self, rect):
+        self._rect = rect
+
+    def pos(self):
+        return QPoint(0, 0)
+
+    def toCanvasCoordinates(self, point):
+        return self._canvas.toCanvasCoordinates(point)
+
+    def setFlag(self, flag, enabled=True):
+        pass
+
+    def update(self, rect=None):
+        pass
+
+class QgsVertexMarker(QgsMapCanvasItem):
+    def setCenter(self, point):
+        self._center = point